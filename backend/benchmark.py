@@ -0,0 +1,659 @@
+"""
+Micro-benchmarks for the SEFS backend. Each subcommand builds its own
+synthetic data in a temp folder and prints a small results table.
+
+    python benchmark.py extract      # PDF extraction: full first 10 pages vs budgeted / sampled
+    python benchmark.py embed        # embedding backends: docs/sec + cosine agreement with torch
+    python benchmark.py imports      # server import time; fails if over --max-ms or heavy modules load
+    python benchmark.py txt          # .txt decoding: full read + chardet vs bounded prefix + UTF-8 fast path
+    python benchmark.py kselect      # recluster k selection: exact KMeans + silhouette sweep vs fast engine
+    python benchmark.py keywords     # CATEGORY_MAP scoring: one regex per keyword vs single-pass matcher
+    python benchmark.py naming       # LLM cluster naming against a local fake server: per cluster vs batched
+    python benchmark.py tfidf        # cluster naming by TF-IDF: a vectorizer fit per cluster vs corpus-wide term index
+    python benchmark.py stream       # clustering 10k-1M vectors: in-RAM KMeans vs streaming over a memmap (time, peak RSS)
+    python benchmark.py clusters     # cluster engines on topics + outliers: fixed-grid KMeans vs adaptive k vs density
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+
+def _timeit(fn, repeat: int = 3) -> float:
+    """Best-of-N wall time in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _print_table(headers: list, rows: list):
+    widths = [max([len(str(h))] + [len(str(r[i])) for r in rows]) for i, h in enumerate(headers)]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for r in rows:
+        print("  ".join(str(c).ljust(w) for c, w in zip(r, widths)))
+
+
+# ─── extract ─────────────────────────────────────────────────────
+def _legacy_extract_pdf(file_path: str) -> str:
+    """The pre-budget extractor: always the full text of the first 10 pages."""
+    import fitz
+    doc = fitz.open(file_path)
+    text_parts = [doc[i].get_text() for i in range(min(doc.page_count, 10))]
+    doc.close()
+    lines = [line.strip() for line in "\n".join(text_parts).split('\n') if line.strip()]
+    return " ".join(lines)
+
+
+def _make_pdf(path: str, pages: int, lines_per_page: int):
+    import fitz
+    doc = fitz.open()
+    sentence = "Quarterly revenue grew while operating expenses were held flat across all regions. "
+    for p in range(pages):
+        page = doc.new_page()
+        body = "\n".join(f"{p}.{i} {sentence}" for i in range(lines_per_page))
+        page.insert_textbox(fitz.Rect(20, 20, 590, 830), body, fontsize=5)
+    doc.save(path)
+    doc.close()
+
+
+def bench_extract(args):
+    from extractor import _extract_pdf
+    from embedder import TEXT_BUDGET
+
+    tmp = tempfile.mkdtemp(prefix="sefs_bench_")
+    try:
+        cases = [("sparse (10 pages, 10 lines)", 10, 10),
+                 ("dense (40 pages, 90 lines)", 40, 90),
+                 ("long (300 pages, 90 lines)", 300, 90)]
+        rows = []
+        for label, pages, lines in cases:
+            path = os.path.join(tmp, f"{pages}_{lines}.pdf")
+            _make_pdf(path, pages, lines)
+
+            legacy = _timeit(lambda: _legacy_extract_pdf(path), args.repeat)
+            budgeted = _timeit(lambda: _extract_pdf(path, TEXT_BUDGET, sample=False), args.repeat)
+            sampled = _timeit(lambda: _extract_pdf(path, TEXT_BUDGET, sample=True), args.repeat)
+            assert _extract_pdf(path, None, sample=False)[0] == _legacy_extract_pdf(path)
+
+            rows.append([label,
+                         f"{len(_legacy_extract_pdf(path)):,}",
+                         f"{len(_extract_pdf(path, TEXT_BUDGET, sample=False)[0]):,}",
+                         f"{legacy * 1000:.1f}",
+                         f"{budgeted * 1000:.1f}",
+                         f"{sampled * 1000:.1f}",
+                         f"{legacy / budgeted:.1f}x"])
+
+        print(f"Character budget: {TEXT_BUDGET:,}  (best of {args.repeat})\n")
+        _print_table(["pdf", "legacy chars", "budget chars", "legacy ms", "budget ms", "sampled ms", "speedup"], rows)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ─── embed ───────────────────────────────────────────────────────
+_TOPICS = [
+    "Quarterly revenue grew while operating expenses and the tax provision were held flat.",
+    "The patient presented with acute chest pain and was prescribed a beta blocker.",
+    "Gradient descent updates the neural network weights to minimize the training loss.",
+    "The tenant shall pay rent on the first day of each month under this lease agreement.",
+    "Mitosis separates replicated chromosomes into two genetically identical nuclei.",
+    "The sprint retrospective covered deployment failures in the CI/CD pipeline.",
+    "Simmer the tomatoes with garlic and basil, then season the sauce to taste.",
+    "The central bank raised interest rates to curb persistent inflation.",
+]
+
+
+def _synthetic_docs(n: int, seed: int = 0) -> list[str]:
+    """Documents of mixed length (one sentence to ~8k chars) drawn from a few topics."""
+    import random
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(n):
+        topic = rng.choice(_TOPICS)
+        other = rng.choice(_TOPICS)
+        n_sent = rng.choice([1, 3, 10, 40, 100])
+        docs.append(" ".join(topic if rng.random() < 0.8 else other for _ in range(n_sent)))
+    return docs
+
+
+def bench_embed(args):
+    import numpy as np
+    import embedder
+
+    docs = _synthetic_docs(args.docs)
+    n_chunks = sum(len(embedder._document_chunks(d)) for d in docs)
+    print(f"{len(docs)} documents, {n_chunks} chunks\n")
+
+    factories = {
+        "torch": embedder.SentenceTransformerBackend,
+        "onnx": lambda: embedder.OnnxBackend(quantize=True),
+        "onnx-fp32": lambda: embedder.OnnxBackend(quantize=False),
+    }
+    results = {}
+    rows = []
+    for kind in args.backends.split(","):
+        try:
+            backend = factories[kind]()
+        except ImportError as e:
+            print(f"skipping {kind}: {e}")
+            continue
+        embedder.embed_many(docs[:4], backend=backend)  # warm-up
+        elapsed = _timeit(lambda: results.__setitem__(backend.name, embedder.embed_many(docs, backend=backend)),
+                          args.repeat)
+        rows.append([backend.name, f"{len(docs) / elapsed:.1f}", f"{n_chunks / elapsed:.1f}"])
+
+    reference = results.get("torch")
+    for row in rows:
+        vectors = results[row[0]]
+        if reference is None or row[0] == "torch":
+            row += ["-", "-"]
+            continue
+        cos = np.sum(vectors * reference, axis=1)
+        row += [f"{cos.mean():.4f}", f"{cos.min():.4f}"]
+
+    _print_table(["backend", "docs/sec", "chunks/sec", "mean cos vs torch", "min cos vs torch"], rows)
+
+
+# ─── txt ─────────────────────────────────────────────────────────
+def _legacy_extract_txt(file_path: str) -> str:
+    """The pre-fast-path decoder: read everything, run chardet over all of it."""
+    import chardet
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    encoding = chardet.detect(raw).get('encoding', 'utf-8') or 'utf-8'
+    return raw.decode(encoding, errors='replace')
+
+
+def bench_txt(args):
+    import chardet  # noqa: F401 — import cost shouldn't count against either side
+    from extractor import _extract_txt
+    from embedder import TEXT_BUDGET
+
+    line_en = "2024-05-01 12:00:03 INFO request handled in 12ms for user account 4411\n"
+    line_fr = "Le café servait une crème brûlée à des clients naïfs, déçus mais polis.\n"
+    line_ja = "会議の議事録：来期の予算と採用計画について議論した。\n"
+    cases = [
+        ("small utf-8 note (4 KB)", line_en * 55, "utf-8"),
+        ("utf-8 log (2 MB)", line_en * 29_000, "utf-8"),
+        ("utf-8 log (16 MB)", line_en * 232_000, "utf-8"),
+        ("utf-8 japanese (2 MB)", line_ja * 26_000, "utf-8"),
+        ("latin-1 export (2 MB)", line_fr * 28_000, "latin-1"),
+        ("utf-16 export (2 MB)", line_fr * 14_000, "utf-16"),
+    ]
+
+    tmp = tempfile.mkdtemp(prefix="sefs_bench_")
+    try:
+        rows = []
+        for label, text, encoding in cases:
+            path = os.path.join(tmp, f"{len(rows)}.txt")
+            with open(path, "wb") as f:
+                f.write(text.encode(encoding))
+
+            legacy = _timeit(lambda: _legacy_extract_txt(path), args.repeat)
+            fast = _timeit(lambda: _extract_txt(path, TEXT_BUDGET), args.repeat)
+            same = _extract_txt(path, TEXT_BUDGET)[0] == _legacy_extract_txt(path)[:TEXT_BUDGET]
+            rows.append([label, encoding, f"{legacy * 1000:.1f}", f"{fast * 1000:.2f}",
+                         f"{legacy / fast:.0f}x", "yes" if same else "no"])
+
+        print(f"Character budget: {TEXT_BUDGET:,}  (best of {args.repeat})\n")
+        _print_table(["file", "encoding", "legacy ms", "fast ms", "speedup", "same prefix"], rows)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ─── kselect ────────────────────────────────────────────────────
+def _synthetic_embeddings(n: int, k: int = 5, dim: int = 384, seed: int = 0):
+    """Unit vectors around k random topic directions (roughly what MiniLM gives for k topics)."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(k, dim))
+    X = topics[rng.integers(k, size=n)] + rng.normal(scale=1.2, size=(n, dim))
+    return (X / np.linalg.norm(X, axis=1, keepdims=True)).astype(np.float32)
+
+
+def bench_kselect(args):
+    import numpy as np
+    from sklearn.metrics import adjusted_rand_score
+    import clusterer
+
+    rows = []
+    for n in [int(x) for x in args.sizes.split(",")]:
+        X = _synthetic_embeddings(n, k=args.topics)
+        # Same corpus after a few edits/arrivals, for the warm-started rerun
+        X2 = np.vstack([X, _synthetic_embeddings(max(1, n // 50), k=args.topics, seed=1)])
+
+        legacy_ms, legacy_k, legacy_labels = "-", "-", None
+        if n <= args.exact_max:
+            clusterer.KSELECT_ENGINE = "exact"
+            t0 = time.perf_counter()
+            legacy_labels, _ = clusterer.cluster_embeddings(X)
+            legacy_ms = f"{(time.perf_counter() - t0) * 1000:.0f}"
+            legacy_k = len(set(legacy_labels))
+
+        clusterer.KSELECT_ENGINE = "fast"
+        clusterer._warm_centroids.clear()
+        t0 = time.perf_counter()
+        labels, _ = clusterer.cluster_embeddings(X)
+        cold = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        clusterer.cluster_embeddings(X2)
+        warm = time.perf_counter() - t0
+
+        agree = f"{adjusted_rand_score(legacy_labels, labels):.3f}" if legacy_labels is not None else "-"
+        rows.append([f"{n:,}", legacy_ms, f"{cold * 1000:.0f}", f"{warm * 1000:.0f}",
+                     legacy_k, len(set(labels)), agree])
+
+    print(f"{args.topics} synthetic topics, k searched over 2..8; exact engine skipped above {args.exact_max:,}\n")
+    _print_table(["files", "exact ms", "fast ms (cold)", "fast ms (warm)", "exact k", "fast k", "ARI vs exact"], rows)
+
+
+# ─── keywords ────────────────────────────────────────────────────
+def _legacy_category_scores(text: str, category_map: dict):
+    """The pre-matcher scoring: one \\b...\\b regex findall per keyword per category."""
+    import re
+    scores, counts = [], []
+    for keywords in category_map.values():
+        score = 0
+        match_count = 0
+        for kw in keywords:
+            hits = len(re.findall(r'\b' + re.escape(kw.lower()) + r'\b', text))
+            if hits > 0:
+                match_count += 1
+                score += hits
+        scores.append(score)
+        counts.append(match_count)
+    return scores, counts
+
+
+def bench_keywords(args):
+    import random
+    from clusterer import CATEGORY_MAP, get_category_matcher
+
+    t0 = time.perf_counter()
+    matcher = get_category_matcher()
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    rng = random.Random(0)
+    vocab = [kw for words in CATEGORY_MAP.values() for kw in words]
+    docs = [d.lower() for d in _synthetic_docs(args.docs)]
+    # Keyword-dense documents too, so most categories actually score
+    docs += [" ".join(rng.choice(vocab) if rng.random() < 0.3 else "the" for _ in range(rng.choice([50, 500, 1500])))
+             for _ in range(args.docs // 2)]
+
+    for doc in docs:
+        scores, counts = matcher.category_scores(matcher.count(doc))
+        assert (list(scores), list(counts)) == _legacy_category_scores(doc, CATEGORY_MAP), doc[:80]
+
+    legacy = _timeit(lambda: [_legacy_category_scores(d, CATEGORY_MAP) for d in docs], args.repeat)
+    fast = _timeit(lambda: [matcher.category_scores(matcher.count(d)) for d in docs], args.repeat)
+    chars = sum(len(d) for d in docs)
+
+    print(f"{len(docs)} documents, {chars:,} chars, {len(CATEGORY_MAP)} categories, "
+          f"{len(matcher.keywords)} distinct keywords; matcher built in {build_ms:.0f} ms\n")
+    _print_table(["scorer", "total ms", "ms/doc", "identical scores"],
+                 [["regex per keyword", f"{legacy * 1000:.0f}", f"{legacy * 1000 / len(docs):.2f}", "-"],
+                  ["single pass", f"{fast * 1000:.0f}", f"{fast * 1000 / len(docs):.2f}", "yes"]])
+
+
+# ─── naming ──────────────────────────────────────────────────────
+def _fake_chat_server(latency: float):
+    """
+    A local chat-completions endpoint (Groq/OpenAI wire format). It answers
+    after `latency` seconds, naming every "Group N" in the prompt, or with a
+    single name for one-cluster prompts. Returns (server, stats).
+    """
+    import json
+    import re
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    stats = {"requests": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            prompt = body["messages"][-1]["content"]
+            with lock:
+                stats["requests"] += 1
+            time.sleep(latency)
+            groups = re.findall(r"^Group (\d+)$", prompt, re.M)
+            content = json.dumps({g: f"Topic {g}" for g in groups}) if groups else "Topic Name"
+            data = json.dumps({
+                "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def _legacy_name_per_cluster(client, cluster_data, model):
+    """The pre-batching naming loop: one blocking request per cluster."""
+    names = {}
+    for cluster_id, data in cluster_data.items():
+        prompt = (f"Based on these file excerpts and names, suggest a brief category name (2-4 words):\n\n"
+                  f"Files: {', '.join(data['file_names'][:5])}\n\nContent samples:\n"
+                  + "\n".join(f"- {t[:150]}" for t in data["texts"][:3]) + "\n\nCategory name:")
+        response = client.chat.completions.create(model=model, messages=[{"role": "user", "content": prompt}],
+                                                  max_tokens=30, temperature=0.3, timeout=5)
+        names[cluster_id] = response.choices[0].message.content.strip()
+    return names
+
+
+def bench_naming(args):
+    import uuid
+    os.environ["SEFS_CACHE_DIR"] = tempfile.mkdtemp(prefix="sefs_bench_")
+    import clusterer
+
+    server, stats = _fake_chat_server(args.latency)
+    clusterer.GROQ_API_KEY = "fake"
+    clusterer.GROQ_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    clusterer._groq_client = None
+    client = clusterer._get_groq_client()
+
+    rows = []
+    for n in [int(x) for x in args.clusters.split(",")]:
+        docs = _synthetic_docs(4 * n)
+        data = {cid: {"texts": docs[4 * cid:4 * cid + 4],
+                      "file_names": [f"doc_{cid}_{j}.txt" for j in range(4)],
+                      "content_hashes": [uuid.uuid4().hex for _ in range(4)]}
+                for cid in range(n)}
+
+        stats["requests"] = 0
+        t0 = time.perf_counter()
+        _legacy_name_per_cluster(client, data, clusterer.GROQ_MODEL)
+        legacy_s, legacy_requests = time.perf_counter() - t0, stats["requests"]
+
+        stats["requests"] = 0
+        t0 = time.perf_counter()
+        provisional, pending = clusterer.name_clusters_provisional(data)
+        locked_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        final = clusterer.name_clusters_llm({cid: data[cid] for cid in pending}, provisional)
+        background_s, requests = time.perf_counter() - t0, stats["requests"]
+        named = sum(1 for cid in pending if final[cid].startswith("Topic"))
+
+        # Restart: same clusters, names come from the on-disk cache
+        stats["requests"] = 0
+        clusterer._name_cache = clusterer.NameCache(os.environ["SEFS_CACHE_DIR"])
+        _, pending_again = clusterer.name_clusters_provisional(data)
+
+        rows.append([n, f"{legacy_s:.2f}", legacy_requests, f"{locked_s:.2f}", f"{background_s:.2f}",
+                     requests, f"{named}/{len(pending)}", len(pending_again) + stats["requests"]])
+
+    server.shutdown()
+    print(f"fake server latency {args.latency * 1000:.0f} ms per request; "
+          f"batch {clusterer.NAMING_BATCH_SIZE} clusters, {clusterer.NAMING_CONCURRENCY} in flight\n")
+    _print_table(["clusters", "per-cluster s (under lock)", "requests", "provisional s (under lock)",
+                  "batched LLM s (background)", "requests", "LLM-named", "calls on restart"], rows)
+
+
+# ─── stream ──────────────────────────────────────────────────────
+def _write_synthetic_memmap(path: str, n: int, k: int, dim: int = 384, block_rows: int = 100_000):
+    """Like _synthetic_embeddings, written block by block to a float32 file. Returns the true topic per row."""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    topics = rng.normal(size=(k, dim))
+    out = np.memmap(path, dtype=np.float32, mode="w+", shape=(n, dim))
+    truth = np.empty(n, dtype=np.int32)
+    for start in range(0, n, block_rows):
+        m = min(block_rows, n - start)
+        t = rng.integers(k, size=m)
+        X = topics[t] + rng.normal(scale=1.2, size=(m, dim))
+        out[start:start + m] = X / np.linalg.norm(X, axis=1, keepdims=True)
+        truth[start:start + m] = t
+    out.flush()
+    del out
+    return truth
+
+
+def _peak_rss_mb() -> float:
+    """This process's peak RSS. VmHWM, since ru_maxrss carries over the parent's peak across fork + exec."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _stream_run(path: str, n: int, mode: str, labels_path: str):
+    """One measurement in a fresh process (so peak RSS is its own): prints 'seconds peak_mb base_mb'."""
+    import mmap
+    import numpy as np
+    import sklearn.cluster  # noqa: F401 — counted in the baseline, not the run
+    import sklearn.decomposition  # noqa: F401
+    import clusterer
+    from layout import LayoutEngine
+
+    base = _peak_rss_mb()
+    t0 = time.perf_counter()
+    if mode == "batch":
+        X = np.fromfile(path, dtype=np.float32).reshape(n, -1)
+        labels, _ = clusterer.cluster_embeddings(X)
+        LayoutEngine().place(list(range(n)), X, [None] * n)
+    else:
+        matrix = np.memmap(path, dtype=np.float32, mode="r", shape=(n, os.path.getsize(path) // (4 * n)))
+        release = lambda: matrix._mmap.madvise(mmap.MADV_DONTNEED)  # noqa: E731 — what EmbeddingStore.release_pages does
+        labels, _ = clusterer.cluster_embeddings_streaming(matrix, release=release)
+        LayoutEngine().place(list(range(n)), matrix, [None] * n, sample=clusterer.STREAM_SAMPLE, release=release)
+    elapsed = time.perf_counter() - t0
+    np.save(labels_path, np.asarray(labels, dtype=np.int32))
+    print(elapsed, _peak_rss_mb(), base)
+
+
+def bench_stream(args):
+    import subprocess
+    import numpy as np
+    from sklearn.metrics import adjusted_rand_score
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    tmp = tempfile.mkdtemp(prefix="sefs_bench_")
+    rows = []
+    try:
+        for n in [int(x) for x in args.stream_sizes.split(",")]:
+            path = os.path.join(tmp, f"vectors_{n}.f32")
+            truth = _write_synthetic_memmap(path, n, args.topics)
+            for mode in ("batch", "stream"):
+                if mode == "batch" and n > args.batch_max:
+                    rows.append([f"{n:,}", mode, "-", "-", "-", "-"])
+                    continue
+                labels_path = os.path.join(tmp, f"labels_{n}_{mode}.npy")
+                probe = f"import benchmark; benchmark._stream_run({path!r}, {n}, {mode!r}, {labels_path!r})"
+                out = subprocess.run([sys.executable, "-c", probe], cwd=backend_dir,
+                                     env=dict(os.environ, SEFS_CACHE_DIR=tmp),
+                                     capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1]
+                elapsed, peak, base = (float(x) for x in out.split())
+                labels = np.load(labels_path)
+                rows.append([f"{n:,}", mode, f"{elapsed:.1f}", f"{peak:.0f}", f"{peak - base:.0f}",
+                             f"{adjusted_rand_score(truth, labels):.3f}"])
+            os.remove(path)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"{args.topics} synthetic topics, 384-dim float32, clustering + first 3D layout;")
+    print("batch = cluster_embeddings + layout on the whole matrix in RAM (its UMAP refit copies it again),")
+    print(f"stream = cluster_embeddings_streaming + sampled layout over a memory-mapped file (batch skipped above {args.batch_max:,})\n")
+    _print_table(["vectors", "mode", "seconds", "peak RSS MB", "over baseline MB", "ARI vs truth"], rows)
+
+
+# ─── tfidf ───────────────────────────────────────────────────────
+def bench_tfidf(args):
+    import hashlib
+    import clusterer
+
+    docs = _synthetic_docs(args.docs)
+    keys = [hashlib.blake2b(d.encode("utf-8") + str(i).encode(), digest_size=16).hexdigest() for i, d in enumerate(docs)]
+
+    # Paid once per file at ingest, not per recluster
+    clusterer.term_index.clear()
+    t0 = time.perf_counter()
+    for i, (key, doc) in enumerate(zip(keys, docs)):
+        clusterer.term_index.add(f"doc{i}.txt", key, doc)
+    index_ms = (time.perf_counter() - t0) * 1000
+
+    rows = []
+    for k in [int(x) for x in args.clusters.split(",")]:
+        data = {c: {"texts": docs[c::k], "file_names": [f"doc{i}.txt" for i in range(c, len(docs), k)],
+                    "content_hashes": keys[c::k]} for c in range(k)}
+        legacy = _timeit(lambda: {c: clusterer._name_single_cluster_tfidf(d["texts"], d["file_names"])
+                                  for c, d in data.items()}, args.repeat)
+        fast = _timeit(lambda: clusterer._name_clusters_tfidf(data), args.repeat)
+        rows.append([k, f"{legacy * 1000:.0f}", f"{fast * 1000:.1f}", f"{legacy / fast:.0f}x"])
+
+    print(f"{len(docs)} documents; term index built in {index_ms:.0f} ms ({index_ms / len(docs):.2f} ms/doc, at ingest)\n")
+    _print_table(["clusters", "fit per cluster ms", "term index ms", "speedup"], rows)
+
+
+# ─── clusters ────────────────────────────────────────────────────
+def bench_clusters(args):
+    import numpy as np
+    from sklearn.metrics import adjusted_rand_score
+    import clusterer
+    from embedding_store import EmbeddingStore
+    from vector_index import VectorIndex
+
+    rows = []
+    for corpus in args.corpora.split(","):
+        n, k = (int(x) for x in corpus.split(":"))
+        n_out = int(n * args.outliers)
+        # As _synthetic_embeddings, keeping each file's topic; outliers are random directions
+        rng = np.random.default_rng(0)
+        topics = rng.normal(size=(k, 384))
+        truth = np.concatenate([rng.integers(k, size=n - n_out), np.full(n_out, -1)])
+        X = np.where(truth[:, None] >= 0, topics[truth], 0.0) + rng.normal(scale=1.2, size=(n, 384))
+        X = (X / np.linalg.norm(X, axis=1, keepdims=True)).astype(np.float32)
+
+        store = EmbeddingStore(dim=384)
+        for i, v in enumerate(X):
+            store.set(f"f{i}", v)
+        index = VectorIndex(store)
+
+        for engine in ("kmeans", "adaptive", "density"):
+            clusterer.CLUSTER_ENGINE = engine
+            clusterer._warm_centroids.clear()
+            t0 = time.perf_counter()
+            if engine == "density":
+                _, neighbors, sims = index.knn_graph(clusterer.DENSITY_NEIGHBORS)
+                labels = clusterer.density_clusters(neighbors, sims)
+            else:
+                labels, _ = clusterer.cluster_embeddings(X)
+            seconds = time.perf_counter() - t0
+
+            # Quality on the topic files the engine assigned; outliers scored separately
+            scored = (truth >= 0) & (labels >= 0)
+            caught = (labels[truth < 0] < 0).mean() if n_out else 0.0
+            rows.append([f"{n:,}", k, engine, f"{seconds:.2f}", len(set(labels[labels >= 0].tolist())),
+                         f"{(labels[truth >= 0] < 0).mean():.1%}", f"{caught:.0%}",
+                         f"{adjusted_rand_score(truth[scored], labels[scored]):.3f}"])
+
+    print(f"{args.outliers:.0%} outliers per corpus; density uses a {clusterer.DENSITY_NEIGHBORS}-NN graph "
+          f"(exact below {index.ann_min_files:,} files, HNSW above)\n")
+    _print_table(["files", "topics", "engine", "seconds", "clusters", "topic files unassigned",
+                  "outliers unassigned", "ARI vs truth"], rows)
+
+
+# ─── imports ─────────────────────────────────────────────────────
+# Must stay out of `import main` — they load in the background warm-up instead
+_HEAVY_MODULES = ["sklearn", "umap", "fitz", "chardet", "torch", "sentence_transformers", "onnxruntime"]
+
+
+def bench_imports(args):
+    import subprocess
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    probe = (
+        "import sys, time; t0 = time.perf_counter(); import main; "
+        "elapsed = time.perf_counter() - t0; "
+        f"heavy = [m for m in {_HEAVY_MODULES!r} if m in sys.modules]; "
+        "print(elapsed, ','.join(heavy))"
+    )
+    env = dict(os.environ, SEFS_CACHE_DIR=tempfile.mkdtemp(prefix="sefs_bench_"))
+
+    times = []
+    heavy = ""
+    for _ in range(args.repeat):
+        out = subprocess.run([sys.executable, "-c", probe], cwd=backend_dir, env=env,
+                             capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1]
+        elapsed, _, heavy = out.partition(" ")
+        times.append(float(elapsed) * 1000)
+
+    # Breakdown of what main imports directly, from one -X importtime run
+    trace = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=backend_dir,
+                           env=env, capture_output=True, text=True).stderr
+    modules = []
+    for line in trace.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1 and cumulative.strip().isdigit():
+            modules.append((int(cumulative) / 1000, name.strip()))
+    modules.sort(reverse=True)
+
+    print(f"import main: best {min(times):.0f} ms, worst {max(times):.0f} ms (limit {args.max_ms} ms)\n")
+    _print_table(["imported by main", "cumulative ms"], [[n, f"{ms:.1f}"] for ms, n in modules[:10]])
+
+    failed = False
+    if heavy:
+        print(f"\nFAIL: heavy modules imported eagerly: {heavy}")
+        failed = True
+    if min(times) > args.max_ms:
+        print(f"\nFAIL: import main took {min(times):.0f} ms > {args.max_ms} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+COMMANDS = {
+    "extract": bench_extract,
+    "embed": bench_embed,
+    "imports": bench_imports,
+    "txt": bench_txt,
+    "kselect": bench_kselect,
+    "keywords": bench_keywords,
+    "naming": bench_naming,
+    "stream": bench_stream,
+    "tfidf": bench_tfidf,
+    "clusters": bench_clusters,
+}
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per measurement (best is reported)")
+    parser.add_argument("--docs", type=int, default=500, help="synthetic documents (embed, keywords, tfidf)")
+    parser.add_argument("--backends", default="torch,onnx-fp32,onnx",
+                        help="comma-separated backends: torch, onnx (int8), onnx-fp32 (embed)")
+    parser.add_argument("--max-ms", type=float, default=2000, help="import-time budget in ms (imports)")
+    parser.add_argument("--sizes", default="500,2000,5000,20000", help="comma-separated corpus sizes (kselect)")
+    parser.add_argument("--topics", type=int, default=5, help="synthetic topics (kselect)")
+    parser.add_argument("--exact-max", type=int, default=5000, help="largest size to run the exact engine on (kselect)")
+    parser.add_argument("--clusters", default="8,32,100", help="comma-separated cluster counts (naming, tfidf)")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake LLM seconds per request (naming)")
+    parser.add_argument("--stream-sizes", default="10000,100000,1000000", help="comma-separated vector counts (stream)")
+    parser.add_argument("--corpora", default="2000:5,20000:24",
+                        help="comma-separated files:topics synthetic corpora (clusters)")
+    parser.add_argument("--outliers", type=float, default=0.05, help="fraction of off-topic files (clusters)")
+    parser.add_argument("--batch-max", type=int, default=100000, help="largest size to cluster in RAM (stream)")
+    args = parser.parse_args()
+    COMMANDS[args.command](args)
@@ -1,26 +1,38 @@
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.decomposition import PCA
 import os
 import re
+import json
 import time
+import hashlib
 import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 
+from keywords import KeywordMatcher
+from doc_cache import NameCache, CACHE_DIR
+from terms import TermIndex
+
 # Load .env file from project root
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 
 # Groq API setup
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None  # any chat-completions server, e.g. a local fake for tests
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "10"))                   # seconds per request
+NAMING_BATCH_SIZE = int(os.getenv("SEFS_NAMING_BATCH", "20"))           # clusters named per request
+NAMING_CONCURRENCY = int(os.getenv("SEFS_NAMING_CONCURRENCY", "2"))     # requests in flight at once
+NAMING_DEADLINE = float(os.getenv("SEFS_NAMING_DEADLINE", "30"))        # seconds for a whole naming pass
+_groq_client = None
 _groq_rate_limited = False
 _groq_rate_limit_until = 0
 _groq_lock = threading.Lock()
 
-# Name cache
-_name_cache = {}
-_CACHE_MAX = 200
+# Cluster names by membership, on disk so restarts don't rename (see _cache_key)
+_name_cache = NameCache(CACHE_DIR)
+
+# Corpus-wide TF-IDF rows by content hash; main adds / removes files as they come and go
+term_index = TermIndex()
 
 # Comprehensive category mapping with keywords — covers all major domains
 CATEGORY_MAP = {
@@ -677,7 +689,55 @@ CATEGORY_MAP = {
 }
 
 
-def find_optimal_clusters(embeddings, max_k=8):
+# ─── k selection ─────────────────────────────────────────────────
+# "exact": KMeans(n_init=10) + full O(n²) silhouette for every k (fine for small sets).
+# "fast": MiniBatchKMeans on normalized vectors, silhouette on a fixed sample,
+#         all k evaluated in parallel, warm-started from the previous run's centroids.
+# "auto": exact up to KSELECT_EXACT_MAX samples, fast above.
+KSELECT_ENGINE = os.getenv("SEFS_KSELECT", "auto")
+KSELECT_EXACT_MAX = int(os.getenv("SEFS_KSELECT_EXACT_MAX", "500"))
+KSELECT_SAMPLE = int(os.getenv("SEFS_KSELECT_SAMPLE", "1000"))
+
+# "kmeans":   k chosen by silhouette over 2..8 (the default).
+# "adaptive": same, but the candidate k grow with the corpus (see _candidate_ks).
+# "density":  HDBSCAN-style clusters over the k-NN graph (density_clusters);
+#             files in no dense region are left unassigned.
+CLUSTER_ENGINE = os.getenv("SEFS_CLUSTER_ENGINE", "kmeans")
+MAX_CLUSTERS = int(os.getenv("SEFS_MAX_CLUSTERS", "64"))               # largest k "adaptive" tries
+DENSITY_NEIGHBORS = int(os.getenv("SEFS_DENSITY_NEIGHBORS", "15"))     # k of the k-NN graph
+DENSITY_MIN_SAMPLES = int(os.getenv("SEFS_DENSITY_MIN_SAMPLES", "5"))  # neighbours within reach to be a core point
+DENSITY_MIN_CLUSTER = int(os.getenv("SEFS_DENSITY_MIN_CLUSTER", "0"))  # smallest cluster (0 = about sqrt(files))
+
+# Streaming (out-of-core) k-means for very large corpora: the embedding matrix is
+# read in blocks and never copied whole. Used by main from SEFS_STREAM_MIN_FILES files.
+STREAM_BLOCK_ROWS = int(os.getenv("SEFS_STREAM_BLOCK_ROWS", "16384"))
+STREAM_EPOCHS = int(os.getenv("SEFS_STREAM_EPOCHS", "2"))   # partial_fit passes over the matrix
+STREAM_SAMPLE = 10000                                        # rows sampled to pick k and seed centroids
+
+_warm_centroids = {}  # (scope, k) -> centroids from that caller's last fast run (see _select_k_fast)
+_warm_lock = threading.Lock()
+
+
+def _use_fast_engine(n_samples: int) -> bool:
+    if KSELECT_ENGINE == "auto":
+        return n_samples > KSELECT_EXACT_MAX
+    return KSELECT_ENGINE == "fast"
+
+
+def _candidate_ks(n_samples: int) -> list:
+    """
+    k values the "adaptive" engine tries: all of 2..8, then steps of ~25%
+    up to about sqrt(n / 10) (capped at MAX_CLUSTERS), so a 20k-file pool
+    can split into ~45 folders while small corpora search as before.
+    """
+    upper = min(MAX_CLUSTERS, n_samples - 1, max(8, int(round(np.sqrt(n_samples / 10)))))
+    ks = list(range(2, min(8, upper) + 1))
+    while ks and ks[-1] < upper:
+        ks.append(min(upper, max(ks[-1] + 1, int(round(ks[-1] * 1.25)))))
+    return ks
+
+
+def find_optimal_clusters(embeddings, max_k=8, scope="recluster"):
     """Find optimal number of clusters using silhouette score."""
     n_samples = len(embeddings)
     if n_samples < 2:
@@ -686,6 +746,12 @@ def find_optimal_clusters(embeddings, max_k=8):
     max_k = min(max_k, n_samples - 1)
     if max_k < 2:
         return 1
+
+    if _use_fast_engine(n_samples):
+        return _select_k_fast(embeddings, max_k, scope=scope)[0]
+    
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
     
     best_score = -1
     best_k = 2
@@ -706,7 +772,73 @@ def find_optimal_clusters(embeddings, max_k=8):
     return best_k
 
 
-def cluster_embeddings(embeddings, n_clusters=None, n_neighbors=None):
+def _select_k_fast(embeddings, max_k, ks=None, scope="recluster"):
+    """
+    Scalable k selection over 2..max_k (or the given ks). Returns
+    (best_k, labels, centers) so the winning fit is reused instead of being refitted.
+
+    - Rows are L2-normalized, so Euclidean MiniBatchKMeans behaves like
+      spherical k-means on cosine similarity.
+    - Each k is scored by silhouette on the same random sample of at most
+      KSELECT_SAMPLE points: O(s²) instead of O(n²).
+    - k values are fitted in parallel threads (the heavy parts release the GIL).
+    - A k that was fitted last time starts from those centroids with a
+      single init, which converges in a few batches when little has changed.
+      Centroids are only shared within a scope: one caller clustering the
+      same kind of data each time (the uncategorized pool, the streaming
+      sample), so a start fitted on a different subset is never reused.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.metrics import silhouette_score
+
+    X = np.asarray(embeddings, dtype=np.float32)
+    X = X / np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+    n_samples = len(X)
+
+    rng = np.random.default_rng(42)
+    sample = rng.choice(n_samples, KSELECT_SAMPLE, replace=False) if n_samples > KSELECT_SAMPLE else None
+
+    with _warm_lock:
+        warm = {k: c for (s, k), c in _warm_centroids.items() if s == scope and c.shape[1] == X.shape[1]}
+
+    def _fit(k):
+        init = warm.get(k)
+        try:
+            km = MiniBatchKMeans(
+                n_clusters=k,
+                init=init if init is not None else "k-means++",
+                n_init=1 if init is not None else 3,
+                batch_size=1024,
+                random_state=42,
+            )
+            labels = km.fit_predict(X)
+            if len(set(labels)) < 2:
+                return k, -1.0, labels, km.cluster_centers_
+            if sample is None:
+                score = silhouette_score(X, labels)
+            else:
+                score = silhouette_score(X[sample], labels[sample])
+            return k, float(score), labels, km.cluster_centers_
+        except Exception as e:
+            print(f"Error computing silhouette for k={k}: {e}")
+            return k, -1.0, None, None
+
+    ks = list(ks) if ks else list(range(2, max_k + 1))
+    with ThreadPoolExecutor(max_workers=min(len(ks), os.cpu_count() or 1)) as pool:
+        results = list(pool.map(_fit, ks))
+
+    with _warm_lock:
+        for k, _, labels, centers in results:
+            if centers is not None:
+                _warm_centroids[scope, k] = centers
+
+    best = max((r for r in results if r[2] is not None), key=lambda r: r[1], default=None)
+    if best is None:
+        return 2, None, None
+    return best[0], best[2], best[3]
+
+
+def cluster_embeddings(embeddings, n_clusters=None, n_neighbors=None, scope="recluster"):
     """
     Cluster embeddings using KMeans.
     
@@ -714,24 +846,259 @@ def cluster_embeddings(embeddings, n_clusters=None, n_neighbors=None):
         embeddings: Array of embeddings
         n_clusters: Number of clusters (auto-detect if None)
         n_neighbors: Unused (for API compatibility)
+        scope: Warm-start scope for the fast k selection (see _select_k_fast)
     
     Returns:
         Tuple of (cluster labels, cluster centers)
     """
     if len(embeddings) < 2:
         return np.array([0]), np.array([embeddings[0]])
-    
+
+    if n_clusters is None and CLUSTER_ENGINE == "adaptive" and len(embeddings) > 2:
+        ks = _candidate_ks(len(embeddings))
+        _, labels, centers = _select_k_fast(embeddings, max(ks), ks, scope=scope)
+        if labels is not None:
+            return labels, centers
+
+    if n_clusters is None and _use_fast_engine(len(embeddings)):
+        max_k = min(8, len(embeddings) - 1)
+        if max_k >= 2:
+            _, labels, centers = _select_k_fast(embeddings, max_k, scope=scope)
+            if labels is not None:
+                return labels, centers
+
     if n_clusters is None:
-        n_clusters = find_optimal_clusters(embeddings)
+        n_clusters = find_optimal_clusters(embeddings, scope=scope)
     
     n_clusters = min(n_clusters, len(embeddings))
     
+    from sklearn.cluster import KMeans
     kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
     labels = kmeans.fit_predict(embeddings)
-    
+
     return labels, kmeans.cluster_centers_
 
 
+def iter_blocks(matrix, rows=None, block_rows=STREAM_BLOCK_ROWS, release=None):
+    """
+    Yield (start, block): consecutive blocks of `matrix` (or of its `rows`,
+    in that order) as L2-normalized float32 copies. `release` runs after
+    each block, e.g. EmbeddingStore.release_pages for a memory-mapped store.
+    """
+    n = len(matrix) if rows is None else len(rows)
+    for start in range(0, n, block_rows):
+        if rows is None:
+            block = np.asarray(matrix[start:start + block_rows], dtype=np.float32)
+        else:
+            block = np.asarray(matrix[np.asarray(rows[start:start + block_rows])], dtype=np.float32)
+        block = block / np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        if release is not None:
+            release()
+        yield start, block
+
+
+def sample_rows(matrix, rows=None, size=STREAM_SAMPLE, block_rows=STREAM_BLOCK_ROWS, release=None):
+    """
+    (picks, X): a random sample of at most `size` rows of `matrix` (or of
+    its `rows`) as L2-normalized float32, and their positions in `rows`
+    (row numbers if rows is None), both in matrix order.
+    """
+    n = len(matrix) if rows is None else len(rows)
+    rng = np.random.default_rng(42)
+    picks = rng.choice(n, min(n, size), replace=False)
+    matrix_rows = picks if rows is None else np.asarray(rows)[picks]
+    order = np.argsort(matrix_rows, kind="stable")
+    picks, matrix_rows = picks[order], matrix_rows[order]
+    # Gathered one block's span of rows at a time: a scattered gather over a
+    # memory-mapped matrix would fault (and read around) nearly every page of it
+    bounds = np.searchsorted(matrix_rows, np.arange(block_rows, matrix_rows[-1] + 1, block_rows))
+    parts = []
+    for part in np.split(matrix_rows, bounds):
+        if len(part):
+            parts.append(np.array(matrix[part], dtype=np.float32))
+            if release is not None:
+                release()
+    X = np.concatenate(parts)
+    return picks, X / np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+
+
+def cluster_embeddings_streaming(matrix, rows=None, n_clusters=None, block_rows=STREAM_BLOCK_ROWS, release=None):
+    """
+    Out-of-core KMeans: same (labels, centers) as cluster_embeddings, but
+    the matrix is only ever read one block at a time, so memory stays at
+    one block (plus an int32 label per row) however many files there are.
+
+    - k comes from the fast k selection on a random sample of rows, whose
+      winning centroids also seed the streaming fit.
+    - Pass 1: MiniBatchKMeans.partial_fit block by block, STREAM_EPOCHS times.
+    - Pass 2: each block is labelled against the final centroids.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    n = len(matrix) if rows is None else len(rows)
+    if n < 2:
+        return np.zeros(n, dtype=np.int32), np.concatenate([b for _, b in iter_blocks(matrix, rows, block_rows, release)])
+
+    _, X = sample_rows(matrix, rows, STREAM_SAMPLE, block_rows, release)
+    if n_clusters is None:
+        max_k = min(8, len(X) - 1)
+        ks = _candidate_ks(n) if CLUSTER_ENGINE == "adaptive" else None
+        n_clusters, _, init = _select_k_fast(X, max_k, ks, scope="stream") if max_k >= 2 else (1, None, None)
+    else:
+        init = None
+    n_clusters = min(n_clusters, n)
+    if init is None or len(init) != n_clusters:
+        init = MiniBatchKMeans(n_clusters=n_clusters, n_init=3, batch_size=1024, random_state=42).fit(X).cluster_centers_
+    del X
+
+    km = MiniBatchKMeans(n_clusters=n_clusters, init=init, n_init=1, batch_size=1024, random_state=42)
+    for _ in range(STREAM_EPOCHS):
+        for _, block in iter_blocks(matrix, rows, block_rows, release):
+            if len(block) >= n_clusters:
+                km.partial_fit(block)
+
+    labels = np.empty(n, dtype=np.int32)
+    for start, block in iter_blocks(matrix, rows, block_rows, release):
+        labels[start:start + len(block)] = km.predict(block)
+    return labels, km.cluster_centers_
+
+
+def density_clusters(neighbors, similarities, min_cluster_size=None, min_samples=DENSITY_MIN_SAMPLES):
+    """
+    HDBSCAN-style clustering of a k-NN graph, as from VectorIndex.knn_graph
+    (row i: row indices and cosine similarities of i's nearest neighbours,
+    best first; -1 where there is none). Returns a label per row, -1 = noise.
+
+    1. Core distance: cosine distance to the min_samples-th neighbour.
+    2. Graph edges are weighted by mutual reachability,
+       max(core_i, core_j, distance_ij), and reduced to a minimum spanning forest.
+    3. Merging the forest's edges by weight gives the single-linkage tree,
+       which is condensed: a split counts only when both sides have
+       min_cluster_size points; smaller sides fall out of their parent.
+    4. Excess of mass: a cluster is kept when its stability, the sum over
+       its points of (λ when the point leaves − λ at the cluster's birth)
+       with λ = 1 / distance, beats that of its kept descendants. Points
+       outside every kept cluster are noise.
+    """
+    from scipy import sparse
+    from scipy.sparse.csgraph import minimum_spanning_tree
+
+    neighbors = np.asarray(neighbors)
+    n = len(neighbors)
+    if min_cluster_size is None:
+        min_cluster_size = DENSITY_MIN_CLUSTER or max(5, int(round(np.sqrt(n))))
+    labels = np.full(n, -1, dtype=np.int64)
+    if n < min_cluster_size or neighbors.shape[1] == 0:
+        return labels
+
+    # ── Mutual reachability graph → minimum spanning forest ──
+    dist = np.where(neighbors >= 0, 1.0 - np.asarray(similarities, dtype=np.float64), np.inf)
+    m = max(1, min(min_samples, neighbors.shape[1]))
+    core = np.sort(dist, axis=1)[:, m - 1]
+    src = np.repeat(np.arange(n), neighbors.shape[1])
+    dst, d = neighbors.ravel(), dist.ravel()
+    keep = dst >= 0
+    src, dst, d = src[keep], dst[keep], d[keep]
+    w = np.maximum(np.maximum(core[src], core[dst]), d)
+    keep = np.isfinite(w)
+    graph = sparse.csr_matrix((np.maximum(w[keep], 1e-9), (src[keep], dst[keep])), shape=(n, n))
+    forest = minimum_spanning_tree(graph.maximum(graph.T)).tocoo()
+
+    # ── Single-linkage tree (node ids >= n are merges) ───────
+    uf = list(range(n))
+    top = list(range(n))       # union-find root -> tree node currently representing it
+    size = [1] * n
+    left, right, lam = [], [], []
+
+    def _find(x):
+        while uf[x] != x:
+            uf[x] = uf[uf[x]]
+            x = uf[x]
+        return x
+
+    for e in np.argsort(forest.data, kind="stable"):
+        a, b = _find(int(forest.row[e])), _find(int(forest.col[e]))
+        if a == b:
+            continue
+        left.append(top[a])
+        right.append(top[b])
+        lam.append(1.0 / forest.data[e])
+        size.append(size[top[a]] + size[top[b]])
+        uf[b] = a
+        top[a] = n + len(left) - 1
+    roots = {top[_find(i)] for i in range(n)}
+
+    def _points(node):
+        out, stack = [], [node]
+        while stack:
+            x = stack.pop()
+            if x < n:
+                out.append(x)
+            else:
+                stack += [left[x - n], right[x - n]]
+        return out
+
+    # ── Condensed tree + stabilities ─────────────────────────
+    birth, parent, stability = [], [], []
+    point_cluster = np.full(n, -1, dtype=np.int64)
+
+    def _new_cluster(at, of):
+        birth.append(at)
+        parent.append(of)
+        stability.append(0.0)
+        return len(birth) - 1
+
+    stack = [(r, _new_cluster(0.0, -1)) for r in roots if size[r] >= min_cluster_size]
+    top_level = [c for _, c in stack]
+    while stack:
+        node, c = stack.pop()
+        while node >= n:
+            a, b, at = left[node - n], right[node - n], lam[node - n]
+            if size[a] >= min_cluster_size and size[b] >= min_cluster_size:
+                stability[c] += (at - birth[c]) * (size[a] + size[b])
+                stack += [(a, _new_cluster(at, c)), (b, _new_cluster(at, c))]
+                break
+            for child in (a, b):
+                if size[child] < min_cluster_size:
+                    pts = _points(child)
+                    point_cluster[pts] = c
+                    stability[c] += (at - birth[c]) * len(pts)
+            node = a if size[a] >= min_cluster_size else b if size[b] >= min_cluster_size else -1
+        if 0 <= node < n:
+            point_cluster[node] = c  # min_cluster_size 1: a point is its own cluster
+
+    # ── Excess of mass selection ─────────────────────────────
+    n_clusters = len(birth)
+    selected = [True] * n_clusters
+    best = list(stability)
+    children = [0.0] * n_clusters
+    has_children = [False] * n_clusters
+    for c in range(n_clusters):
+        if parent[c] >= 0:
+            has_children[parent[c]] = True
+    if len(top_level) == 1:
+        selected[top_level[0]] = False  # like HDBSCAN, the whole corpus is never "a cluster"
+    for c in reversed(range(n_clusters)):  # children are created after their parents
+        if has_children[c] and (children[c] > stability[c] or not selected[c]):
+            selected[c] = False
+            best[c] = children[c]
+        if parent[c] >= 0:
+            children[parent[c]] += best[c]
+
+    final = [-1] * n_clusters
+    for c in range(n_clusters):
+        above = final[parent[c]] if parent[c] >= 0 else -1
+        final[c] = above if above >= 0 else (c if selected[c] else -1)
+
+    kept = sorted({f for f in final if f >= 0})
+    relabel = {c: i for i, c in enumerate(kept)}
+    for p in range(n):
+        c = point_cluster[p]
+        if c >= 0 and final[c] >= 0:
+            labels[p] = relabel[final[c]]
+    return labels
+
+
 def name_all_clusters(cluster_data):
     """
     Name all clusters using fallback strategy:
@@ -740,84 +1107,117 @@ def name_all_clusters(cluster_data):
     3. Try keyword matching
     4. Try TF-IDF
     5. Fallback to filename patterns
+
+    cluster_data entries may carry "content_hashes" (one per member file),
+    which makes cached names survive restarts and reordering.
+
+    Blocks on the LLM. The pipeline instead takes name_clusters_provisional()
+    names right away and runs name_clusters_llm() in the background.
     """
-    named_clusters = {}
-    uncached_data = {}
-    
-    # Check cache first
-    for cluster_id, data in cluster_data.items():
-        cache_key = _cache_key(data["texts"])
-        cached_name = _get_cached_name(cache_key)
-        if cached_name:
-            named_clusters[cluster_id] = cached_name
-        else:
-            uncached_data[cluster_id] = data
-    
-    if not uncached_data:
-        return named_clusters
-    
-    # Try Groq API if not rate limited
-    if not _is_rate_limited():
-        groq_names = _name_clusters_groq(uncached_data)
-        if groq_names:
-            for cluster_id, name in groq_names.items():
-                named_clusters[cluster_id] = name
-                cache_key = _cache_key(uncached_data[cluster_id]["texts"])
-                _set_cached_name(cache_key, name)
-                uncached_data.pop(cluster_id, None)
-    
-    if not uncached_data:
-        return named_clusters
-    
-    # Try keyword matching
-    for cluster_id, data in list(uncached_data.items()):
-        keyword_name = _name_cluster_by_keywords(data["texts"], data["file_names"])
-        if keyword_name:
-            named_clusters[cluster_id] = keyword_name
-            cache_key = _cache_key(data["texts"])
-            _set_cached_name(cache_key, keyword_name)
-            uncached_data.pop(cluster_id, None)
-    
-    if not uncached_data:
-        return named_clusters
-    
-    # Try TF-IDF
-    tfidf_names = _name_clusters_tfidf(uncached_data)
-    for cluster_id, name in tfidf_names.items():
-        named_clusters[cluster_id] = name
-        cache_key = _cache_key(uncached_data[cluster_id]["texts"])
-        _set_cached_name(cache_key, name)
-    
+    named_clusters, pending = name_clusters_provisional(cluster_data)
+    if pending:
+        named_clusters.update(name_clusters_llm(
+            {cid: cluster_data[cid] for cid in pending},
+            {cid: named_clusters[cid] for cid in pending},
+        ))
     return named_clusters
 
 
+def name_clusters_provisional(cluster_data):
+    """
+    Names without any network call: cached name, else keyword matching, else
+    TF-IDF. Returns (names, pending) — pending lists the clusters an LLM should
+    still name. If no LLM is available the local names are final and cached.
+    """
+    try:
+        named_clusters = {}
+        uncached_data = {}
+        for cluster_id, data in cluster_data.items():
+            cached_name = _get_cached_name(_cache_key(data))
+            if cached_name:
+                named_clusters[cluster_id] = cached_name
+            else:
+                uncached_data[cluster_id] = data
+
+        if not uncached_data:
+            return named_clusters, []
+
+        # Try keyword matching
+        remaining = {}
+        for cluster_id, data in uncached_data.items():
+            keyword_name = _name_cluster_by_keywords(data["texts"], data["file_names"])
+            if keyword_name:
+                named_clusters[cluster_id] = keyword_name
+            else:
+                remaining[cluster_id] = data
+
+        # Try TF-IDF
+        if remaining:
+            named_clusters.update(_name_clusters_tfidf(remaining))
+
+        if _llm_available():
+            return named_clusters, list(uncached_data)
+        for cluster_id, data in uncached_data.items():
+            _set_cached_name(_cache_key(data), named_clusters[cluster_id])
+        return named_clusters, []
+    finally:
+        _name_cache.flush()
+
+
+def name_clusters_llm(cluster_data, provisional):
+    """
+    LLM names for clusters (blocking — call it off the pipeline lock).
+    Clusters the LLM doesn't name in time keep their provisional name; only
+    LLM names are cached, so those clusters are tried again next recluster.
+    """
+    named_clusters = dict(provisional)
+    try:
+        if not _is_rate_limited():
+            llm_names = _name_clusters_groq(cluster_data)
+            for cluster_id, name in llm_names.items():
+                _set_cached_name(_cache_key(cluster_data[cluster_id]), name)
+            named_clusters.update(llm_names)
+        return named_clusters
+    finally:
+        _name_cache.flush()
+
+
+_category_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def get_category_matcher():
+    """Single-pass keyword matcher over CATEGORY_MAP (built once, on first use)."""
+    global _category_matcher
+    if _category_matcher is None:
+        with _matcher_lock:
+            if _category_matcher is None:
+                _category_matcher = KeywordMatcher(CATEGORY_MAP)
+    return _category_matcher
+
+
 def _name_cluster_by_keywords(texts, file_names):
     """
     Name cluster by matching keywords from CATEGORY_MAP.
-    Uses word-boundary regex matching to avoid substring matches.
-    Requires score >= 5 and at least 2 keyword matches.
+    Uses word-boundary matching to avoid substring matches.
+    Requires score >= 2 and at least 1 keyword match.
     """
     combined_text = " ".join(texts).lower()
     combined_files = " ".join(file_names).lower()
     
     category_scores = {}
     category_match_counts = {}
-    
-    for category, keywords in CATEGORY_MAP.items():
-        score = 0
-        match_count = 0
-        
-        for keyword in keywords:
-            # Use word boundaries to prevent substring matches
-            pattern = r'\b' + re.escape(keyword.lower()) + r'\b'
-            
-            text_matches = len(re.findall(pattern, combined_text))
-            file_matches = len(re.findall(pattern, combined_files))
-            
-            if text_matches > 0 or file_matches > 0:
-                match_count += 1
-                # Filename matches are strong signals — weight them 3x
-                score += text_matches + file_matches * 3
+
+    matcher = get_category_matcher()
+    text_hits = matcher.count(combined_text)
+    file_hits = matcher.count(combined_files)
+    # Filename matches are strong signals — weight them 3x
+    scores = (text_hits + file_hits * 3) @ matcher.membership
+    _, match_counts = matcher.category_scores(text_hits + file_hits)
+
+    for c, category in enumerate(matcher.categories):
+        score = int(scores[c])
+        match_count = int(match_counts[c])
         
         if match_count >= 1 and score >= 2:
             category_scores[category] = score
@@ -843,14 +1243,12 @@ def get_subcategory_name(texts, file_names, parent_category):
     
     keyword_scores = {}
     parent_keywords = CATEGORY_MAP[parent_category]
+
+    matcher = get_category_matcher()
+    hits = matcher.count(combined_text) + matcher.count(combined_files)
     
     for keyword in parent_keywords:
-        pattern = r'\b' + re.escape(keyword.lower()) + r'\b'
-        
-        text_matches = len(re.findall(pattern, combined_text))
-        file_matches = len(re.findall(pattern, combined_files))
-        
-        total_matches = text_matches + file_matches
+        total_matches = int(hits[matcher.index_of(keyword)])
         if total_matches > 0:
             keyword_scores[keyword] = total_matches
     
@@ -872,65 +1270,101 @@ def name_sub_clusters_by_keywords(sub_cluster_data, parent_category):
             named_subclusters[sub_id] = subcat_name
         else:
             # Fallback to TF-IDF
-            tfidf_name = _name_single_cluster_tfidf(data["texts"], data["file_names"])
+            tfidf_name = _name_single_cluster_tfidf(data["texts"], data["file_names"], data.get("content_hashes"))
             named_subclusters[sub_id] = tfidf_name
     
     return named_subclusters
 
 
 def _name_clusters_groq(cluster_data):
-    """Name clusters using Groq API."""
-    if not GROQ_API_KEY:
+    """
+    Name clusters using Groq API: NAMING_BATCH_SIZE clusters per request, at
+    most NAMING_CONCURRENCY requests at a time, all within NAMING_DEADLINE.
+    Returns the names that came back; missing ones are simply absent.
+    """
+    client = _get_groq_client()
+    if client is None or not cluster_data:
         return {}
-    
+
+    items = list(cluster_data.items())
+    batches = [items[i:i + NAMING_BATCH_SIZE] for i in range(0, len(items), NAMING_BATCH_SIZE)]
+    named_clusters = {}
+    pool = ThreadPoolExecutor(max_workers=max(1, min(NAMING_CONCURRENCY, len(batches))))
     try:
-        client = _get_groq_client()
-        named_clusters = {}
-        
-        for cluster_id, data in cluster_data.items():
-            texts_sample = data["texts"][:3]
-            files_sample = data["file_names"][:5]
-            
-            prompt = f"""Based on these file excerpts and names, suggest a brief category name (2-4 words):
+        futures = [pool.submit(_name_batch_groq, client, batch) for batch in batches]
+        done, not_done = wait(futures, timeout=NAMING_DEADLINE)
+        for future in done:
+            try:
+                named_clusters.update(future.result())
+            except Exception as e:
+                print(f"Groq API error: {e}")
+        if not_done:
+            print(f"[CLUSTERER] Naming deadline hit, {len(not_done)} request(s) dropped")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return named_clusters
 
-Files: {', '.join(files_sample)}
 
+def _name_batch_groq(client, batch):
+    """One chat request naming several clusters; returns { cluster_id: name }."""
+    if _is_rate_limited():
+        return {}
+    sections = []
+    for i, (_, data) in enumerate(batch):
+        sections.append(f"""Group {i}
+Files: {', '.join(data["file_names"][:5])}
 Content samples:
-{chr(10).join([f'- {_smart_truncate(t, 150)}' for t in texts_sample])}
+{chr(10).join([f'- {_smart_truncate(t, 150)}' for t in data["texts"][:3]])}""")
 
-Category name:"""
-            
-            try:
-                response = client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=30,
-                    temperature=0.3,
-                    timeout=5
-                )
-                
-                name = response.choices[0].message.content.strip()
-                name = re.sub(r'^["\'`]|["\'`]$', '', name)
-                name = name.split('\n')[0].strip()
-                
-                if len(name) > 50:
-                    name = name[:50]
-                
-                if name:
-                    named_clusters[cluster_id] = name
-                    
-            except Exception as e:
-                error_msg = str(e).lower()
-                if "rate" in error_msg or "limit" in error_msg or "429" in error_msg:
-                    _mark_rate_limited()
-                    break
-                continue
-        
-        return named_clusters
-        
+    prompt = f"""Suggest a brief category name (2-4 words) for each group of files below, based on their names and content.
+Reply with only a JSON object mapping each group number to its name, e.g. {{"0": "Tax Returns", "1": "Lab Reports"}}.
+
+{chr(10).join(sections)}"""
+
+    try:
+        response = client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=20 * len(batch) + 50,
+            temperature=0.3,
+            response_format={"type": "json_object"},
+        )
     except Exception as e:
-        print(f"Groq API error: {e}")
+        error_msg = str(e).lower()
+        if "rate" in error_msg or "limit" in error_msg or "429" in error_msg:
+            _mark_rate_limited()
+            return {}
+        raise
+
+    replies = _parse_json_object(response.choices[0].message.content or "")
+    named_clusters = {}
+    for i, (cluster_id, _) in enumerate(batch):
+        name = _clean_name(replies.get(str(i)))
+        if name:
+            named_clusters[cluster_id] = name
+    return named_clusters
+
+
+def _parse_json_object(text):
+    """First {...} object in a model reply (tolerates code fences / chatter), or {}."""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        value = json.loads(match.group(0))
+    except ValueError:
         return {}
+    return value if isinstance(value, dict) else {}
+
+
+def _clean_name(name):
+    """A model-suggested name as a folder-safe label (None if unusable)."""
+    if not isinstance(name, str):
+        return None
+    name = re.sub(r'^["\'`]|["\'`]$', '', name.strip())
+    name = name.split('\n')[0].strip()
+    name = re.sub(r'[\\/:*?"<>|]', ' ', name).strip()
+    return name[:50] or None
 
 
 def _name_sub_clusters_groq(sub_cluster_data):
@@ -939,22 +1373,45 @@ def _name_sub_clusters_groq(sub_cluster_data):
 
 
 def _name_clusters_tfidf(cluster_data):
-    """Name clusters using TF-IDF analysis."""
+    """
+    Name clusters by their top TF-IDF terms. Clusters whose members are in
+    term_index are labelled together from the corpus-wide rows; the rest
+    fit a TF-IDF model on their own texts.
+    """
     named_clusters = {}
-    
+    indexed = {cid: data["content_hashes"] for cid, data in cluster_data.items() if data.get("content_hashes")}
+    if indexed and len(term_index):
+        try:
+            for cluster_id, top_terms in term_index.top_terms(indexed, n=2).items():
+                if top_terms:
+                    named_clusters[cluster_id] = _name_from_terms(top_terms)
+        except Exception as e:
+            print(f"TF-IDF naming error: {e}")
+
     for cluster_id, data in cluster_data.items():
-        name = _name_single_cluster_tfidf(data["texts"], data["file_names"])
-        named_clusters[cluster_id] = name
-    
+        if cluster_id not in named_clusters:
+            named_clusters[cluster_id] = _name_single_cluster_tfidf(data["texts"], data["file_names"])
+
     return named_clusters
 
 
-def _name_single_cluster_tfidf(texts, file_names):
-    """Name a single cluster using TF-IDF."""
+def _name_from_terms(top_terms):
+    name = " ".join(top_terms[:2]).title()
+    return name if len(name) <= 50 else name[:50]
+
+
+def _name_single_cluster_tfidf(texts, file_names, content_hashes=None):
+    """Name a single cluster using TF-IDF (from term_index when its members are indexed)."""
+    if content_hashes and len(term_index):
+        top_terms = term_index.top_terms({0: content_hashes}, n=2)[0]
+        if top_terms:
+            return _name_from_terms(top_terms)
+
     if not texts:
         return _name_from_filenames(file_names)
     
     try:
+        from sklearn.feature_extraction.text import TfidfVectorizer
         vectorizer = TfidfVectorizer(max_features=10, stop_words='english', ngram_range=(1, 2))
         tfidf_matrix = vectorizer.fit_transform(texts)
         
@@ -965,8 +1422,7 @@ def _name_single_cluster_tfidf(texts, file_names):
         top_terms = [feature_names[i] for i in top_indices if avg_tfidf[i] > 0]
         
         if top_terms:
-            name = " ".join(top_terms[:2]).title()
-            return name if len(name) <= 50 else name[:50]
+            return _name_from_terms(top_terms)
         
     except Exception as e:
         print(f"TF-IDF naming error: {e}")
@@ -995,9 +1451,13 @@ def _name_from_filenames(file_names):
     return "Mixed Documents"
 
 
-def sub_cluster_files(file_paths, embeddings, texts, file_names, min_files=4):
+def sub_cluster_files(file_paths, embeddings, texts, file_names, min_files=4, parent_category=None,
+                      content_hashes=None):
     """
     Sub-cluster files within a parent cluster.
+    With a parent_category (a CATEGORY_MAP key), sub-clusters are named
+    after that category's own keywords instead of top-level categories.
+    With content_hashes, TF-IDF names come from term_index.
     
     Returns:
         dict: { sub_name: [file_indices] } or None
@@ -1021,6 +1481,16 @@ def sub_cluster_files(file_paths, embeddings, texts, file_names, min_files=4):
             label_groups[label].append(i)
         
         # Name each sub-cluster using keyword matching
+        sub_names = {}
+        if parent_category:
+            sub_names = name_sub_clusters_by_keywords({
+                label: {
+                    "texts": [texts[i] for i in indices],
+                    "file_names": [file_names[i] for i in indices],
+                    "content_hashes": [content_hashes[i] for i in indices] if content_hashes else None,
+                }
+                for label, indices in label_groups.items()
+            }, parent_category)
         named_result = {}
         used_names = set()
         for label, indices in label_groups.items():
@@ -1028,9 +1498,10 @@ def sub_cluster_files(file_paths, embeddings, texts, file_names, min_files=4):
             sub_fnames = [file_names[i] for i in indices]
             
             # Try keyword naming
-            name = _name_cluster_by_keywords(sub_texts, sub_fnames)
+            name = sub_names.get(label) or _name_cluster_by_keywords(sub_texts, sub_fnames)
             if not name:
-                name = _name_single_cluster_tfidf(sub_texts, sub_fnames)
+                name = _name_single_cluster_tfidf(sub_texts, sub_fnames,
+                                                  [content_hashes[i] for i in indices] if content_hashes else None)
             if not name:
                 name = _name_from_filenames(sub_fnames)
             
@@ -1056,61 +1527,23 @@ def get_3d_positions(embeddings):
     Reduce embeddings to 3D for visualization.
     Uses PCA for n<15, UMAP with init="random" for n>=15.
     Falls back to PCA if UMAP fails.
+    (One-shot; the live graph keeps a fitted reducer in layout.LayoutEngine.)
     """
-    n_samples = len(embeddings)
-    
-    if n_samples < 3:
-        # Pad to 3D
-        result = np.zeros((n_samples, 3))
-        result[:, :embeddings.shape[1]] = embeddings[:, :min(3, embeddings.shape[1])]
-        return result
-    
-    if n_samples < 15:
-        # Use PCA for small datasets
-        try:
-            n_components = min(3, embeddings.shape[1], n_samples)
-            pca = PCA(n_components=n_components, random_state=42)
-            result = pca.fit_transform(embeddings)
-            
-            if result.shape[1] < 3:
-                padded = np.zeros((n_samples, 3))
-                padded[:, :result.shape[1]] = result
-                return padded
-            
-            return result
-            
-        except Exception as e:
-            print(f"PCA error: {e}")
-            return np.random.randn(n_samples, 3)
-    
-    # Use UMAP for larger datasets
+    from layout import fit_reducer
+    return fit_reducer(embeddings)[1]
+
+
+def warm_up():
+    """Import the clustering / reduction libraries ahead of the first recluster."""
+    import sklearn.cluster  # noqa: F401
+    import sklearn.metrics  # noqa: F401
+    import sklearn.decomposition  # noqa: F401
+    import sklearn.feature_extraction.text  # noqa: F401
+    get_category_matcher()
     try:
-        import umap
-        reducer = umap.UMAP(n_components=3, random_state=42, init="random", n_neighbors=min(15, n_samples - 1))
-        result = reducer.fit_transform(embeddings)
-        return result
-        
+        import umap  # noqa: F401
     except ImportError:
-        print("UMAP not available, falling back to PCA")
-    except Exception as e:
-        print(f"UMAP error: {e}, falling back to PCA")
-    
-    # Fallback to PCA
-    try:
-        n_components = min(3, embeddings.shape[1], n_samples)
-        pca = PCA(n_components=n_components, random_state=42)
-        result = pca.fit_transform(embeddings)
-        
-        if result.shape[1] < 3:
-            padded = np.zeros((n_samples, 3))
-            padded[:, :result.shape[1]] = result
-            return padded
-        
-        return result
-        
-    except Exception as e:
-        print(f"PCA fallback error: {e}")
-        return np.random.randn(n_samples, 3)
+        pass
 
 
 def get_cluster_color(cluster_id):
@@ -1139,12 +1572,23 @@ def get_cluster_color(cluster_id):
 # Helper functions
 
 def _get_groq_client():
-    """Get Groq client instance."""
-    try:
-        from groq import Groq
-        return Groq(api_key=GROQ_API_KEY)
-    except ImportError:
-        return None
+    """The shared Groq client (one connection pool for all naming requests), or None."""
+    global _groq_client
+    if _groq_client is None and GROQ_API_KEY:
+        with _groq_lock:
+            if _groq_client is None:
+                try:
+                    from groq import Groq
+                    _groq_client = Groq(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL,
+                                        timeout=GROQ_TIMEOUT, max_retries=1)
+                except ImportError:
+                    return None
+    return _groq_client
+
+
+def _llm_available():
+    """Whether naming can go to the LLM right now."""
+    return bool(GROQ_API_KEY) and not _is_rate_limited() and _get_groq_client() is not None
 
 
 def _is_rate_limited():
@@ -1170,31 +1614,31 @@ def _mark_rate_limited(duration=300):
         print(f"Rate limited. Waiting {duration}s...")
 
 
-def _cache_key(texts):
-    """Generate cache key from texts."""
-    if not texts:
+def _cache_key(data):
+    """
+    Stable cache key for a cluster: the sorted content hashes of its members
+    (or of its texts, if none were given) plus the CATEGORY_MAP version that
+    keyword names depend on. Same files → same key, in any process.
+    """
+    members = data.get("content_hashes") or [
+        hashlib.blake2b(t.encode("utf-8"), digest_size=16).hexdigest() for t in data.get("texts", [])
+    ]
+    if not members:
         return ""
-    
-    sample = " ".join(texts[:3])[:200]
-    return str(hash(sample))
+    h = hashlib.blake2b(get_category_matcher().version.encode("utf-8"), digest_size=16)
+    for member in sorted(members):
+        h.update(member.encode("utf-8") + b"\n")
+    return h.hexdigest()
 
 
 def _get_cached_name(cache_key):
     """Get cached name if exists."""
-    return _name_cache.get(cache_key)
+    return _name_cache.get(cache_key) if cache_key else None
 
 
 def _set_cached_name(cache_key, name):
-    """Set cached name with size limit."""
-    global _name_cache
-    
-    if len(_name_cache) >= _CACHE_MAX:
-        # Remove oldest entries (simple FIFO)
-        keys_to_remove = list(_name_cache.keys())[:_CACHE_MAX // 4]
-        for key in keys_to_remove:
-            _name_cache.pop(key, None)
-    
-    _name_cache[cache_key] = name
+    """Remember a name (the on-disk LRU evicts the least recently used)."""
+    _name_cache.put(cache_key, name)
 
 
 def _smart_truncate(text, max_len=150):
@@ -1207,6 +1651,5 @@ def _smart_truncate(text, max_len=150):
 
 
 def clear_name_cache():
-    """Clear the name cache."""
-    global _name_cache
-    _name_cache = {}
+    """Clear the name cache (in memory and on disk)."""
+    _name_cache.clear()
@@ -0,0 +1,164 @@
+import os
+import re
+import hashlib
+import threading
+import numpy as np
+
+# Two texts whose 64-bit SimHashes differ in at most this many bits are near-duplicates (-1 = off)
+NEAR_DUP_BITS = int(os.getenv("SEFS_NEAR_DUP_BITS", "3"))
+_SHINGLE = 3         # words per shingle
+_MIN_SHINGLES = 30   # shorter texts don't get a fingerprint (too few shingles to be reliable)
+_WORD = re.compile(r"\w+")
+
+
+def simhash(text: str):
+    """64-bit SimHash of a text's 3-word shingles, or None if the text is too short."""
+    words = _WORD.findall(text.lower())
+    shingles = {" ".join(words[i:i + _SHINGLE]) for i in range(len(words) - _SHINGLE + 1)}
+    if len(shingles) < _MIN_SHINGLES:
+        return None
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles),
+    )
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")  # (shingles, 64)
+    majority = (2 * bits.sum(axis=0, dtype=np.int64) > len(shingles)).astype(np.uint8)
+    return int.from_bytes(np.packbits(majority, bitorder="little").tobytes(), "little")
+
+
+class NearDuplicateIndex:
+    """
+    SimHash fingerprints of every document seen, by content hash, with an
+    LSH lookup for near-duplicates.
+
+    The 64 bits are cut into max_distance + 1 bands. Two fingerprints within
+    max_distance bits of each other agree exactly on at least one band
+    (pigeonhole), so candidates come from a handful of dict lookups, and only
+    they are compared bit by bit.
+
+    A document's canonical is the nearest document indexed before it, so
+    near-copies all point back to whichever version arrived first. nearest()
+    answers the same question without indexing anything.
+
+    Documents matched with a path are held for that tracked file: when the
+    file is edited (matched again under a new hash) or removed, its old
+    version leaves the index once no other file has the same content, so
+    an edited file never finds its own previous version.
+    """
+
+    def __init__(self, max_distance: int = NEAR_DUP_BITS):
+        self.max_distance = max_distance
+        self.enabled = max_distance >= 0
+        n_bands = max(1, max_distance + 1)
+        edges = np.linspace(0, 64, n_bands + 1).astype(int)
+        self._bands = [((1 << int(hi - lo)) - 1, int(lo)) for lo, hi in zip(edges[:-1], edges[1:])]  # (mask, shift)
+        self._fingerprints = {}  # content hash -> fingerprint (None = too short)
+        self._order = {}         # content hash -> insertion number
+        self._next = 0
+        self._buckets = [{} for _ in self._bands]  # per band: band value -> [content hashes]
+        self._refs = {}          # content hash -> tracked files with that content
+        self._docs = {}          # path -> content hash
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._order)
+
+    def fingerprint(self, key: str, text: str = None):
+        """The document's fingerprint (computed from text the first time)."""
+        if key in self._fingerprints or text is None:
+            return self._fingerprints.get(key)
+        return simhash(text)
+
+    def match(self, key: str, text: str, path: str = None):
+        """
+        Index a document and return the content hash of its canonical
+        near-duplicate (an earlier, different document), or None. With a
+        path, the document becomes that file's current version.
+        """
+        if not self.enabled:
+            return None
+        fingerprint = self.fingerprint(key, text)
+        with self._lock:
+            if path is not None and self._docs.get(path) != key:
+                self._drop(path)
+                self._docs[path] = key
+                self._refs[key] = self._refs.get(key, 0) + 1
+            if key not in self._fingerprints:
+                self._fingerprints[key] = fingerprint
+                if fingerprint is not None:
+                    self._order[key] = self._next
+                    self._next += 1
+                    for (mask, shift), buckets in zip(self._bands, self._buckets):
+                        buckets.setdefault((fingerprint >> shift) & mask, []).append(key)
+            if fingerprint is None:
+                return None
+            return self._nearest(fingerprint, self._order[key])[0]
+
+    def nearest(self, key: str, fingerprint, pending=()):
+        """
+        Content hash of the canonical near-duplicate match() would give a
+        document with this fingerprint, without indexing it. pending holds
+        (content hash, fingerprint) pairs of documents not indexed yet that
+        arrived before this one (earlier in the same batch); indexed ones win ties.
+        """
+        if not self.enabled or fingerprint is None:
+            return None
+        with self._lock:
+            best, best_distance = self._nearest(fingerprint, self._order.get(key, self._next))
+        for other, other_fingerprint in pending:
+            if other == key or other_fingerprint is None:
+                continue
+            distance = bin(fingerprint ^ other_fingerprint).count("1")
+            if distance < best_distance:
+                best, best_distance = other, distance
+        return best
+
+    def _nearest(self, fingerprint: int, before: int):
+        """(content hash, distance) of the nearest document indexed before `before`, or (None, max_distance + 1)."""
+        best, best_distance = None, self.max_distance + 1
+        for (mask, shift), buckets in zip(self._bands, self._buckets):
+            for other in buckets.get((fingerprint >> shift) & mask, ()):
+                if self._order[other] >= before:
+                    continue
+                distance = bin(fingerprint ^ self._fingerprints[other]).count("1")
+                if distance < best_distance or (
+                        best is not None and distance == best_distance and self._order[other] < self._order[best]):
+                    best, best_distance = other, distance
+        return best, best_distance
+
+    def remove(self, path: str):
+        """A tracked file is gone: its version leaves the index unless another file has it."""
+        with self._lock:
+            self._drop(path)
+
+    def rename(self, old_path: str, new_path: str):
+        with self._lock:
+            key = self._docs.pop(old_path, None)
+            if key is not None:
+                self._docs[new_path] = key
+
+    def clear(self):
+        with self._lock:
+            self._fingerprints, self._order, self._refs, self._docs = {}, {}, {}, {}
+            self._next = 0
+            self._buckets = [{} for _ in self._bands]
+
+    def _drop(self, path: str):
+        key = self._docs.pop(path, None)
+        if key is None:
+            return
+        self._refs[key] -= 1
+        if self._refs[key] > 0:
+            return
+        del self._refs[key]
+        fingerprint = self._fingerprints.pop(key, None)
+        self._order.pop(key, None)
+        if fingerprint is None:
+            return
+        for (mask, shift), buckets in zip(self._bands, self._buckets):
+            band = (fingerprint >> shift) & mask
+            keys = buckets.get(band, [])
+            if key in keys:
+                keys.remove(key)
+            if not keys:
+                buckets.pop(band, None)
@@ -0,0 +1,458 @@
+import os
+import json
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# On-disk cache of extracted text + document embeddings, keyed by content hash.
+# Lives next to root/ (not inside it) so the watcher never sees it.
+CACHE_DIR = os.getenv(
+    "SEFS_CACHE_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".sefs_cache")),
+)
+
+_HASH_BLOCK = 1 << 20  # read files in 1 MB blocks when hashing
+
+# Upper bound on document text held in RAM by TextStore (approx. MB of characters)
+TEXT_CACHE_MB = float(os.getenv("SEFS_TEXT_CACHE_MB", "32"))
+
+# Cluster names remembered across restarts (least recently used dropped first)
+NAME_CACHE_SIZE = int(os.getenv("SEFS_NAME_CACHE_SIZE", "2000"))
+
+
+def content_hash(file_path: str) -> str:
+    """Hash a file's bytes. Same content → same key, regardless of name or location."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(_HASH_BLOCK)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+class _VectorFile:
+    """
+    Append-only file of fixed-width vectors, read through a memory map.
+    Not thread-safe on its own — owners serialize access.
+    """
+
+    def __init__(self, path: str, dim: int, dtype=np.float32):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = dim * self.dtype.itemsize
+        self.rows = 0
+        self._mmap = None
+        self._mmap_rows = 0
+
+    def open(self):
+        """Count complete rows, dropping a partially written trailing row."""
+        self.rows = _truncate_to(self.path, self.row_bytes) // self.row_bytes
+
+    def append(self, vectors) -> int:
+        """Append rows; return the index of the first one."""
+        block = np.ascontiguousarray(vectors, dtype=self.dtype).reshape(-1, self.dim)
+        with open(self.path, 'ab') as f:
+            f.write(block.tobytes())
+        first = self.rows
+        self.rows += len(block)
+        return first
+
+    def read(self, rows) -> np.ndarray:
+        """Copy rows out of the map as float32 (remapping only when the file has grown)."""
+        if self._mmap is None or self._mmap_rows < self.rows:
+            self._mmap = np.memmap(self.path, dtype=self.dtype, mode='r', shape=(self.rows, self.dim))
+            self._mmap_rows = self.rows
+        return np.array(self._mmap[rows], dtype=np.float32)
+
+
+def _truncate_to(path: str, multiple: int) -> int:
+    if not os.path.exists(path):
+        return 0
+    size = os.path.getsize(path)
+    aligned = size - (size % multiple)
+    if aligned != size:
+        with open(path, 'r+b') as f:
+            f.truncate(aligned)
+    return aligned
+
+
+def _signature_dir(cache_dir: str, signature: str) -> str:
+    return os.path.join(cache_dir, hashlib.blake2b(signature.encode("utf-8"), digest_size=8).hexdigest())
+
+
+def _read_index(path: str):
+    """Yield the JSON entries of an index file, skipping a torn last line."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+class DocumentCache:
+    """
+    Append-only, content-addressed store of (text, embedding) per document.
+
+    Each embedding signature (model name + chunking parameters) gets its own
+    sub-directory, so changing the model never serves stale vectors:
+
+        <cache_dir>/<signature>/vectors.f32   float32 rows, memory-mapped for reads
+        <cache_dir>/<signature>/texts.bin     zlib-compressed extracted text
+        <cache_dir>/<signature>/index.jsonl   one line per entry: hash → row + text offset
+
+    A near-duplicate that reused another document's embedding shares that
+    document's vector row instead of storing a copy.
+
+    Entries are never rewritten. A crash mid-write leaves at most an orphaned
+    tail, which is ignored (and truncated) on the next load.
+    """
+
+    def __init__(self, cache_dir: str, signature: str, dim: int = 384):
+        self.signature = signature
+        self.dim = dim
+        self.dir = _signature_dir(cache_dir, signature)
+        self._vectors = _VectorFile(os.path.join(self.dir, "vectors.f32"), dim)
+        self._texts_path = os.path.join(self.dir, "texts.bin")
+        self._index_path = os.path.join(self.dir, "index.jsonl")
+
+        self._index = {}      # content_hash -> (row, text_offset, text_length, word_count, truncated)
+        self._text_end = 0    # bytes in texts.bin
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    # ── Loading ──────────────────────────────────────────────────
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+
+        self._vectors.open()
+        self._text_end = os.path.getsize(self._texts_path) if os.path.exists(self._texts_path) else 0
+
+        for entry in _read_index(self._index_path):
+            try:
+                row, off, length = entry["row"], entry["off"], entry["len"]
+            except (KeyError, TypeError):
+                continue
+            if row >= self._vectors.rows or off + length > self._text_end:
+                continue  # data never made it to disk
+            self._index[entry["hash"]] = (row, off, length, entry.get("words", 0), entry.get("trunc"))
+
+        self._loaded = True
+        if self._index:
+            print(f"[CACHE] Loaded {len(self._index)} cached documents")
+
+    # ── Public API ───────────────────────────────────────────────
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._index)
+
+    def __contains__(self, key: str):
+        with self._lock:
+            self._ensure_loaded()
+            return key in self._index
+
+    def get(self, key: str):
+        """
+        Return { "text", "embedding", "word_count", "truncated" } for a content
+        hash, or None. Documents that had no text are cached too (text == "",
+        embedding None), so image-only PDFs aren't re-parsed on every start.
+        truncated is None for entries written before it was recorded.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            row, off, length, word_count, truncated = entry
+            embedding = self._vectors.read(row)
+
+        text = self._read_text(off, length)
+        return {
+            "text": text,
+            "embedding": embedding if text else None,
+            "word_count": word_count,
+            "truncated": truncated,
+        }
+
+    def get_text(self, key: str):
+        """Return just the cached text for a content hash, or None."""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._index.get(key)
+        if entry is None:
+            return None
+        return self._read_text(entry[1], entry[2])
+
+    def _read_text(self, off: int, length: int) -> str:
+        with open(self._texts_path, 'rb') as f:
+            f.seek(off)
+            return zlib.decompress(f.read(length)).decode('utf-8')
+
+    def put(self, key: str, text: str, embedding, truncated: bool = False, borrowed_from: str = None):
+        """
+        Append one document. No-op if the hash is already cached.
+        borrowed_from: content hash of a cached near-duplicate whose embedding
+        this document reuses; the entry then shares that vector row.
+        """
+        blob = zlib.compress((text or "").encode('utf-8'), 6)
+        vec = np.zeros(self.dim, dtype=np.float32)
+        if embedding is not None:
+            vec[:] = embedding
+
+        with self._lock:
+            self._ensure_loaded()
+            if key in self._index:
+                return
+
+            if borrowed_from in self._index:
+                row = self._index[borrowed_from][0]
+            else:
+                row = self._vectors.append(vec)
+                borrowed_from = None
+            with open(self._texts_path, 'ab') as f:
+                f.write(blob)
+            off = self._text_end
+            self._text_end += len(blob)
+            word_count = len(text.split()) if text else 0
+
+            # Index line goes last: an entry is visible only once its data is on disk
+            entry = {"hash": key, "row": row, "off": off, "len": len(blob), "words": word_count, "trunc": bool(truncated)}
+            if borrowed_from:
+                entry["of"] = borrowed_from
+            with open(self._index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+            self._index[key] = (row, off, len(blob), word_count, bool(truncated))
+
+
+class ChunkCache:
+    """
+    Content-addressed store of per-chunk embeddings (float16 to halve disk use):
+
+        <cache_dir>/<signature>/chunks.f16          one row per distinct chunk
+        <cache_dir>/<signature>/chunks_index.jsonl  chunk hash → row
+
+    When a file is edited, only chunks whose text changed miss this cache,
+    so appending to a log costs a few encodes instead of a whole document.
+    """
+
+    def __init__(self, cache_dir: str, signature: str, dim: int = 384):
+        self.dir = _signature_dir(cache_dir, signature)
+        self._vectors = _VectorFile(os.path.join(self.dir, "chunks.f16"), dim, np.float16)
+        self._index_path = os.path.join(self.dir, "chunks_index.jsonl")
+        self._index = {}  # chunk_hash -> row
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        self._vectors.open()
+        for entry in _read_index(self._index_path):
+            if isinstance(entry, dict) and entry.get("row", self._vectors.rows) < self._vectors.rows:
+                self._index[entry["hash"]] = entry["row"]
+        self._loaded = True
+
+    def get_many(self, keys: list) -> dict:
+        """Return { chunk_hash: float32 vector } for the keys that are cached."""
+        with self._lock:
+            self._ensure_loaded()
+            found = [(k, self._index[k]) for k in keys if k in self._index]
+            if not found:
+                return {}
+            vectors = self._vectors.read([row for _, row in found])
+        return {k: vectors[i] for i, (k, _) in enumerate(found)}
+
+    def put_many(self, vectors: dict):
+        """Append { chunk_hash: vector } entries that aren't cached yet."""
+        with self._lock:
+            self._ensure_loaded()
+            new = [(k, v) for k, v in vectors.items() if k not in self._index]
+            if not new:
+                return
+            first = self._vectors.append(np.stack([v for _, v in new]))
+            with open(self._index_path, 'a', encoding='utf-8') as f:
+                for i, (k, _) in enumerate(new):
+                    f.write(json.dumps({"hash": k, "row": first + i}) + "\n")
+                    self._index[k] = first + i
+
+
+class CategoryCache:
+    """
+    Per-file keyword category scores ({ category index: score }), persisted so
+    restarts don't rescore every document:
+
+        <cache_dir>/categories/<version>.jsonl   one line per scored file
+
+    `version` is the KeywordMatcher's CATEGORY_MAP digest. Editing the map
+    gives a new version and a fresh file; old scores are simply not read.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.dir = os.path.join(cache_dir, "categories")
+        self._version = None
+        self._scores = {}
+        self._lock = threading.Lock()
+
+    def _ensure_version(self, version: str):
+        if version == self._version:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        self._scores = {}
+        for entry in _read_index(self._path(version)):
+            if isinstance(entry, dict) and "key" in entry:
+                self._scores[entry["key"]] = {int(c): s for c, s in entry.get("scores", [])}
+        self._version = version
+
+    def _path(self, version: str) -> str:
+        return os.path.join(self.dir, f"{version}.jsonl")
+
+    def get(self, version: str, key: str):
+        with self._lock:
+            self._ensure_version(version)
+            return self._scores.get(key)
+
+    def put(self, version: str, key: str, scores: dict):
+        with self._lock:
+            self._ensure_version(version)
+            if key in self._scores:
+                return
+            with open(self._path(version), 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"key": key, "scores": sorted(scores.items())}) + "\n")
+            self._scores[key] = scores
+
+
+class NameCache:
+    """
+    Cluster names by membership key, persisted so a restart doesn't pay for
+    naming (Groq round trips, TF-IDF fits) again:
+
+        <cache_dir>/cluster_names.json   [[key, name], ...], oldest use first
+
+    An LRU of at most `max_entries`. Lookups and new names change it in
+    memory; flush() writes it out (atomically) once a naming pass is done.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = NAME_CACHE_SIZE):
+        self.path = os.path.join(cache_dir, "cluster_names.json")
+        self.max_entries = max_entries
+        self._names = None  # OrderedDict, loaded on first use
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._names is not None:
+            return
+        self._names = OrderedDict()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for key, name in json.load(f):
+                    self._names[key] = name
+        except (OSError, ValueError, TypeError):
+            pass  # missing or damaged — start empty
+
+    def get(self, key: str):
+        with self._lock:
+            self._ensure_loaded()
+            name = self._names.get(key)
+            if name is not None:
+                self._names.move_to_end(key)
+                self._dirty = True
+            return name
+
+    def put(self, key: str, name: str):
+        if not key or not name:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._names.pop(key, None)
+            self._names[key] = name
+            while len(self._names) > self.max_entries:
+                self._names.popitem(last=False)
+            self._dirty = True
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(list(self._names.items()), f)
+                os.replace(tmp, self.path)
+                self._dirty = False
+            except OSError as e:
+                print(f"[CACHE] Could not save cluster names: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._names = OrderedDict()
+            self._dirty = True
+        self.flush()
+
+
+class TextStore:
+    """
+    Document text on demand, so state.files doesn't have to hold it.
+
+    Text is read back from the DocumentCache's compressed blob by content
+    hash, or re-extracted from the file with `loader` if the cache doesn't
+    have it. A small LRU of recently used texts sits in front, bounded by
+    total characters (SEFS_TEXT_CACHE_MB) rather than by corpus size.
+    """
+
+    def __init__(self, cache: DocumentCache, loader=None, max_chars: int = None):
+        self._cache = cache
+        self._loader = loader
+        self.max_chars = int(TEXT_CACHE_MB * 1_000_000) if max_chars is None else max_chars
+        self._lru = OrderedDict()  # content_hash -> text
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, file_path: str = None) -> str:
+        """Text for a content hash ("" if it can't be recovered)."""
+        with self._lock:
+            text = self._lru.get(key)
+            if text is not None:
+                self._lru.move_to_end(key)
+                return text
+
+        text = self._cache.get_text(key)
+        if text is None and self._loader is not None and file_path and os.path.exists(file_path):
+            try:
+                text = self._loader(file_path)
+            except Exception as e:
+                print(f"[CACHE] Could not re-extract {os.path.basename(file_path)}: {e}")
+        text = text or ""
+        self.put(key, text)
+        return text
+
+    def put(self, key: str, text: str):
+        """Remember a text that was just extracted (it's likely to be asked for soon)."""
+        if not text or len(text) > self.max_chars:
+            return
+        with self._lock:
+            old = self._lru.pop(key, None)
+            if old is not None:
+                self._chars -= len(old)
+            self._lru[key] = text
+            self._chars += len(text)
+            while self._chars > self.max_chars:
+                _, evicted = self._lru.popitem(last=False)
+                self._chars -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self._chars = 0
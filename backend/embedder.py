@@ -1,22 +1,197 @@
+import os
+import time
+import queue
+import hashlib
+import threading
 import numpy as np
 
-# Lazy-load the model to avoid slow transformers import at startup
-_model = None
+from doc_cache import CACHE_DIR
+
+# Lazy-load the backend to avoid slow transformers import at startup
+_backend = None
+_backend_lock = threading.Lock()
+_resolved = None  # backend name the caches are keyed by, fixed on first use (see cache_signature)
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+MODEL_HUB_ID = f'sentence-transformers/{MODEL_NAME}'
+EMBEDDING_DIM = 384
+MAX_SEQ_LENGTH = 256  # word pieces; same truncation as SentenceTransformer uses for this model
 
 # Model's max token limit is ~256 word pieces, so we chunk at ~500 chars
 CHUNK_SIZE = 500  # characters per chunk
 MAX_CHUNKS = 20   # max chunks to process per file (covers ~10,000 chars)
+# Characters of a document that can influence its embedding (20% slack for the
+# whitespace the chunker drops). Extraction stops once it has this much text.
+TEXT_BUDGET = int(CHUNK_SIZE * MAX_CHUNKS * 1.2)
+ENCODE_BATCH_SIZE = 64  # chunks per model.encode batch (chunks are pooled across files)
+
+# "torch" (SentenceTransformer) or "onnx" (ONNX Runtime, CPU). Same model, same 384-dim space.
+EMBED_BACKEND = os.getenv("SEFS_EMBED_BACKEND", "torch").lower()
+ONNX_QUANTIZE = os.getenv("SEFS_ONNX_QUANTIZE", "1") == "1"  # int8 dynamic quantization
+ONNX_MODEL_DIR = os.getenv("SEFS_ONNX_MODEL_DIR", os.path.join(CACHE_DIR, "onnx"))
+
+# Search queries arriving within this window are encoded together in one model call
+QUERY_BATCH_MS = float(os.getenv("SEFS_QUERY_BATCH_MS", "5"))
+QUERY_BATCH_MAX = 64
+
 
+class EmbeddingBackend:
+    """Turns a list of strings into an (n, EMBEDDING_DIM) float32 matrix of unit vectors."""
+    name = "base"
 
-def _get_model():
-    """Lazy-load the SentenceTransformer model on first use."""
-    global _model
-    if _model is None:
-        print("[EMBEDDER] Loading embedding model...")
+    def encode(self, texts: list[str], batch_size: int = ENCODE_BATCH_SIZE) -> np.ndarray:
+        raise NotImplementedError
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """Full-precision PyTorch model via sentence-transformers."""
+    name = "torch"
+
+    def __init__(self):
         from sentence_transformers import SentenceTransformer
-        _model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("[EMBEDDER] Model loaded ✓")
-    return _model
+        self.model = SentenceTransformer(MODEL_NAME)
+
+    def encode(self, texts, batch_size=ENCODE_BATCH_SIZE):
+        return self.model.encode(texts, convert_to_numpy=True, batch_size=batch_size,
+                                 normalize_embeddings=True).astype(np.float32, copy=False)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    The same model exported to ONNX and run with ONNX Runtime on CPU,
+    optionally with int8 dynamically quantized weights. Mean pooling +
+    L2 normalization reproduce the SentenceTransformer head, so vectors
+    live in the same space as the torch backend's.
+    """
+
+    def __init__(self, quantize: bool = ONNX_QUANTIZE, model_dir: str = ONNX_MODEL_DIR):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.quantize = quantize
+        self.name = "onnx-int8" if quantize else "onnx"
+        self.tokenizer = AutoTokenizer.from_pretrained(MODEL_HUB_ID)
+        model_path = _ensure_onnx_model(model_dir, quantize)
+        self.session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size=ENCODE_BATCH_SIZE):
+        out = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch = list(texts[start:start + batch_size])
+            enc = self.tokenizer(batch, padding=True, truncation=True,
+                                 max_length=MAX_SEQ_LENGTH, return_tensors="np")
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self._input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # Mean pooling over real (non-padding) tokens
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            out[start:start + len(batch)] = pooled / np.clip(norms, 1e-12, None)
+        return out
+
+
+def _ensure_onnx_model(model_dir: str, quantize: bool) -> str:
+    """Export the transformer to ONNX once (and quantize it once); return the file to load."""
+    fp32_path = os.path.join(model_dir, f"{MODEL_NAME}.onnx")
+    int8_path = os.path.join(model_dir, f"{MODEL_NAME}.int8.onnx")
+
+    if not os.path.exists(fp32_path):
+        print(f"[EMBEDDER] Exporting {MODEL_NAME} to ONNX (one-time)...")
+        import inspect
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        class _Encoder(torch.nn.Module):
+            """Fixed positional signature + plain tensor output, whatever the transformers version."""
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask, token_type_ids):
+                return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                                  token_type_ids=token_type_ids).last_hidden_state
+
+        os.makedirs(model_dir, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_HUB_ID)
+        encoder = _Encoder(AutoModel.from_pretrained(MODEL_HUB_ID)).eval()
+        dummy = tokenizer(["export"], return_tensors="pt")
+        names = ["input_ids", "attention_mask", "token_type_ids"]
+        dynamic = {n: {0: "batch", 1: "sequence"} for n in names + ["last_hidden_state"]}
+        extra = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            extra["dynamo"] = False  # newer torch defaults to the dynamo exporter (needs onnxscript)
+        with torch.no_grad():
+            torch.onnx.export(encoder, tuple(dummy[n] for n in names), fp32_path,
+                              input_names=names, output_names=["last_hidden_state"],
+                              dynamic_axes=dynamic, opset_version=14, **extra)
+
+    if not quantize:
+        return fp32_path
+
+    if not os.path.exists(int8_path):
+        print("[EMBEDDER] Quantizing ONNX model to int8 (one-time)...")
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+def resolve_backend() -> str:
+    """
+    The backend name create_backend() will produce by default ("torch",
+    "onnx" or "onnx-int8"). SEFS_EMBED_BACKEND=onnx falls back to torch
+    when onnxruntime / transformers aren't installed. Decided from package
+    metadata only, so the caches can be keyed before the model loads.
+    """
+    if EMBED_BACKEND == "onnx":
+        import importlib.util
+        missing = [m for m in ("onnxruntime", "transformers") if importlib.util.find_spec(m) is None]
+        if not missing:
+            return "onnx-int8" if ONNX_QUANTIZE else "onnx"
+        print(f"[EMBEDDER] ONNX backend unavailable (no {', '.join(missing)}), falling back to torch")
+    return "torch"
+
+
+def create_backend(kind: str = None) -> EmbeddingBackend:
+    """Instantiate an embedding backend by name ("torch" | "onnx"); by default the resolved one."""
+    kind = (kind or resolve_backend()).lower()
+    if kind.startswith("onnx"):
+        # No silent fallback here: the caches are already keyed for ONNX vectors
+        return OnnxBackend()
+    return SentenceTransformerBackend()
+
+
+def _get_backend() -> EmbeddingBackend:
+    """Lazy-load the configured backend on first use (once, even if called from several threads)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                print("[EMBEDDER] Loading embedding model...")
+                _backend = create_backend(_resolved_backend())
+                print(f"[EMBEDDER] Model loaded ({_backend.name}) ✓")
+    return _backend
+
+
+def warm_up():
+    """Load the model and run one tiny batch so the first real file doesn't pay for it."""
+    _get_backend().encode(["warm up"], batch_size=1)
+
+
+def cache_signature() -> str:
+    """
+    Everything that changes the vector for a given text — used to key on-disk caches.
+    Names the backend that will actually be loaded (see resolve_backend), not just the setting.
+    """
+    return f"{MODEL_NAME}|{_resolved_backend()}|chunk={CHUNK_SIZE}|max_chunks={MAX_CHUNKS}"
+
+
+def _resolved_backend() -> str:
+    global _resolved
+    if _resolved is None:
+        _resolved = resolve_backend()
+    return _resolved
 
 
 def embed_text(text: str) -> np.ndarray:
@@ -28,38 +203,158 @@ def embed_text(text: str) -> np.ndarray:
     This ensures the full document's meaning is captured without exceeding
     the model's token limit.
     """
-    if not text or not text.strip():
-        return np.zeros(384)
+    return embed_many([text])[0]
+
+
+def embed_many(texts: list[str], backend: EmbeddingBackend = None, chunk_cache=None) -> np.ndarray:
+    """
+    Embed many documents with as few model calls as possible.
     
-    text = text.strip()
-    model = _get_model()
+    Chunks every document, sorts ALL chunks by length (so each batch pads
+    to similar lengths), encodes them in large batches, then scatters the
+    weighted chunk averages back per document.
     
-    # Short text — embed directly
-    if len(text) <= CHUNK_SIZE:
-        return model.encode(text, convert_to_numpy=True)
+    Returns a (len(texts), 384) float32 matrix of unit vectors; documents
+    with no usable text get a zero row. Uses the configured backend unless
+    one is passed in.
     
-    # Long text — chunk and average
-    chunks = _split_into_chunks(text)
+    Identical chunks are encoded once. With a chunk_cache (doc_cache.ChunkCache),
+    chunks embedded before — e.g. the unchanged part of an edited file —
+    aren't encoded again.
+    """
+    result = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    
+    owners = []   # chunk -> document index
+    chunks = []
+    weights = []
+    for doc_idx, text in enumerate(texts):
+        for pos, chunk in enumerate(_document_chunks(text)):
+            owners.append(doc_idx)
+            chunks.append(chunk)
+            # Earlier chunks (intro/abstract) matter more
+            weights.append(1.0 / (1 + 0.1 * pos))
     
     if not chunks:
-        return np.zeros(384)
+        return result
     
-    # Embed all chunks at once (batch processing — much faster)
-    chunk_embeddings = model.encode(chunks, convert_to_numpy=True, batch_size=8)
+    keys = [_chunk_hash(c) for c in chunks]
+    known = chunk_cache.get_many(keys) if chunk_cache is not None else {}
     
-    # Weighted average: give more weight to earlier chunks (intro/abstract matters more)
-    weights = np.array([1.0 / (1 + 0.1 * i) for i in range(len(chunk_embeddings))])
-    weights /= weights.sum()  # normalize
+    # Encode each distinct unknown chunk once
+    todo = {}  # chunk hash -> index of its first occurrence
+    for j, key in enumerate(keys):
+        if key not in known and key not in todo:
+            todo[key] = j
+    if todo:
+        backend = backend or _get_backend()
+        order = sorted(todo.values(), key=lambda j: len(chunks[j]))
+        encoded = backend.encode([chunks[j] for j in order], batch_size=ENCODE_BATCH_SIZE)
+        fresh = {keys[j]: vec for j, vec in zip(order, encoded)}
+        if chunk_cache is not None:
+            chunk_cache.put_many(fresh)
+        known = {**known, **fresh}
     
-    # Weighted average embedding
-    avg_embedding = np.average(chunk_embeddings, axis=0, weights=weights)
+    chunk_embeddings = np.stack([known[key] for key in keys]).astype(np.float32, copy=False)
     
-    # Normalize to unit vector (cosine similarity works better with normalized vectors)
-    norm = np.linalg.norm(avg_embedding)
-    if norm > 0:
-        avg_embedding /= norm
+    # Weighted sum per document, then normalize to unit length
+    # (the weights' scale cancels out, so no per-document weight normalization needed)
+    np.add.at(result, np.array(owners), chunk_embeddings * np.array(weights, dtype=np.float32)[:, None])
+    norms = np.linalg.norm(result, axis=1, keepdims=True)
+    np.divide(result, norms, out=result, where=norms > 0)
     
-    return avg_embedding
+    return result
+
+
+class QueryBatcher:
+    """
+    Micro-batches search queries into shared model.encode calls.
+
+    Each caller enqueues its query and blocks; one worker thread takes the
+    first waiting query, collects whatever else arrives within QUERY_BATCH_MS
+    (up to QUERY_BATCH_MAX), and encodes them all at once. Under load, N
+    concurrent searches cost one encode call instead of N competing with
+    the ingest pipeline for the model.
+    """
+
+    def __init__(self, window_ms: float = QUERY_BATCH_MS, max_batch: int = QUERY_BATCH_MAX, backend: EmbeddingBackend = None):
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.backend = backend
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def embed(self, text: str, timeout: float = 30.0) -> np.ndarray:
+        """Unit vector for one query (truncated to one chunk, as the model would anyway)."""
+        request = {"text": text.strip()[:CHUNK_SIZE], "done": threading.Event()}
+        self._ensure_worker()
+        self._queue.put(request)
+        if not request["done"].wait(timeout):
+            raise TimeoutError("Query embedding timed out")
+        if "error" in request:
+            raise request["error"]
+        return request["vector"]
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True, name="query-batcher")
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._encode(batch)
+
+    def _encode(self, batch: list):
+        try:
+            texts = list(dict.fromkeys(r["text"] for r in batch))  # identical queries encoded once
+            vectors = (self.backend or _get_backend()).encode(texts, batch_size=len(texts))
+            by_text = dict(zip(texts, vectors))
+            for r in batch:
+                r["vector"] = by_text[r["text"]]
+        except Exception as e:
+            for r in batch:
+                r["error"] = e
+        finally:
+            for r in batch:
+                r["done"].set()
+
+
+_query_batcher = QueryBatcher()
+
+
+def embed_query(text: str) -> np.ndarray:
+    """Embed a search query; concurrent calls share one model.encode batch."""
+    return _query_batcher.embed(text)
+
+
+def chunk_hashes(text: str) -> list[str]:
+    """Hashes of the chunks a document is embedded from, in order."""
+    return [_chunk_hash(c) for c in _document_chunks(text)]
+
+
+def _chunk_hash(chunk: str) -> str:
+    return hashlib.blake2b(chunk.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def _document_chunks(text: str) -> list[str]:
+    """The pieces of one document that get embedded."""
+    if not text or not text.strip():
+        return []
+    text = text.strip()
+    if len(text) <= CHUNK_SIZE:
+        return [text]
+    return _split_into_chunks(text)
 
 
 def _split_into_chunks(text: str) -> list[str]:
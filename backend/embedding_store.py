@@ -0,0 +1,156 @@
+import os
+import mmap
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+# float16 halves memory again; cosine geometry is unaffected at this precision
+EMBED_DTYPE = os.getenv("SEFS_EMBED_DTYPE", "float32")
+# 1 = keep the matrix in a memory-mapped file (cache dir) instead of RAM, for very large corpora
+EMBEDDINGS_MMAP = os.getenv("SEFS_EMBEDDINGS_MMAP", "0") == "1"
+
+
+class EmbeddingStore:
+    """
+    All document embeddings in one growable, row-indexed matrix.
+
+    - Rows are L2-normalized on the way in (zero vectors stay zero).
+    - path → row map; a deleted file's row goes on a free list and is reused.
+    - matrix() hands out a zero-copy view of the live rows, so reclustering
+      no longer gathers n separate arrays into a new one every time.
+
+    Views are only valid until the next mutation: take them and use them
+    under pipeline_lock, like the rest of state.
+
+    With a path, the matrix lives in a memory-mapped file: only the rows
+    being touched are resident, and release_pages() hands them back to the
+    OS, so streaming over it in blocks keeps memory at one block.
+    """
+
+    def __init__(self, dim: int = 384, dtype=EMBED_DTYPE, capacity: int = 1024, path: str = None):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        if path is None:
+            self._data = np.zeros((capacity, dim), dtype=self.dtype)
+        else:
+            # Rows are rebuilt at startup (from the document cache), so start from an empty file
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._data = np.memmap(path, dtype=self.dtype, mode="w+", shape=(capacity, dim))
+        self._paths = []      # row -> path (None for a free row)
+        self._rows = {}       # path -> row
+        self._free = []       # free rows below len(self._paths)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, path):
+        return path in self._rows
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    def set(self, path: str, vector):
+        """Add or overwrite the embedding for a path."""
+        vec = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec = vec / norm
+        with self._lock:
+            row = self._rows.get(path)
+            if row is None:
+                row = self._allocate()
+                self._rows[path] = row
+                self._paths[row] = path
+            self._data[row] = vec
+
+    def get(self, path: str):
+        """Row view for a path, or None."""
+        with self._lock:
+            row = self._rows.get(path)
+            return None if row is None else self._data[row]
+
+    def remove(self, path: str):
+        with self._lock:
+            row = self._rows.pop(path, None)
+            if row is None:
+                return
+            self._paths[row] = None
+            if row == len(self._paths) - 1:
+                self._paths.pop()
+            else:
+                self._free.append(row)
+
+    def rename(self, old_path: str, new_path: str):
+        with self._lock:
+            row = self._rows.pop(old_path, None)
+            if row is None:
+                return
+            self._rows[new_path] = row
+            self._paths[row] = new_path
+
+    def clear(self):
+        with self._lock:
+            self._paths = []
+            self._rows = {}
+            self._free = []
+
+    def release_pages(self):
+        """Drop the resident pages of a memory-mapped matrix (no-op in RAM; the data stays in the file)."""
+        if self.path is not None and hasattr(mmap, "MADV_DONTNEED"):
+            with self._lock:
+                self._data._mmap.madvise(mmap.MADV_DONTNEED)
+
+    @contextmanager
+    def reading(self):
+        """Hold the store still (no writes, no compaction) while using matrix() views."""
+        with self._lock:
+            yield
+
+    def matrix(self):
+        """
+        Return (paths, view): the live rows as one contiguous (n, dim) view
+        and the path of each row. Compacts first if deletes left holes.
+        """
+        with self._lock:
+            self._compact()
+            n = len(self._paths)
+            return list(self._paths), self._data[:n]
+
+    # ── Internals ────────────────────────────────────────────────
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        row = len(self._paths)
+        if row >= len(self._data):
+            rows = max(2 * len(self._data), 1024)
+            if self.path is None:
+                grown = np.zeros((rows, self.dim), dtype=self.dtype)
+                grown[:row] = self._data[:row]
+            else:
+                # Extend the file in place; existing rows don't move
+                self._data.flush()
+                os.truncate(self.path, rows * self.dim * self.dtype.itemsize)
+                grown = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(rows, self.dim))
+            self._data = grown
+        self._paths.append(None)
+        return row
+
+    def _compact(self):
+        """Move trailing live rows into holes so rows [0, n) are all live."""
+        holes = sorted(self._free)
+        self._free = []
+        for hole in holes:
+            while self._paths and self._paths[-1] is None:
+                self._paths.pop()
+            if hole >= len(self._paths):
+                break
+            last = len(self._paths) - 1
+            path = self._paths.pop()
+            self._data[hole] = self._data[last]
+            self._paths[hole] = path
+            self._rows[path] = hole
+        while self._paths and self._paths[-1] is None:
+            self._paths.pop()
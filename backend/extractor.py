@@ -1,53 +1,150 @@
-import fitz  # PyMuPDF
-import chardet
+import os
+import codecs
 from pathlib import Path
 
-def extract_text(file_path: str) -> str:
+# PyMuPDF and chardet are imported where used: they're slow to import and
+# only needed once files actually arrive (mostly inside extraction workers).
+
+MAX_PDF_PAGES = 10  # never read more pages than this from one PDF
+
+# Sampling mode for long PDFs: read the first, middle and last pages instead of
+# only the first MAX_PDF_PAGES (a report's conclusion is often more telling than page 9)
+PDF_SAMPLING = os.getenv("SEFS_PDF_SAMPLING", "0") == "1"
+PDF_SAMPLE_MIN_PAGES = 30  # only sample PDFs at least this long
+
+# Charset detection (pure Python, slow) only ever sees a sample this big
+TXT_SNIFF_BYTES = 64 * 1024
+
+
+def extract_text(file_path: str, char_budget: int = None) -> str:
     """
     Extract clean text from PDF or text file.
     Returns empty string on failure (never crashes the pipeline).
+    
+    char_budget: stop reading once this many characters are extracted
+    (the embedder ignores anything past its own budget anyway). None = no limit.
+    """
+    return extract_document(file_path, char_budget)[0]
+
+
+def extract_document(file_path: str, char_budget: int = None) -> tuple[str, bool]:
+    """
+    Like extract_text, but returns (text, truncated): truncated is True when
+    part of the file was never read — pages past MAX_PDF_PAGES or skipped by
+    sampling, or text past char_budget — so the text is only a sample.
     """
     path = Path(file_path)
     
     try:
         if path.suffix.lower() == '.pdf':
-            return _extract_pdf(file_path)
+            return _extract_pdf(file_path, char_budget)
         elif path.suffix.lower() == '.txt':
-            return _extract_txt(file_path)
+            return _extract_txt(file_path, char_budget)
     except Exception as e:
         print(f"[EXTRACTOR] Failed to extract {file_path}: {e}")
-        return ""
+        return "", False
     
-    return ""
+    return "", False
 
 
-def _extract_pdf(file_path: str) -> str:
-    """Extract text from PDF using PyMuPDF."""
-    doc = fitz.open(file_path)
-    text_parts = []
+def _extract_pdf(file_path: str, char_budget: int = None, sample: bool = None) -> tuple[str, bool]:
+    """
+    Extract text from PDF using PyMuPDF, stopping once char_budget is filled.
     
-    for page_num in range(min(doc.page_count, 10)):  # limit to first 10 pages
-        page = doc[page_num]
-        text_parts.append(page.get_text())
+    In sampling mode the budget is shared: each page group (head, middle,
+    tail) gets an equal part of what the groups before it left over, so the
+    first pages can't use it all up.
+    """
+    if sample is None:
+        sample = PDF_SAMPLING
     
-    doc.close()
-    full_text = "\n".join(text_parts)
+    import fitz  # PyMuPDF
     
-    # Clean up whitespace
-    lines = [line.strip() for line in full_text.split('\n') if line.strip()]
-    return " ".join(lines)
+    doc = fitz.open(file_path)
+    try:
+        groups = _pdf_page_groups(doc.page_count, sample)
+        truncated = sum(len(g) for g in groups) < doc.page_count
+        parts = []
+        total = 0
+        for i, group in enumerate(groups):
+            limit = total + (char_budget - total) // (len(groups) - i) if char_budget else None
+            for n, page_num in enumerate(group):
+                page_text = _page_text(doc, page_num)
+                if not page_text:
+                    continue
+                if limit and total + len(page_text) + 1 > limit:
+                    parts.append(page_text[:max(limit - total - 1, 0)])
+                    total = limit
+                    truncated = True
+                    break
+                parts.append(page_text)
+                total += len(page_text) + 1
+    finally:
+        doc.close()
+    return " ".join(p for p in parts if p), truncated
+
+
+def _page_text(doc, page_num: int) -> str:
+    """One page's text, whitespace collapsed per line ("" for an empty page)."""
+    text = doc[page_num].get_text()
+    return " ".join(line.strip() for line in text.split('\n') if line.strip())
+
+
+def _pdf_page_groups(page_count: int, sample: bool) -> list[list[int]]:
+    """Page numbers to read, as [head] or, when sampling, [head, middle, tail]."""
+    if not sample or page_count < PDF_SAMPLE_MIN_PAGES:
+        return [list(range(min(page_count, MAX_PDF_PAGES)))]
+    
+    # First pages carry the most weight in the embedding, so read them first
+    n_tail = MAX_PDF_PAGES // 3
+    n_head = MAX_PDF_PAGES - 2 * n_tail
+    mid = page_count // 2 - n_tail // 2
+    return [list(range(n_head)), list(range(mid, mid + n_tail)), list(range(page_count - n_tail, page_count))]
 
 
-def _extract_txt(file_path: str) -> str:
-    """Extract text from .txt file with auto-encoding detection."""
+def _extract_txt(file_path: str, char_budget: int = None) -> tuple[str, bool]:
+    """
+    Extract text from .txt file with auto-encoding detection.
+    
+    Reads at most the bytes char_budget characters can take (files past the
+    budget are never fully loaded), decodes as strict UTF-8 first, and only
+    runs charset detection — on a sample around the first invalid byte —
+    when that fails.
+    """
     with open(file_path, 'rb') as f:
-        raw = f.read()
+        if char_budget:
+            raw = f.read(char_budget * 4)  # ≤ 4 bytes per character in any common encoding
+            truncated = bool(f.read(1))
+        else:
+            raw = f.read()
+            truncated = False
+    
+    # A UTF-16/32 byte-order mark names the encoding outright (check 32 first: its LE BOM starts like 16's)
+    encoding = 'utf-8'
+    for bom, name in ((codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+                      (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')):
+        if raw.startswith(bom):
+            encoding = name
+            break
     
-    # Auto-detect encoding (handles UTF-8, Latin-1, etc.)
-    detected = chardet.detect(raw)
-    encoding = detected.get('encoding', 'utf-8') or 'utf-8'
+    try:
+        # Incremental decoder: a multi-byte character cut at the read limit isn't an error
+        text = codecs.getincrementaldecoder(encoding)('strict').decode(raw, final=not truncated)
+        text = text.lstrip('\ufeff')
+    except UnicodeDecodeError as e:
+        import chardet
+        
+        sample = raw[:TXT_SNIFF_BYTES // 2] + raw[max(e.start - 1024, TXT_SNIFF_BYTES // 2):e.start + TXT_SNIFF_BYTES // 2]
+        detected = chardet.detect(sample)
+        encoding = detected.get('encoding', 'utf-8') or 'utf-8'
+        try:
+            text = raw.decode(encoding, errors='replace')
+        except LookupError:
+            text = raw.decode('utf-8', errors='replace')
     
-    return raw.decode(encoding, errors='replace')
+    if char_budget and len(text) > char_budget:
+        return text[:char_budget], True
+    return text, truncated
 
 
 def get_snippet(text: str, length: int = 200) -> str:
@@ -0,0 +1,239 @@
+import os
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
+
+from extractor import extract_document
+from embedder import embed_many, TEXT_BUDGET
+from doc_cache import content_hash
+
+# ─── Configuration ───────────────────────────────────────────────
+# Extraction runs in worker processes (PyMuPDF + decoding are CPU-bound and
+# would otherwise serialize behind the GIL). 0 = extract inline on the caller.
+EXTRACT_WORKERS = int(os.getenv("SEFS_EXTRACT_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+# Max documents in flight between the extract and embed stages (backpressure)
+QUEUE_SIZE = int(os.getenv("SEFS_INGEST_QUEUE_SIZE", "64"))
+# Max documents per embed_many() call
+EMBED_BATCH = int(os.getenv("SEFS_EMBED_BATCH_FILES", "256"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_DONE = object()
+
+
+def _get_pool():
+    """Lazily start the extraction pool (spawn: safe with the server's threads)."""
+    global _pool
+    if EXTRACT_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            print(f"[INGEST] Extraction pool started ({EXTRACT_WORKERS} workers)")
+        return _pool
+
+
+def _replace_pool(broken):
+    """A worker died (segfault, OOM kill): the pool is unusable for good. Drop it; _get_pool starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            print("[INGEST] Extraction worker died; restarting the pool")
+
+
+def shutdown():
+    """Stop the extraction pool (called on server shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def load_documents(file_paths: list, cache, chunk_cache=None, near_dups=None, no_reuse=()):
+    """
+    Staged ingest: hash → (cache hit | extract in a worker process) → embed.
+
+    Yields (file_path, content_hash, text, embedding, cached, truncated) as
+    documents become ready — NOT in input order. Extraction of later files overlaps
+    with embedding of earlier ones; at most QUEUE_SIZE documents are held
+    between the two stages, so memory stays flat however many files arrive.
+    Unreadable files are skipped; files with no text are yielded with text "",
+    and files whose extraction failed (its worker died) with text None —
+    those are not cached, so they are tried again next time. truncated marks
+    text that is only a sample of the file (see extractor.extract_document).
+    A chunk_cache lets edited documents re-encode only their changed chunks.
+
+    Duplicates cost one document: copies of a file already being extracted
+    wait for it and share its text and embedding (yielded as cached), and
+    with a near_dups index (dedup.NearDuplicateIndex) a near-copy of an
+    earlier document reuses that document's embedding instead of encoding.
+    Paths in no_reuse (files already tracked, i.e. edits) are always encoded:
+    an edit is by nature a near-copy of the previous version. A near-copy's
+    text is cached under its own hash, pointing at the canonical's vector.
+    """
+    if not file_paths:
+        return
+
+    slots = threading.Semaphore(QUEUE_SIZE)
+    results = queue.Queue()  # never holds more than QUEUE_SIZE items (see slots)
+    stop = threading.Event()
+    waiting = {}  # content hash being extracted -> copies waiting for it
+    waiting_lock = threading.Lock()
+
+    def _acquire_slot() -> bool:
+        while not stop.is_set():
+            if slots.acquire(timeout=0.5):
+                return True
+        return False
+
+    def _submit(file_path, key, retries=1):
+        """Extract in the pool; a dead pool is replaced and the file resubmitted (up to `retries` times)."""
+        pool = _get_pool()
+        try:
+            future = pool.submit(extract_document, file_path, TEXT_BUDGET)
+        except BrokenProcessPool:
+            _replace_pool(pool)
+            if retries > 0:
+                return _submit(file_path, key, retries - 1)
+            results.put((file_path, key, None, (None, False)))
+            return
+        future.add_done_callback(partial(_on_extracted, file_path, key, pool, retries))
+
+    def _on_extracted(file_path, key, pool, retries, future):
+        try:
+            extracted = future.result()
+        except BrokenProcessPool:
+            # Every file in flight fails with the worker that died; each gets one
+            # retry on a fresh pool (the file that crashed it will fail again)
+            _replace_pool(pool)
+            if retries > 0 and not stop.is_set():
+                return _submit(file_path, key, retries - 1)
+            print(f"[INGEST] Extraction worker died on {Path(file_path).name}")
+            extracted = (None, False)
+        except Exception as e:
+            print(f"[INGEST] Extraction worker failed for {Path(file_path).name}: {e}")
+            extracted = (None, False)
+        results.put((file_path, key, None, extracted))
+
+    def _produce():
+        pool = _get_pool()
+        produced = 0
+        try:
+            for file_path in file_paths:
+                if not _acquire_slot():
+                    return
+                try:
+                    key = content_hash(file_path)
+                except OSError as e:
+                    print(f"[INGEST] Could not read {Path(file_path).name}: {e}")
+                    slots.release()
+                    continue
+
+                hit = cache.get(key)
+                if hit is None:
+                    with waiting_lock:
+                        if key in waiting:
+                            # Same bytes as a file still in flight — ride along with it
+                            waiting[key].append(file_path)
+                            slots.release()
+                            continue
+                        waiting[key] = []
+                if hit is not None:
+                    results.put((file_path, key, hit, None))
+                elif pool is None:
+                    results.put((file_path, key, None, extract_document(file_path, TEXT_BUDGET)))
+                else:
+                    _submit(file_path, key)
+                produced += 1
+        except Exception as e:
+            print(f"[INGEST] Producer error: {e}")
+        finally:
+            results.put((_DONE, produced, None, None))
+
+    producer = threading.Thread(target=_produce, daemon=True)
+    producer.start()
+
+    expected = None
+    received = 0
+    batch = []  # (file_path, key, text, truncated) awaiting embedding
+
+    def _flush():
+        docs = [b for b in batch if b[2] and b[2].strip()]
+        reuse = {}  # file_path -> embedding of its near-duplicate
+        borrowed = {}  # file_path -> content hash of that near-duplicate
+        if near_dups is not None:
+            # Look up only: documents join near_dups with their path, in _file_record
+            earlier = {}  # content hash -> fingerprint, for this batch's documents so far
+            for file_path, key, text, _ in docs:
+                fingerprint = near_dups.fingerprint(key, text)
+                canonical = None if file_path in no_reuse else near_dups.nearest(key, fingerprint, earlier.items())
+                earlier.setdefault(key, fingerprint)
+                if canonical is None:
+                    continue
+                if canonical in earlier:
+                    reuse[file_path] = canonical  # embedded in this same batch
+                else:
+                    hit = cache.get(canonical)
+                    if hit is None or hit["embedding"] is None:
+                        continue
+                    reuse[file_path] = hit["embedding"]
+                borrowed[file_path] = canonical
+        to_embed = [b for b in docs if b[0] not in reuse]
+        vectors = embed_many([text for _, _, text, _ in to_embed], chunk_cache=chunk_cache) if to_embed else []
+        embeddings = {fp: vec for (fp, _, _, _), vec in zip(to_embed, vectors)}
+        by_key = {key: vec for (_, key, _, _), vec in zip(to_embed, vectors)}
+        for file_path, key, _, _ in docs:  # batch order: a canonical resolves before its copies
+            if file_path in reuse:
+                canonical = reuse[file_path]
+                embeddings[file_path] = by_key.get(canonical) if isinstance(canonical, str) else canonical
+                by_key[key] = embeddings[file_path]
+        if reuse:
+            print(f"[INGEST] {len(reuse)} near-duplicate(s) reused an existing embedding")
+        done = list(batch)
+        batch.clear()
+        for file_path, key, text, truncated in done:
+            embedding = embeddings.get(file_path)
+            if text is not None and (text.strip() or os.path.exists(file_path)):
+                # Don't cache "no text" for a file that vanished mid-extraction. A near-copy
+                # is cached as pointing at its canonical's vector, not with one of its own
+                cache.put(key, text, embedding, truncated, borrowed_from=borrowed.get(file_path))
+            with waiting_lock:
+                copies = waiting.pop(key, [])
+            slots.release()
+            yield file_path, key, text, embedding, False, truncated
+            for copy in copies:
+                yield copy, key, text, embedding, True, truncated
+
+    try:
+        while expected is None or received < expected:
+            file_path, key, hit, extracted = results.get()
+            if file_path is _DONE:
+                expected = key
+            else:
+                received += 1
+                if hit is not None:
+                    slots.release()
+                    truncated = hit["truncated"]
+                    if truncated is None:  # cached before the flag was recorded
+                        truncated = len(hit["text"]) >= TEXT_BUDGET
+                    yield file_path, key, hit["text"], hit["embedding"], True, truncated
+                else:
+                    batch.append((file_path, key, *extracted))
+
+            # Embed what's ready instead of idling while workers extract
+            if batch and (len(batch) >= EMBED_BATCH or results.empty()):
+                yield from _flush()
+        if batch:
+            yield from _flush()
+    finally:
+        stop.set()
@@ -0,0 +1,235 @@
+import os
+import threading
+import numpy as np
+
+from clusterer import iter_blocks, sample_rows
+
+# Refit the layout in the background once this share of nodes is new since the last fit
+LAYOUT_REFIT_FRACTION = float(os.getenv("SEFS_LAYOUT_REFIT_FRACTION", "0.2"))
+_UMAP_MIN_SAMPLES = 15  # below this UMAP isn't meaningful; PCA is used
+
+
+def _pad3(points) -> np.ndarray:
+    points = np.asarray(points, dtype=float)
+    if points.shape[1] >= 3:
+        return points[:, :3]
+    padded = np.zeros((len(points), 3))
+    padded[:, :points.shape[1]] = points
+    return padded
+
+
+class _Reducer:
+    """A fitted reducer whose transform always yields (m, 3); no model = first 3 dims."""
+
+    def __init__(self, model=None, kind: str = "pad"):
+        self.model = model
+        self.kind = kind
+
+    def transform(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if self.model is None:
+            return _pad3(X[:, :3])
+        return _pad3(self.model.transform(X))
+
+
+def fit_reducer(embeddings, method: str = "auto"):
+    """
+    Fit a 3D reducer to embeddings. Returns (reducer, positions).
+    method: "pca", "umap", or "auto" (PCA below 15 samples, UMAP from 15).
+    Falls back to PCA if UMAP is missing or fails.
+    """
+    from sklearn.decomposition import PCA
+    X = np.asarray(embeddings, dtype=np.float32)
+    n_samples = len(X)
+
+    if n_samples < 3:
+        return _Reducer(), _pad3(X[:, :3])
+
+    if method == "umap" or (method == "auto" and n_samples >= _UMAP_MIN_SAMPLES):
+        try:
+            import umap
+            model = umap.UMAP(n_components=3, random_state=42, init="random", n_neighbors=min(15, n_samples - 1))
+            return _Reducer(model, "umap"), model.fit_transform(X)
+        except ImportError:
+            print("UMAP not available, falling back to PCA")
+        except Exception as e:
+            print(f"UMAP error: {e}, falling back to PCA")
+
+    try:
+        model = PCA(n_components=min(3, X.shape[1], n_samples), random_state=42)
+        return _Reducer(model, "pca"), _pad3(model.fit_transform(X))
+    except Exception as e:
+        print(f"PCA error: {e}")
+        return _Reducer(), np.random.randn(n_samples, 3)
+
+
+_IDENTITY = (0.0, np.eye(3), 1.0, 0.0)
+
+
+def _procrustes(source, target):
+    """Similarity transform (rotation/reflection, scale, shift) taking source closest to target."""
+    mu_s, mu_t = source.mean(axis=0), target.mean(axis=0)
+    s0, t0 = source - mu_s, target - mu_t
+    norm = (s0 ** 2).sum()
+    if len(source) < 3 or norm == 0 or (t0 ** 2).sum() == 0:
+        return mu_s, np.eye(3), 1.0, mu_s
+    u, sigma, vt = np.linalg.svd(s0.T @ t0)
+    return mu_s, u @ vt, sigma.sum() / norm, mu_t
+
+
+def _apply(align, points) -> np.ndarray:
+    mu_s, rotation, scale, mu_t = align
+    return (np.asarray(points, dtype=float) - mu_s) @ rotation * scale + mu_t
+
+
+class LayoutEngine:
+    """
+    Stable 3D positions for the graph without refitting on every recluster.
+
+    - Nodes that already have a position keep it.
+    - New nodes are projected with the fitted reducer's transform().
+    - The first layout is a quick PCA. UMAP is fitted later on a background
+      thread, and again whenever LAYOUT_REFIT_FRACTION of the nodes are new
+      since the last fit. Each refit is Procrustes-aligned onto the current
+      positions, so the graph settles instead of jumping, and is handed to
+      on_refit({ key: position }).
+
+    Recluster cost is therefore a transform of the new points, never a fit.
+
+    For corpora clustered out of core, place(sample=...) keeps memory at one
+    block: PCA is fitted on a random sample of rows, in the pipeline (no
+    background copy of the matrix, no UMAP), and every other row is
+    projected block by block.
+    """
+
+    def __init__(self, on_refit=None):
+        self.on_refit = on_refit
+        self._reducer = None
+        self._align = None
+        self._fitted_n = 0
+        self._changes = 0
+        self._umap_failed = False
+        self._refitting = False
+        self._generation = 0  # bumped by reset(); a refit started before it is dropped
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._generation += 1
+            self._reducer = None
+            self._align = None
+            self._fitted_n = 0
+            self._changes = 0
+
+    def place(self, keys: list, embeddings, known: list, sample: int = None, release=None) -> np.ndarray:
+        """
+        Positions (n, 3) for all rows. known[i] is row i's current position,
+        or None if it has none yet. keys identify rows in on_refit callbacks.
+        With sample (and more rows than that), see _place_sampled; release
+        runs after each block read, as for clusterer.iter_blocks.
+        """
+        n = len(embeddings)
+        out = np.zeros((n, 3))
+        missing = [i for i, p in enumerate(known) if p is None]
+        for i, p in enumerate(known):
+            if p is not None:
+                out[i] = p
+
+        if sample is not None and n > sample:
+            return self._place_sampled(embeddings, known, out, missing, sample, release)
+
+        if missing:
+            if self._reducer is None:
+                # First layout: a quick PCA now, UMAP follows in the background
+                reducer, pos = fit_reducer(embeddings, method="pca")
+                placed = [i for i in range(n) if known[i] is not None]
+                align = _procrustes(pos[placed], out[placed]) if placed else _IDENTITY
+                with self._lock:
+                    self._reducer, self._align, self._fitted_n = reducer, align, n
+                out[missing] = _apply(align, pos[missing])
+            else:
+                out[missing] = self.project(embeddings[missing])
+
+        if self._needs_refit(n):
+            self._start_refit(keys, embeddings, out)
+        return out
+
+    def _place_sampled(self, embeddings, known, out, missing, sample, release):
+        """
+        place() for a matrix too big to copy. The PCA is (re)fitted on
+        `sample` random rows when there is none yet, or once the usual
+        share of new nodes is reached; a refit re-projects every row, aligned
+        onto the sample's current positions. Otherwise only new rows are projected.
+        """
+        n = len(embeddings)
+        with self._lock:
+            reducer, align = self._reducer, self._align
+            refit = (reducer is None or reducer.kind == "umap"
+                     or self._changes + len(missing) > LAYOUT_REFIT_FRACTION * max(self._fitted_n, 1))
+        if refit:
+            picks, X = sample_rows(embeddings, size=sample, release=release)
+            reducer, pos = fit_reducer(X, method="pca")
+            placed = [j for j, i in enumerate(picks) if known[i] is not None]
+            align = _procrustes(pos[placed], out[picks[placed]]) if placed else _IDENTITY
+            with self._lock:
+                self._reducer, self._align = reducer, align
+                self._fitted_n, self._changes = n, 0
+            print(f"[LAYOUT] Fitted pca layout on a {len(X)}-row sample of {n} files")
+            todo = np.arange(n)
+        else:
+            with self._lock:
+                self._changes += len(missing)
+            todo = np.asarray(missing, dtype=np.int64)
+        if len(todo):
+            for start, block in iter_blocks(embeddings, todo, release=release):
+                out[todo[start:start + len(block)]] = _apply(align, reducer.transform(block))
+        return out
+
+    def project(self, vectors) -> np.ndarray:
+        """Positions for new points under the current layout."""
+        with self._lock:
+            reducer, align = self._reducer, self._align
+            self._changes += len(vectors)
+        if reducer is None:
+            return _pad3(np.asarray(vectors)[:, :3])
+        return _apply(align, reducer.transform(vectors))
+
+    def _needs_refit(self, n: int) -> bool:
+        with self._lock:
+            if self._reducer is None or self._refitting:
+                return False
+            wants_umap = n >= _UMAP_MIN_SAMPLES and not self._umap_failed
+            if wants_umap and self._reducer.kind != "umap":
+                return True
+            return self._changes > LAYOUT_REFIT_FRACTION * max(self._fitted_n, 1)
+
+    def _start_refit(self, keys, embeddings, current):
+        with self._lock:
+            if self._refitting:
+                return
+            self._refitting = True
+        # Copies: the caller's matrix view changes as soon as state does
+        X = np.array(embeddings, dtype=np.float32)
+        args = (list(keys), X, np.array(current), self._generation)
+        threading.Thread(target=self._refit, args=args, daemon=True).start()
+
+    def _refit(self, keys, X, current, generation):
+        try:
+            reducer, pos = fit_reducer(X)
+            reducer.transform(X[:1])  # first transform compiles (UMAP/numba) — do it here, not in the pipeline
+            align = _procrustes(pos, current)
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self._reducer, self._align = reducer, align
+                self._fitted_n, self._changes = len(X), 0
+                if reducer.kind != "umap" and len(X) >= _UMAP_MIN_SAMPLES:
+                    self._umap_failed = True
+            print(f"[LAYOUT] Refitted {reducer.kind} layout on {len(X)} files")
+            if self.on_refit:
+                self.on_refit(dict(zip(keys, _apply(align, pos))))
+        except Exception as e:
+            print(f"[LAYOUT] Refit failed: {e}")
+        finally:
+            with self._lock:
+                self._refitting = False
@@ -7,18 +7,27 @@ import threading
 import platform
 import subprocess
 import logging
-import numpy as np
+import hashlib
 from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from typing import List, Dict
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from watcher import start_watcher
 from extractor import extract_text, get_snippet
-from embedder import embed_text
-from clusterer import cluster_embeddings, get_3d_positions, name_all_clusters, get_cluster_color, CATEGORY_MAP
-from organiser import sync_folders, build_cluster_map
+from clusterer import cluster_embeddings, get_cluster_color, sub_cluster_files
+from layout import LayoutEngine
+from vector_index import VectorIndex
+from dedup import NearDuplicateIndex
+import clusterer
+from organiser import sync_folders, sync_nested_folders, build_cluster_map
+from doc_cache import DocumentCache, ChunkCache, TextStore, CategoryCache, CACHE_DIR
+import embedder
+import ingest
 import state
 
 # ─── Suppress noisy loggers ──────────────────────────────────────
@@ -44,15 +53,65 @@ app.add_middleware(
 connected_clients: list[WebSocket] = []
 main_loop: asyncio.AbstractEventLoop = None
 pipeline_lock = threading.Lock()
+ingesting: set = set()       # paths an _ingest_many call is extracting / embedding right now
+ingest_again: set = set()    # ...that got another event meanwhile; re-checked once that call is done
 ignore_paths: dict = {}  # norm_path -> timestamp
 IGNORE_TTL = 15.0  # seconds to ignore a path after internal move (increased for manual moves)
 
+# Content-addressed cache: unchanged files skip extraction + embedding on restart
+doc_cache = DocumentCache(CACHE_DIR, embedder.cache_signature(), dim=embedder.EMBEDDING_DIM)
+# Per-chunk vectors: an edited file only re-encodes the chunks whose text changed
+chunk_cache = ChunkCache(CACHE_DIR, embedder.cache_signature(), dim=embedder.EMBEDDING_DIM)
+# Full text lives on disk (doc_cache) behind a bounded LRU, not in state.files
+text_store = TextStore(doc_cache, loader=lambda fp: extract_text(fp, embedder.TEXT_BUDGET))
+# Keyword category scores per (content, name), versioned by CATEGORY_MAP
+category_cache = CategoryCache(CACHE_DIR)
+# Fitted 3D reducer: existing nodes keep their positions, refits happen in the background
+layout = LayoutEngine(on_refit=lambda positions: _apply_layout(positions))
+# k-NN over the embedding matrix (exact, or HNSW for large corpora); kept in step by _store_embedding & co.
+vector_index = VectorIndex(state.embeddings)
+# SimHash fingerprints by content hash: near-copies reuse an earlier document's embedding
+near_dups = NearDuplicateIndex()
+
 # ─── Batched Recluster Scheduler ─────────────────────────────────
 _RECLUSTER_DELAY = 5.0          # wait this long after last file event
 _recluster_timer = None
 _recluster_timer_lock = threading.Lock()
 _startup_done = False
 
+# ─── Incremental Assignment ──────────────────────────────────────
+# New files join their best existing cluster (keyword category, else the
+# nearest centroid) instead of triggering a full recluster. A full recluster
+# still runs once enough has changed since the last one, or on a schedule.
+INCREMENTAL_ASSIGN = os.getenv("SEFS_INCREMENTAL", "1") == "1"
+_MAX_DRIFT = float(os.getenv("SEFS_RECLUSTER_DRIFT", "0.25"))            # changed files / files at last full recluster
+_MAX_IMBALANCE = float(os.getenv("SEFS_RECLUSTER_IMBALANCE", "0.2"))     # growth of the largest cluster's share
+_MIN_SIMILARITY = float(os.getenv("SEFS_ASSIGN_MIN_SIMILARITY", "0.2"))  # below this a file fits no cluster
+_FULL_RECLUSTER_INTERVAL = float(os.getenv("SEFS_FULL_RECLUSTER_INTERVAL", "900"))  # seconds
+
+# ─── Sub-clustering ──────────────────────────────────────────────
+# Optional second level: every cluster of SUBCLUSTER_MIN_FILES+ files is split
+# into SEFS_<Cluster>/<Sub>/ folders, one cluster per worker. A cluster whose
+# members are unchanged since the last recluster keeps its previous split.
+SUBCLUSTER = os.getenv("SEFS_SUBCLUSTER", "0") == "1"
+SUBCLUSTER_MIN_FILES = int(os.getenv("SEFS_SUBCLUSTER_MIN_FILES", "20"))
+SUBCLUSTER_WORKERS = int(os.getenv("SEFS_SUBCLUSTER_WORKERS", "4"))
+_subcluster_memo = {}  # (cluster name, membership digest) -> { content_hash: sub name }
+
+# ─── Streaming Clustering ────────────────────────────────────────
+# From this many uncategorized files, KMeans streams over the embedding matrix
+# in blocks (clusterer.cluster_embeddings_streaming) instead of copying it;
+# with SEFS_EMBEDDINGS_MMAP=1 the matrix itself stays on disk. From this many
+# files in all, the layout and sub-clustering also work from row samples.
+STREAM_MIN_FILES = int(os.getenv("SEFS_STREAM_MIN_FILES", "200000"))
+
+# ─── Cluster Naming ──────────────────────────────────────────────
+# Reclusters use local (cached / keyword / TF-IDF) names; LLM names are fetched
+# on this worker, off pipeline_lock, and swapped in when they arrive.
+_naming_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="naming")
+_recluster_generation = 0  # bumped per full recluster; older naming results are dropped
+NAMING_SAMPLE = 200  # member texts a new cluster is named from
+
 
 # ─── WebSocket (all logging suppressed) ──────────────────────────
 @app.websocket("/ws")
@@ -119,12 +178,76 @@ def get_graph():
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "files": len(state.files), "clusters": len(state.clusters)}
+    return {
+        "status": "ok",
+        "ready": all(state.ready.values()),
+        "components": dict(state.ready),
+        "files": len(state.files),
+        "clusters": len(state.clusters),
+        "recluster": dict(state.recluster_stats),
+    }
 
 @app.get("/logs")
 def get_logs():
     return {"logs": state.get_recent_logs()}
 
+@app.get("/similar")
+def similar(path: str, k: int = 10):
+    """Files whose content is most similar to the given file."""
+    file_path = _tracked_path(path)
+    if file_path is None:
+        return {"status": "error", "message": "File is not tracked"}
+    k = max(1, min(k, 100))
+    t0 = time.perf_counter()
+    results = [_result_entry(fp, score) for fp, score in vector_index.neighbors(file_path, k)]
+    return {
+        "path": file_path,
+        "results": [r for r in results if r],
+        "took_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+
+@app.get("/search")
+def search(q: str, response: Response, k: int = 10):
+    """Semantic search: files whose content is closest in meaning to the query."""
+    if not q.strip():
+        return {"status": "error", "message": "Empty query"}
+    if not state.ready.get("embedder"):
+        # Don't queue behind the model load (up to QueryBatcher's timeout); the client retries
+        response.status_code = 503
+        return {"status": "starting", "message": "Embedding model is still loading", "results": []}
+    k = max(1, min(k, 100))
+    t0 = time.perf_counter()
+    query = embedder.embed_query(q)
+    results = [_result_entry(fp, score) for fp, score in vector_index.search(query, k)[0]]
+    return {
+        "query": q,
+        "results": [r for r in results if r],
+        "took_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+
+@app.get("/duplicates")
+def duplicates():
+    """Groups of tracked files with identical bytes ("exact") or near-identical text ("near")."""
+    with pipeline_lock:
+        tracked = [(fp, f["content_hash"], f.get("duplicate_of")) for fp, f in state.files.items()]
+    by_hash = {}
+    for fp, key, _ in tracked:
+        by_hash.setdefault(key, []).append(fp)
+    near = {}
+    for fp, _, canonical in tracked:
+        if canonical is not None:
+            near.setdefault(canonical, set()).add(fp)
+
+    groups = [{"kind": "exact", "files": sorted(paths)} for paths in by_hash.values() if len(paths) > 1]
+    for canonical, paths in near.items():
+        paths.update(by_hash.get(canonical, ()))
+        if len(paths) > 1:
+            groups.append({"kind": "near", "files": sorted(paths)})
+    return {
+        "groups": groups,
+        "redundant_files": sum(len(g["files"]) - 1 for g in groups),
+    }
+
 @app.get("/open")
 def open_file(path: str):
     try:
@@ -178,13 +301,40 @@ async def upload_files(files: List[UploadFile] = File(...)):
 def process_pipeline(event_type: str, file_path: str):
     """
     Called by watcher for EACH file event.
-    Ingests the single file (extract+embed+store) then schedules a
-    batched recluster. The recluster timer resets on every new file,
-    so rapid arrivals produce only ONE recluster at the end.
+    Ingests the single file (extract+embed+store), then places it into an
+    existing cluster if it can (see _place_new_files). Otherwise it schedules
+    a batched recluster: the timer resets on every new file, so rapid
+    arrivals produce only ONE recluster at the end.
     """
-    with pipeline_lock:
-        _ingest_one(event_type, file_path)
-    _schedule_recluster()
+    _ingest_one(event_type, file_path)
+    _place_or_schedule()
+
+
+def _tracked_path(path: str):
+    """The state.files key for a path as given by a client (case/slash-insensitive), or None."""
+    if path in state.files:
+        return path
+    norm = os.path.abspath(path).lower()
+    for fp in list(state.files):
+        if os.path.abspath(fp).lower() == norm:
+            return fp
+    return None
+
+
+def _result_entry(file_path: str, score: float):
+    """JSON-safe search/similarity hit for a tracked file (None if it just went away)."""
+    f = state.files.get(file_path)
+    if f is None:
+        return None
+    cluster = state.clusters.get(f.get("cluster_id"), {})
+    return {
+        "path": file_path,
+        "name": f.get("name", ""),
+        "score": round(float(score), 4),
+        "cluster_id": f.get("cluster_id"),
+        "cluster_name": cluster.get("name", "Unknown"),
+        "snippet": f.get("snippet", ""),
+    }
 
 
 def _is_ignored(file_path: str) -> bool:
@@ -202,89 +352,418 @@ def _is_ignored(file_path: str) -> bool:
 
 def _ingest_one(event_type: str, file_path: str):
     """Extract + embed + store ONE file. Does NOT cluster or move files."""
+    if event_type == 'deleted':
+        with pipeline_lock:
+            _remove_deleted(file_path)
+        return
+
+    if event_type not in ('created', 'modified'):
+        return
+
+    _ingest_many([file_path], event_type)
+
+
+def _remove_deleted(file_path: str):
+    """Drop a deleted file from state. Caller holds pipeline_lock."""
     file_name = Path(file_path).name
     norm_path = os.path.abspath(file_path).lower()
 
     if _is_ignored(file_path):
         return
 
-    if event_type == 'deleted':
-        removed = False
-        # Try exact path first
-        if file_path in state.files:
-            del state.files[file_path]
-            removed = True
-        else:
-            # Try normalized path match (handles case/slash differences)
-            for fp in list(state.files.keys()):
-                if os.path.abspath(fp).lower() == norm_path:
-                    del state.files[fp]
-                    removed = True
-                    break
-        if not removed:
-            # Last resort: match by filename where old path is also dead
-            for fp in list(state.files.keys()):
-                if state.files[fp]["name"] == file_name and not os.path.exists(fp):
-                    del state.files[fp]
-                    removed = True
-                    break
-        if removed:
-            log_and_broadcast("delete", f"Removed: {file_name}", "🗑️")
-            # Broadcast immediately so frontend sees the deletion right away
-            _broadcast_state()
-        return
+    removed = False
+    # Try exact path first
+    if file_path in state.files:
+        _forget_file(file_path)
+        removed = True
+    else:
+        # Try normalized path match (handles case/slash differences)
+        for fp in list(state.files.keys()):
+            if os.path.abspath(fp).lower() == norm_path:
+                _forget_file(fp)
+                removed = True
+                break
+    if not removed:
+        # Last resort: match by filename where old path is also dead
+        for fp in list(state.files.keys()):
+            if state.files[fp]["name"] == file_name and not os.path.exists(fp):
+                _forget_file(fp)
+                removed = True
+                break
+    if removed:
+        log_and_broadcast("delete", f"Removed: {file_name}", "🗑️")
+        # Broadcast immediately so frontend sees the deletion right away
+        _broadcast_state()
 
-    if event_type not in ('created', 'modified'):
-        return
+
+def _needs_ingest(event_type: str, file_path: str) -> bool:
+    """
+    Decide whether a created/modified path must be (re-)ingested.
+    Handles moved files and duplicate events in-place and returns False for them.
+    """
+    file_name = Path(file_path).name
+
+    if _is_ignored(file_path):
+        return False
 
     # Detect moved file: same filename exists in state at a path that no longer exists
     for fp in list(state.files.keys()):
         if fp != file_path and state.files[fp]["name"] == file_name and not os.path.exists(fp):
             # This file was moved — update its path in state
-            file_data = state.files.pop(fp)
-            file_data["path"] = file_path
-            state.files[file_path] = file_data
+            _rename_file(fp, file_path)
             log_and_broadcast("move", f"Moved: {file_name}", "📁")
-            return
+            return False
 
-    # Skip duplicate modified events for identical content
-    if file_path in state.files and event_type == 'modified':
-        return
+    # Tracked files that were touched are re-checked by content hash in _ingest_many
+    return os.path.exists(file_path)
 
-    if not os.path.exists(file_path):
-        return
 
-    log_and_broadcast("detect", f"Processing: {file_name}", "👁️")
+def _ingest_many(file_paths: list, event_type: str = "created"):
+    """
+    Extract + embed + store files. Does NOT cluster or move files.
+    Extraction and embedding run outside pipeline_lock (see ingest.load_documents);
+    the lock is only taken to read and update state.
+    """
+    with pipeline_lock:
+        # A path already in flight (watcher + reconcile, or an edit mid-extraction) is left
+        # to that call, which re-checks it when done
+        ingest_again.update(fp for fp in file_paths if fp in ingesting)
+        todo = [fp for fp in dict.fromkeys(file_paths) if fp not in ingesting and _needs_ingest(event_type, fp)]
+        previous = {fp: state.files[fp] for fp in todo if fp in state.files}
+        ingesting.update(todo)
+    for fp in todo:
+        if fp not in previous:
+            log_and_broadcast("detect", f"Processing: {Path(fp).name}", "👁️")
 
-    text = extract_text(file_path)
-    if not text.strip():
-        log_and_broadcast("warning", f"No text in {file_name}, skipping", "⚠️")
-        return
+    try:
+        _ingest_loaded(todo, previous, event_type)
+    finally:
+        with pipeline_lock:
+            ingesting.difference_update(todo)
+            again = [fp for fp in todo if fp in ingest_again]
+            ingest_again.difference_update(again)
+    if again:
+        _ingest_many(again, "modified")
+
+
+def _ingest_loaded(todo: list, previous: dict, event_type: str):
+    """Store what ingest.load_documents yields for todo. Part of _ingest_many."""
+    # Edits are always re-embedded: near-duplicate reuse is for new files only
+    no_reuse = set(todo) if event_type == "modified" else set(previous)
+    for file_path, key, text, embedding, cached, truncated in ingest.load_documents(todo, doc_cache, chunk_cache, near_dups, no_reuse):
+        file_name = Path(file_path).name
+        old = previous.get(file_path)
+        if old is not None and old.get("content_hash") == key:
+            continue  # touched, but the content is identical
+
+        if text is None:
+            # Extraction failed (worker died); nothing was cached, the next event or reconcile retries it
+            log_and_broadcast("warning", f"Could not extract {file_name}, will retry", "⚠️")
+            continue
+        if not text.strip():
+            log_and_broadcast("warning", f"No text in {file_name}, skipping", "⚠️")
+            if old is not None:
+                with pipeline_lock:
+                    if state.files.get(file_path) is old:
+                        _forget_file(file_path)
+            continue
 
-    word_count = len(text.split())
-    log_and_broadcast("extract", f"Extracted {word_count} words from {file_name}", "📄")
+        record = _file_record(file_path, key, text, truncated)
+        if old is not None:
+            old_chunks = set(old.get("chunk_hashes", ()))
+            changed = sum(1 for h in record["chunk_hashes"] if h not in old_chunks)
+            log_and_broadcast("update", f"Updated: {file_name} — re-embedded {changed}/{len(record['chunk_hashes'])} chunks", "✏️")
+            # Keep its place in the graph until the next recluster
+            for field in ("cluster_id", "sub_cluster", "position_3d"):
+                record[field] = old.get(field, record[field])
+        elif cached:
+            log_and_broadcast("cache", f"Unchanged, reused cached embedding: {file_name}", "⚡")
+        elif record["duplicate_of"] is not None and file_path not in no_reuse:
+            log_and_broadcast("cache", f"Near-duplicate, reused embedding: {file_name}", "⚡")
+        else:
+            word_count = len(text.split())
+            sampled = " (sampled)" if record["text_sampled"] else ""
+            log_and_broadcast("extract", f"Extracted {word_count} words{sampled} from {file_name}", "📄")
+            log_and_broadcast("embed", f"Embedded: {file_name}", "🧠")
+
+        with pipeline_lock:
+            # Deleted, moved or re-recorded while this file was being extracted: the result is stale
+            if state.files.get(file_path) is not old or not os.path.exists(file_path):
+                _undo_terms(file_path)
+                continue
+            if old is not None:
+                _cluster_account(file_path, -1)
+                state.recluster_stats["changes"] += 1
+            state.files[file_path] = record
+            _store_embedding(file_path, embedding)
+            if old is not None:
+                _cluster_account(file_path, +1)
 
-    embedding = embed_text(text)
-    log_and_broadcast("embed", f"Embedded: {file_name}", "🧠")
 
-    state.files[file_path] = {
-        "name": file_name,
+def _undo_terms(file_path: str):
+    """
+    Point the term and near-duplicate indexes back at whatever state.files
+    now holds for a path (a stale _file_record updated them). Caller holds pipeline_lock.
+    """
+    current = state.files.get(file_path)
+    if current is None:
+        clusterer.term_index.remove(file_path)
+        near_dups.remove(file_path)
+    else:
+        text = _file_text(file_path)
+        clusterer.term_index.add(file_path, current["content_hash"], text)
+        near_dups.match(current["content_hash"], text, file_path)
+
+
+def _forget_file(file_path: str):
+    """Drop a file's record and embedding row. Caller holds pipeline_lock."""
+    if file_path in state.files:
+        _cluster_account(file_path, -1)
+        state.recluster_stats["changes"] += 1
+    state.files.pop(file_path, None)
+    state.embeddings.remove(file_path)
+    vector_index.remove(file_path)
+    clusterer.term_index.remove(file_path)
+    near_dups.remove(file_path)
+
+
+def _rename_file(old_path: str, new_path: str):
+    """Re-key a moved file's record and embedding row. Caller holds pipeline_lock."""
+    file_data = state.files.pop(old_path)
+    file_data["path"] = new_path
+    state.files[new_path] = file_data
+    state.embeddings.rename(old_path, new_path)
+    vector_index.rename(old_path, new_path)
+    clusterer.term_index.rename(old_path, new_path)
+    near_dups.rename(old_path, new_path)
+
+
+def _store_embedding(file_path: str, embedding):
+    """Set a file's embedding row and index it. Caller holds pipeline_lock."""
+    state.embeddings.set(file_path, embedding)
+    vector_index.add(file_path)
+
+
+def _file_record(file_path: str, key: str, text: str, truncated: bool = False) -> dict:
+    """
+    Build the state.files entry for a freshly ingested file.
+    Only compact features derived from the text are kept; the text itself
+    goes to text_store and is read back by content hash when needed.
+
+    Extraction stops at embedder.TEXT_BUDGET characters (and a few PDF pages),
+    so for longer files word_count, keywords and category_scores describe that
+    sample (the same text the embedding sees); text_sampled marks those files.
+    """
+    text_store.put(key, text)
+    clusterer.term_index.add(file_path, key, text)  # corpus-wide TF-IDF row for cluster naming
+    name = Path(file_path).name
+    scores, version = _category_scores(key, name, text)
+    return {
+        "name": name,
         "path": file_path,
-        "text": text,
-        "embedding": embedding,
+        "content_hash": key,
+        "chunk_hashes": embedder.chunk_hashes(text),
+        "keywords": _extract_keywords(text),
+        "category_scores": scores,
+        "category_version": version,
         "snippet": get_snippet(text),
+        "duplicate_of": near_dups.match(key, text, file_path),  # content hash of an earlier near-copy
         "cluster_id": None,
         "sub_cluster": None,
-        "position_3d": [0, 0, 0],
-        "word_count": word_count,
+        "position_3d": None,  # assigned by layout on placement / recluster
+        "word_count": len(text.split()),
+        "text_sampled": bool(truncated),  # only part of the file was read: counts are a lower bound
     }
 
 
+def _file_text(file_path: str) -> str:
+    """Full extracted text of a tracked file, via text_store."""
+    return text_store.get(state.files[file_path].get("content_hash"), file_path)
+
+
+def _category_scores(key: str, name: str, text: str = None, file_path: str = None):
+    """
+    Sparse CATEGORY_MAP scores ({ category index: score }) of text + " " + name,
+    and the version they were computed under. Read from category_cache when
+    this content + name was scored before under the current CATEGORY_MAP.
+    """
+    matcher = clusterer.get_category_matcher()
+    version = f"{matcher.version}|{key}|{name}"
+    cache_key = f"{key}|{name}"
+    scores = category_cache.get(matcher.version, cache_key)
+    if scores is None:
+        if text is None:
+            text = text_store.get(key, file_path)
+        scores = matcher.sparse_scores(text.lower() + " " + name.lower())
+        category_cache.put(matcher.version, cache_key, scores)
+    return scores, version
+
+
+def _detect_category(file_path: str):
+    """
+    Keyword category for one file: the CATEGORY_MAP entry with the most
+    keyword hits in text + name, if it has at least 2. None otherwise.
+    Uses the scores stored at ingest; only stale ones are recomputed.
+    """
+    f = state.files[file_path]
+    matcher = clusterer.get_category_matcher()
+    key, name = f.get("content_hash"), f.get("name", "")
+    if f.get("category_version") != f"{matcher.version}|{key}|{name}":
+        f["category_scores"], f["category_version"] = _category_scores(key, name, file_path=file_path)
+    return matcher.best_category(f["category_scores"])
+
+
+# ═══════════════════════════════════════════════════════════════════
+# INCREMENTAL ASSIGNMENT — place new files without a full recluster
+# ═══════════════════════════════════════════════════════════════════
+
+def _place_or_schedule():
+    """After an ingest: place new files incrementally if possible, else schedule a full recluster."""
+    if INCREMENTAL_ASSIGN and _startup_done and _recluster_timer is None and _place_new_files():
+        return
+    _schedule_recluster()
+
+
+def _place_new_files() -> bool:
+    """
+    Give every file without a cluster its best existing cluster, in O(k·d)
+    per file: its keyword category if that already has a cluster, otherwise
+    the nearest centroid among the embedding-based clusters. Only those
+    files are moved on disk and broadcast.
+
+    A file that fits no existing cluster is left unclustered (like density
+    noise) until the next full recluster, and counts toward the drift that
+    triggers one. Returns False (nothing placed) if there are no clusters
+    yet, or if drift since the last full recluster says it's time for one.
+    """
+    with pipeline_lock:
+        if not state.clusters:
+            return False
+        pending = [fp for fp, f in state.files.items() if f.get("cluster_id") is None and not f.get("unclustered")]
+        placements = {}
+        leftovers = []
+        for fp in pending:
+            cid = _best_cluster(fp)
+            if cid is None:
+                leftovers.append(fp)
+            else:
+                placements[fp] = cid
+
+        reason = _drift_reason(len(pending), len(leftovers))
+        if reason:
+            log_and_broadcast("cluster", f"Full recluster needed: {reason}", "📊")
+            return False
+        if not pending:
+            return True
+
+        for fp in pending:
+            f = state.files[fp]
+            f["position_3d"] = layout.project(state.embeddings.get(fp)[None])[0].tolist()
+            if fp in placements:
+                f["cluster_id"] = int(placements[fp])
+                f["sub_cluster"] = _best_sub_cluster(fp, placements[fp])
+                _cluster_account(fp, +1)
+            else:
+                f["unclustered"] = True
+        state.recluster_stats["changes"] += len(pending)
+        state.recluster_stats["unsorted"] += len(leftovers)
+
+        moves = _sync_to_folders(list(placements))
+
+        for fp, cid in placements.items():
+            log_and_broadcast("cluster", f"Placed {Path(fp).name} → {state.clusters[cid]['name']}", "📌")
+        for fp in leftovers:
+            log_and_broadcast("cluster", f"{Path(fp).name} fits no existing folder — unsorted until the next recluster", "📌")
+        updated = [moves.get(fp, fp) for fp in pending]
+        removed = [fp for fp in placements if fp in moves]
+
+    _broadcast_files(updated, removed)
+    return True
+
+
+def _best_cluster(file_path: str):
+    """Existing cluster a new file belongs in, or None if none fits well enough."""
+    category = _detect_category(file_path)
+    if category:
+        # Category clusters only come from full reclusters: a new category needs one
+        return next((cid for cid, c in state.clusters.items() if c.get("category") == category), None)
+
+    candidates = [cid for cid, c in state.clusters.items()
+                  if c.get("category") is None and cid in state.centroids]
+    vec = state.embeddings.get(file_path)
+    if not candidates or vec is None:
+        return None
+    centroids = np.stack([state.centroids[cid] for cid in candidates]).astype(np.float32)
+    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    sims = centroids @ vec.astype(np.float32)
+    best = int(np.argmax(sims))
+    if sims[best] < _MIN_SIMILARITY:
+        return None
+    return candidates[best]
+
+
+def _best_sub_cluster(file_path: str, cid):
+    """Nearest sub-cluster of a split cluster for a new file (None if the cluster isn't split)."""
+    subs = [name for name in (state.clusters[cid].get("sub_clusters") or {})
+            if (cid, name) in state.sub_centroids]
+    vec = state.embeddings.get(file_path)
+    if not subs or vec is None:
+        return None
+    centroids = np.stack([state.sub_centroids[(cid, name)] for name in subs]).astype(np.float32)
+    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return subs[int(np.argmax(centroids @ vec.astype(np.float32)))]
+
+
+def _cluster_account(file_path: str, sign: int):
+    """Add (+1) or remove (-1) a file's embedding and count from its cluster. Caller holds pipeline_lock."""
+    f = state.files.get(file_path, {})
+    cid = f.get("cluster_id")
+    vec = state.embeddings.get(file_path)
+    if cid not in state.clusters or vec is None:
+        return
+    if cid in state.centroids:
+        state.centroids[cid] = state.centroids[cid] + sign * vec.astype(np.float32)
+    cluster = state.clusters[cid]
+    cluster["file_count"] = max(0, cluster["file_count"] + sign)
+
+    sub = f.get("sub_cluster")
+    subs = cluster.get("sub_clusters")
+    if sub and subs is not None and sub in subs:
+        subs[sub] = max(0, subs[sub] + sign)
+        if (cid, sub) in state.sub_centroids:
+            state.sub_centroids[(cid, sub)] = state.sub_centroids[(cid, sub)] + sign * vec.astype(np.float32)
+        if subs[sub] == 0:
+            del subs[sub]
+            state.sub_centroids.pop((cid, sub), None)
+
+    if cluster["file_count"] == 0:
+        del state.clusters[cid]
+        state.centroids.pop(cid, None)
+
+
+def _drift_reason(arriving: int = 0, unsorted: int = 0):
+    """
+    Why a full recluster is due (drift, imbalance or schedule), or None.
+    Files left unsorted by _place_new_files weigh like one more cluster.
+    """
+    stats = state.recluster_stats
+    baseline = max(stats["files"], 1)
+    if stats["changes"] + arriving > _MAX_DRIFT * baseline:
+        return f"{stats['changes'] + arriving} changes since last recluster of {stats['files']} files"
+    total = len(state.files)
+    if total >= 10 and state.clusters:
+        largest = max(max(c["file_count"] for c in state.clusters.values()), stats["unsorted"] + unsorted)
+        share = largest / total
+        if share - stats["max_share"] > _MAX_IMBALANCE:
+            return f"largest cluster grew to {share:.0%} of files"
+    if stats["changes"] and time.time() - stats["at"] > _FULL_RECLUSTER_INTERVAL:
+        return "scheduled"
+    return None
+
+
 def _ingest_batch_and_recluster(file_paths: list):
     """Ingest multiple files then recluster once."""
-    with pipeline_lock:
-        for fp in file_paths:
-            _ingest_one("created", fp)
+    _ingest_many(file_paths)
     # Direct recluster for upload (don't wait for timer)
     _do_recluster()
 
@@ -332,42 +811,33 @@ def _recluster_all():
     4. Name KMeans clusters via keyword matching or TF-IDF
     This avoids the problem of KMeans lumping dissimilar files together.
     """
-    file_paths = list(state.files.keys())
-    if not file_paths:
-        state.clusters = {}
-        return
+    global _recluster_generation
+    _recluster_generation += 1
 
-    embeddings = np.array([state.files[fp]["embedding"] for fp in file_paths])
+    # Zero-copy view of the embedding matrix; row i belongs to file_paths[i]
+    file_paths, embeddings = state.embeddings.matrix()
     if len(embeddings) == 0:
         state.clusters = {}
+        state.centroids = {}
+        state.sub_centroids = {}
         return
 
-    positions = get_3d_positions(embeddings)
+    # Known nodes keep their positions; only new ones are projected (no refit here)
+    streaming = len(file_paths) >= STREAM_MIN_FILES
+    positions = layout.place(
+        [state.files[fp]["content_hash"] for fp in file_paths],
+        embeddings,
+        [state.files[fp].get("position_3d") for fp in file_paths],
+        sample=clusterer.STREAM_SAMPLE if streaming else None,
+        release=state.embeddings.release_pages,
+    )
 
     # ── Step 1: Per-file keyword category detection ────────
-    import re as _re
     file_categories = {}  # index -> category name
     for i, fp in enumerate(file_paths):
-        text = state.files[fp].get("text", "").lower()
-        fname = state.files[fp].get("name", "").lower()
-        combined = text + " " + fname
-
-        best_cat = None
-        best_score = 0
-        for category, keywords in CATEGORY_MAP.items():
-            score = 0
-            match_count = 0
-            for kw in keywords:
-                pattern = r'\b' + _re.escape(kw.lower()) + r'\b'
-                hits = len(_re.findall(pattern, combined))
-                if hits > 0:
-                    match_count += 1
-                    score += hits
-            if match_count >= 1 and score > best_score:
-                best_score = score
-                best_cat = category
-        if best_cat and best_score >= 2:
-            file_categories[i] = best_cat
+        category = _detect_category(fp)
+        if category:
+            file_categories[i] = category
 
     # ── Step 2: Build category-based groups ────────────────
     cat_groups = {}  # category_name -> [indices]
@@ -380,66 +850,92 @@ def _recluster_all():
             uncategorized.append(i)
 
     # ── Step 3: For uncategorized, sub-cluster with KMeans ──
-    next_cluster_id = 0
+    # (or, with SEFS_CLUSTER_ENGINE=density, by density over the k-NN graph)
+    groups = [(indices, cat_name) for cat_name, indices in cat_groups.items()]  # (rows, category)
+    unc_labels = None
+    if len(uncategorized) >= 2 and clusterer.CLUSTER_ENGINE == "density":
+        _, neighbors, sims = vector_index.knn_graph(clusterer.DENSITY_NEIGHBORS, rows=uncategorized)
+        unc_labels = clusterer.density_clusters(neighbors, sims)
+        if unc_labels.max() < 0:
+            log_and_broadcast("cluster", "No dense regions found, falling back to KMeans", "📊")
+            unc_labels = None
+    if unc_labels is None and len(uncategorized) >= STREAM_MIN_FILES:
+        # Out of core: the matrix is read block by block, never gathered whole
+        unc_labels, _ = clusterer.cluster_embeddings_streaming(
+            embeddings, rows=uncategorized, release=state.embeddings.release_pages)
+    elif unc_labels is None and len(uncategorized) >= 2:
+        unc_labels, _ = cluster_embeddings(embeddings[uncategorized])
+    if len(uncategorized) >= 2:
+        unc_rows = np.asarray(uncategorized)
+        for label in np.unique(unc_labels):
+            if label >= 0:  # -1 = density noise: those files stay unassigned
+                groups.append((unc_rows[unc_labels == label].tolist(), None))
+    elif uncategorized:
+        groups.append((uncategorized, None))
+
+    # ── Step 4: Match groups to the previous clusters ──────
+    # Matched groups keep their id and color, and their name (= folder) when
+    # most of their files come from that cluster, so files that stay put
+    # don't move on disk. Only unmatched groups need naming.
+    matches = _match_previous_clusters(groups, file_paths, embeddings)
+    group_names = {}
+    unc_cluster_data = {}
+    for g, (indices, category) in enumerate(groups):
+        if category:
+            group_names[g] = category
+        elif g in matches and matches[g][1]:
+            group_names[g] = state.clusters[matches[g][0]]["name"]
+        elif len(uncategorized) == 1:
+            # Single uncategorized file
+            group_names[g] = "General Documents"
+        else:
+            # Names come from an even sample of members, not every file's text
+            sample = indices[::-(-len(indices) // NAMING_SAMPLE)]
+            unc_cluster_data[g] = {
+                "texts": [_file_text(file_paths[i]) for i in sample],
+                "file_names": [state.files[file_paths[i]]["name"] for i in sample],
+                "files": [file_paths[i] for i in indices],
+                "content_hashes": [state.files[file_paths[i]]["content_hash"] for i in indices],
+                "indices": indices,
+            }
+    pending = []  # groups whose provisional names the LLM should replace
+    if unc_cluster_data:
+        unc_names, pending = clusterer.name_clusters_provisional(unc_cluster_data)
+        for g in unc_cluster_data:
+            group_names[g] = unc_names.get(g, f"Documents {g}")
+
+    # ── Step 5: Assign ids, de-duplicate cluster names ─────
     # final_assignments: index -> cluster_id
     final_assignments = {}
     # cluster_names_final: cluster_id -> name
     cluster_names_final = {}
-
-    for cat_name, indices in cat_groups.items():
-        cid = next_cluster_id
-        next_cluster_id += 1
-        cluster_names_final[cid] = cat_name
-        for idx in indices:
-            final_assignments[idx] = cid
-
-    if uncategorized:
-        if len(uncategorized) >= 2:
-            unc_embeddings = np.array([embeddings[i] for i in uncategorized])
-            unc_labels, _ = cluster_embeddings(unc_embeddings)
-            # Name each sub-cluster
-            unc_cluster_data = {}
-            for label in set(unc_labels):
-                unc_indices = [uncategorized[j] for j, l in enumerate(unc_labels) if l == label]
-                unc_cluster_data[label] = {
-                    "texts": [state.files[file_paths[i]]["text"] for i in unc_indices],
-                    "file_names": [state.files[file_paths[i]]["name"] for i in unc_indices],
-                    "files": [file_paths[i] for i in unc_indices],
-                    "indices": unc_indices,
-                }
-            unc_names = name_all_clusters(unc_cluster_data)
-            for label in set(unc_labels):
-                cid = next_cluster_id
-                next_cluster_id += 1
-                cluster_names_final[cid] = unc_names.get(label, f"Documents {cid}")
-                for j, l in enumerate(unc_labels):
-                    if l == label:
-                        final_assignments[uncategorized[j]] = cid
-        else:
-            # Single uncategorized file
-            cid = next_cluster_id
-            next_cluster_id += 1
-            cluster_names_final[cid] = "General Documents"
-            for idx in uncategorized:
-                final_assignments[idx] = cid
-
-    # ── Step 4: De-duplicate cluster names ─────────────────
     seen_names = {}
-    for cid, name in list(cluster_names_final.items()):
+    group_ids = {}  # group -> cluster_id
+    taken = {old_cid for old_cid, _ in matches.values()}
+    next_cluster_id = 0
+    for g, (indices, _) in enumerate(groups):
+        name = group_names[g]
         if name in seen_names:
             # Merge into existing cluster
-            existing_cid = seen_names[name]
-            for idx, assigned_cid in list(final_assignments.items()):
-                if assigned_cid == cid:
-                    final_assignments[idx] = existing_cid
-            del cluster_names_final[cid]
+            cid = seen_names[name]
+        elif g in matches:
+            cid = matches[g][0]
         else:
-            seen_names[name] = cid
+            while next_cluster_id in taken:
+                next_cluster_id += 1
+            cid = next_cluster_id
+            taken.add(cid)
+        seen_names.setdefault(name, cid)
+        cluster_names_final.setdefault(cid, name)
+        group_ids[g] = cid
+        for idx in indices:
+            final_assignments[idx] = cid
 
-    # ── Step 5: Build cluster state ────────────────────────
+    # ── Step 6: Build cluster state ────────────────────────
     new_clusters = {}
+    counts = Counter(final_assignments.values())
     for cid, cname in cluster_names_final.items():
-        file_count = sum(1 for v in final_assignments.values() if v == cid)
+        file_count = counts.get(cid, 0)
         if file_count == 0:
             continue
         new_clusters[int(cid)] = {
@@ -447,40 +943,319 @@ def _recluster_all():
             "name": cname,
             "color": get_cluster_color(int(cid)),
             "file_count": file_count,
+            # Keyword-category clusters take new files by category, the rest by centroid
+            "category": cname if cname in cat_groups else None,
+            "sub_clusters": None,
         }
 
     state.clusters = new_clusters
 
-    # ── Step 6: Update file state ──────────────────────────
+    # Centroid sums + baseline for incremental assignment until the next full recluster
+    labels = np.array([final_assignments.get(i, -1) for i in range(len(file_paths))])
+    state.centroids = _row_sums(embeddings, labels, new_clusters)
+    state.recluster_stats.update({
+        "at": time.time(),
+        "files": len(file_paths),
+        "changes": 0,
+        "unsorted": 0,
+        "max_share": max(c["file_count"] for c in new_clusters.values()) / len(file_paths),
+    })
+
+    # ── Step 7: Update file state ──────────────────────────
+    reassigned = 0
+    unassigned = 0
     for i, file_path in enumerate(file_paths):
         pos = positions[i]
-        cid = final_assignments.get(i, 0)
-        state.files[file_path]["cluster_id"] = int(cid)
+        cid = final_assignments.get(i)
+        previous = state.files[file_path].get("cluster_id")
+        if previous is not None and previous != cid:
+            reassigned += 1
+        if cid is None:
+            unassigned += 1
+        # Noise (density engine) is left out on purpose; _place_new_files skips it
+        state.files[file_path]["cluster_id"] = None if cid is None else int(cid)
+        state.files[file_path]["unclustered"] = cid is None
         state.files[file_path]["sub_cluster"] = None
-        state.files[file_path]["position_3d"] = pos.tolist() if hasattr(pos, 'tolist') else [float(x) for x in pos]
+        state.files[file_path]["position_3d"] = [float(x) for x in pos]
+
+    # ── Step 8: Split large clusters (optional) ────────────
+    _assign_sub_clusters(file_paths, embeddings, labels, sample=clusterer.STREAM_SAMPLE if streaming else None)
+
+    # ── Step 9: Sync OS folders ────────────────────────────
+    moves = _sync_to_folders(file_paths)
+    state.recluster_stats.update({"files_moved": len(moves), "files_reassigned": reassigned,
+                                  "files_unassigned": unassigned})
+
+    log_and_broadcast("sync", f"Organized {len(file_paths) - unassigned} files into {len(new_clusters)} folders "
+                              f"({len(moves)} moved{f', {unassigned} unassigned' if unassigned else ''}) ✓", "✅")
+
+    # ── Step 10: Better names in the background ────────────
+    # (a group merged into another by name has no cluster of its own to rename)
+    to_name = {group_ids[g]: unc_cluster_data[g] for g in pending
+               if group_ids[g] in new_clusters and new_clusters[group_ids[g]]["name"] == group_names[g]}
+    if to_name:
+        _start_naming(to_name, {cid: new_clusters[cid]["name"] for cid in to_name})
+
+
+def _start_naming(cluster_data: dict, provisional: dict):
+    """Fetch LLM names on the naming worker; _apply_cluster_names swaps them in."""
+    generation = _recluster_generation
+    # Only what the prompt and the name cache need, not every member's text
+    cluster_data = {
+        cid: {"texts": d["texts"][:3], "file_names": d["file_names"][:5], "content_hashes": d["content_hashes"]}
+        for cid, d in cluster_data.items()
+    }
+
+    def _run():
+        try:
+            names = clusterer.name_clusters_llm(cluster_data, provisional)
+        except Exception as e:
+            print(f"[PIPELINE] Naming error: {e}")
+            return
+        _apply_cluster_names(generation, {cid: n for cid, n in names.items() if n != provisional.get(cid)})
+
+    _naming_pool.submit(_run)
+
+
+def _apply_cluster_names(generation: int, names: dict):
+    """Hot-swap new names into clusters and their folders (skipped if a newer recluster ran)."""
+    if not names:
+        return
+    with pipeline_lock:
+        if generation != _recluster_generation:
+            return
+        taken = {c["name"] for c in state.clusters.values()}
+        renamed = set()
+        for cid, name in names.items():
+            cluster = state.clusters.get(cid)
+            if cluster is None or name in taken:
+                continue
+            log_and_broadcast("cluster", f"Named: {cluster['name']} → {name}", "🏷️")
+            taken.discard(cluster["name"])
+            taken.add(name)
+            cluster["name"] = name
+            renamed.add(cid)
+        if not renamed:
+            return
+        _sync_to_folders([fp for fp, f in state.files.items() if f.get("cluster_id") in renamed])
+    _broadcast_state()
 
-    # ── Step 7: Sync OS folders ────────────────────────────
+
+def _match_previous_clusters(groups: list, file_paths: list, embeddings) -> dict:
+    """
+    Pair this recluster's groups with the previous clusters by Hungarian
+    matching on shared files, with centroid similarity as tie-breaker (and
+    as the only signal for groups of all-new files).
+
+    Returns { group index: (previous cluster_id, keep_name) }. keep_name is
+    True when at least half the group's files come from that cluster and it
+    wasn't a keyword-category cluster.
+    """
+    old_ids = list(state.clusters)
+    if not old_ids or not groups:
+        return {}
+    from scipy.optimize import linear_sum_assignment
+
+    column = {cid: j for j, cid in enumerate(old_ids)}
+    overlap = np.zeros((len(groups), len(old_ids)))
+    for g, (indices, _) in enumerate(groups):
+        for i in indices:
+            j = column.get(state.files[file_paths[i]].get("cluster_id"))
+            if j is not None:
+                overlap[g, j] += 1
+
+    similarity = np.zeros_like(overlap)
+    with_centroid = [j for j, cid in enumerate(old_ids) if cid in state.centroids]
+    if with_centroid:
+        old = np.stack([state.centroids[old_ids[j]] for j in with_centroid]).astype(np.float32)
+        group_of = np.full(len(file_paths), -1)
+        for g, (indices, _) in enumerate(groups):
+            group_of[indices] = g
+        sums = _row_sums(embeddings, group_of, range(len(groups)))
+        new = np.stack([sums[g] for g in range(len(groups))])
+        old /= np.maximum(np.linalg.norm(old, axis=1, keepdims=True), 1e-12)
+        new /= np.maximum(np.linalg.norm(new, axis=1, keepdims=True), 1e-12)
+        similarity[:, with_centroid] = np.clip(new @ old.T, 0.0, 1.0)
+
+    # Shared files dominate; similarity (scaled below 1) only decides between equal overlaps
+    rows, cols = linear_sum_assignment(overlap + 0.5 * similarity, maximize=True)
+    matches = {}
+    for g, j in zip(rows, cols):
+        if overlap[g, j] == 0 and similarity[g, j] < _MIN_SIMILARITY:
+            continue
+        cid = old_ids[j]
+        keep_name = (2 * overlap[g, j] >= len(groups[g][0])
+                     and state.clusters[cid].get("category") is None)
+        matches[int(g)] = (cid, keep_name)
+    return matches
+
+
+def _row_sums(embeddings, labels, ids) -> dict:
+    """
+    { id: sum of the embedding rows labelled id }, read in blocks so a
+    memory-mapped matrix is never gathered whole.
+    """
+    sums = {i: np.zeros(embeddings.shape[1], dtype=np.float32) for i in ids}
+    block_rows = clusterer.STREAM_BLOCK_ROWS
+    for start in range(0, len(labels), block_rows):
+        block = np.asarray(embeddings[start:start + block_rows], dtype=np.float32)
+        block_labels = labels[start:start + block_rows]
+        for i in np.unique(block_labels):
+            if int(i) in sums:
+                sums[int(i)] += block[block_labels == i].sum(axis=0)
+        state.embeddings.release_pages()
+    return sums
+
+
+def _assign_sub_clusters(file_paths: list, embeddings, labels, sample: int = None):
+    """
+    Split each cluster of SUBCLUSTER_MIN_FILES+ files into sub-clusters, the
+    clusters in parallel on a worker pool. Only clusters whose membership
+    (content hashes) changed since the last recluster are split again; the
+    rest reuse their previous split. With sample, clusters bigger than that
+    are split as in _split_cluster_rows. Caller holds pipeline_lock.
+    """
+    global _subcluster_memo
+    state.sub_centroids = {}
+    if not SUBCLUSTER:
+        _subcluster_memo = {}
+        return
+
+    keys = {}  # cluster_id -> memo key
+    todo = {}  # memo key -> member rows
+    for cid, cluster in state.clusters.items():
+        rows = np.flatnonzero(labels == cid)
+        if len(rows) < SUBCLUSTER_MIN_FILES:
+            continue
+        hashes = sorted(state.files[file_paths[i]]["content_hash"] for i in rows)
+        key = (cluster["name"], hashlib.blake2b("\n".join(hashes).encode("utf-8"), digest_size=8).hexdigest())
+        keys[cid] = key
+        if key not in _subcluster_memo:
+            todo[key] = rows
+
+    splits = {key: _subcluster_memo[key] for key in keys.values() if key in _subcluster_memo}
+    if todo:
+        categories = {key: state.clusters[cid]["category"] for cid, key in keys.items()}
+        with ThreadPoolExecutor(max_workers=max(1, min(SUBCLUSTER_WORKERS, len(todo)))) as pool:
+            futures = {
+                key: pool.submit(_split_cluster_rows, file_paths, embeddings, rows, categories[key], sample)
+                for key, rows in todo.items()
+            }
+            for key, future in futures.items():
+                splits[key] = future.result()
+    _subcluster_memo = splits
+
+    pairs = {}  # (cid, sub name) -> sub label
+    sub_labels = np.full(len(file_paths), -1, dtype=np.int64)
+    for cid, key in keys.items():
+        split = splits.get(key)
+        if not split:
+            continue
+        counts = {}
+        for i in np.flatnonzero(labels == cid):
+            f = state.files[file_paths[i]]
+            sub = split.get(f["content_hash"])
+            f["sub_cluster"] = sub
+            if sub:
+                counts[sub] = counts.get(sub, 0) + 1
+                sub_labels[i] = pairs.setdefault((cid, sub), len(pairs))
+        state.clusters[cid]["sub_clusters"] = counts
+    if pairs:
+        # One blocked pass for every sub-cluster's centroid sum
+        sums = _row_sums(embeddings, sub_labels, range(len(pairs)))
+        state.sub_centroids = {pair: sums[j] for pair, j in pairs.items()}
+
+    if keys:
+        log_and_broadcast("cluster", f"Sub-clustered {len(keys)} large clusters ({len(todo)} changed)", "🗂️")
+
+
+def _split_cluster_rows(file_paths: list, embeddings, rows, category, sample: int = None):
+    """
+    _split_cluster for the files at the given matrix rows. With sample (and
+    more rows than that), only a random sample of members is split (their
+    texts read, their rows copied); every other member joins the sub-cluster
+    with the nearest centroid, its rows read block by block. Runs on a worker.
+    """
+    if sample is None or len(rows) <= sample:
+        return _split_cluster([file_paths[i] for i in rows], embeddings[rows], category)
+    picks, X = clusterer.sample_rows(embeddings, rows, sample, release=state.embeddings.release_pages)
+    members = [file_paths[rows[j]] for j in picks]
+    split = _split_cluster(members, X, category)
+    names = sorted(set(split.values()))
+    if not names:
+        return split
+    owner = np.array([names.index(split[state.files[fp]["content_hash"]]) if state.files[fp]["content_hash"] in split
+                      else -1 for fp in members])
+    centroids = np.stack([X[owner == j].mean(axis=0) for j in range(len(names))])
+    rest = np.setdiff1d(np.arange(len(rows)), picks)
+    rest_rows = np.asarray(rows)[rest]
+    for start, block in clusterer.iter_blocks(embeddings, rest_rows, release=state.embeddings.release_pages):
+        nearest = np.argmax(block @ centroids.T, axis=1)
+        for r, j in zip(rest_rows[start:start + len(block)], nearest):
+            split.setdefault(state.files[file_paths[r]]["content_hash"], names[j])
+    return split
+
+
+def _split_cluster(file_paths: list, embeddings, category):
+    """{ content_hash: sub-cluster name } for one cluster's files ({} if it doesn't split). Runs on a worker."""
+    texts = [_file_text(fp) for fp in file_paths]
+    names = [state.files[fp]["name"] for fp in file_paths]
+    hashes = [state.files[fp]["content_hash"] for fp in file_paths]
+    groups = sub_cluster_files(file_paths, embeddings, texts, names, parent_category=category, content_hashes=hashes)
+    split = {}
+    for sub_name, indices in (groups or {}).items():
+        for i in indices:
+            split[state.files[file_paths[i]]["content_hash"]] = sub_name
+    return split
+
+
+def _sync_to_folders(file_paths: list) -> dict:
+    """Move files into SEFS_<Cluster>/ (or SEFS_<Cluster>/<Sub>/) folders. Caller holds pipeline_lock."""
+    moves = {}
     try:
-        assignments = {fp: state.files[fp]["cluster_id"] for fp in file_paths}
-        cluster_names_map = {cid: state.clusters[cid]["name"] for cid in state.clusters}
-        cluster_map = build_cluster_map(ROOT_FOLDER, assignments, cluster_names_map)
-        _premark_moves(cluster_map)
-        moves = sync_folders(ROOT_FOLDER, cluster_map)
+        flat, nested = {}, {}
+        for fp in file_paths:
+            f = state.files.get(fp)
+            cluster = state.clusters.get(f.get("cluster_id")) if f else None
+            if cluster is None:
+                continue
+            if f.get("sub_cluster"):
+                nested.setdefault(cluster["name"], {}).setdefault(f["sub_cluster"], []).append(fp)
+            else:
+                flat[fp] = f["cluster_id"]
+        names = {cid: c["name"] for cid, c in state.clusters.items()}
+        cluster_map = build_cluster_map(ROOT_FOLDER, flat, names)
+        _premark_moves(cluster_map, nested)
+        if nested:
+            moves.update(sync_nested_folders(ROOT_FOLDER, nested))
+        moves.update(sync_folders(ROOT_FOLDER, cluster_map))
         _apply_moves(moves)
     except Exception as e:
         print(f"[PIPELINE] Folder sync error: {e}")
+    return moves
+
 
-    log_and_broadcast("sync", f"Organized {len(file_paths)} files into {len(new_clusters)} folders ✓", "✅")
+def _apply_layout(positions_by_key: dict):
+    """Swap in node positions from a background layout refit (keyed by content hash)."""
+    with pipeline_lock:
+        for f in state.files.values():
+            pos = positions_by_key.get(f.get("content_hash"))
+            if pos is not None:
+                f["position_3d"] = [float(x) for x in pos]
+    _broadcast_state()
 
 
-def _premark_moves(cluster_map: dict):
+def _premark_moves(cluster_map: dict, nested_map: dict = None):
     """Pre-mark source AND destination paths as ignored BEFORE organiser moves files.
-    This prevents the watcher from treating internal organiser moves as user actions."""
+    This prevents the watcher from treating internal organiser moves as user actions.
+    nested_map is { "TopFolder": { "SubFolder": [paths] } } as for sync_nested_folders."""
     now = time.time()
     root_path = Path(ROOT_FOLDER)
-    
-    for folder_name, file_paths_list in cluster_map.items():
-        dest_folder = root_path / f"SEFS_{folder_name}"
+    targets = [(root_path / f"SEFS_{name}", paths) for name, paths in cluster_map.items()]
+    for top, sub_map in (nested_map or {}).items():
+        targets += [(root_path / f"SEFS_{top}" / sub, paths) for sub, paths in sub_map.items()]
+
+    for dest_folder, file_paths_list in targets:
         for file_path in file_paths_list:
             src = Path(file_path)
             if src.parent == dest_folder:
@@ -504,9 +1279,7 @@ def _apply_moves(moves: dict):
         ignore_paths[os.path.abspath(old_path).lower()] = now
 
         if old_path in state.files:
-            file_data = state.files.pop(old_path)
-            file_data["path"] = new_path
-            state.files[new_path] = file_data
+            _rename_file(old_path, new_path)
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -527,6 +1300,8 @@ def _start_reconciliation_loop():
                 _reconcile_state()
             except Exception as e:
                 print(f"[RECONCILE] Error: {e}")
+            if INCREMENTAL_ASSIGN and _recluster_timer is None and _drift_reason():
+                _schedule_recluster()
 
     t = threading.Thread(target=_loop, daemon=True)
     t.start()
@@ -546,13 +1321,13 @@ def _reconcile_state():
         for fp in list(state.files.keys()):
             if not os.path.exists(fp):
                 name = state.files[fp].get("name", Path(fp).name)
-                del state.files[fp]
+                _forget_file(fp)
                 log_and_broadcast("delete", f"Removed (missing): {name}", "🗑️")
                 changed = True
 
         # ── 2. Scan disk for untracked files ─────────────────────────
         root = Path(ROOT_FOLDER)
-        known = {os.path.abspath(fp).lower() for fp in state.files}
+        known = {os.path.abspath(fp).lower() for fp in (*state.files, *ingesting)}
 
         new_files = []
 
@@ -587,15 +1362,15 @@ def _reconcile_state():
         except OSError:
             pass
 
-        for fp in new_files:
-            _ingest_one("created", fp)
-            changed = True
+    if new_files:
+        _ingest_many(new_files)
+        changed = True
 
     if changed:
         # Broadcast immediately so frontend sees deletions
         _broadcast_state()
-        # Schedule recluster to reorganize clusters and folders
-        _schedule_recluster()
+        # Place new files, or schedule a recluster to reorganize clusters and folders
+        _place_or_schedule()
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -620,69 +1395,102 @@ def _extract_keywords(text: str, top_n: int = 5) -> list:
     return [w for w, _ in counts.most_common(top_n)]
 
 
+def _serialize_file(fp: str, f: dict) -> dict:
+    """JSON-safe node for one file."""
+    cid = f.get("cluster_id")
+    if cid is not None:
+        cid = int(cid)
+    cluster = state.clusters.get(cid, {})
+    pos = f.get("position_3d") or [0, 0, 0]
+    if hasattr(pos, 'tolist'):
+        pos = pos.tolist()
+    elif not isinstance(pos, list):
+        pos = [float(x) for x in pos]
+    else:
+        pos = [float(x) for x in pos]
+
+    keywords = list(f.get("keywords", []))
+
+    return {
+        "id": str(fp),
+        "path": str(fp),
+        "name": str(f.get("name", "")),
+        "snippet": str(f.get("snippet", "")),
+        "word_count": int(f.get("word_count", 0)),
+        "words": int(f.get("word_count", 0)),
+        "sampled": bool(f.get("text_sampled", False)),
+        "cluster": cid,
+        "cluster_id": cid,
+        "cluster_name": str(cluster.get("name", "Unknown")),
+        "sub_cluster": f.get("sub_cluster"),
+        "color": str(cluster.get("color", "#888888")),
+        "keywords": keywords,
+        "x": float(pos[0]) if len(pos) > 0 else 0.0,
+        "y": float(pos[1]) if len(pos) > 1 else 0.0,
+        "position": pos,
+    }
+
+
+def _broadcast_files(updated: list, removed: list = ()):
+    """Send only changed nodes (plus cluster counts) instead of the whole graph."""
+    files_list = []
+    for fp in updated:
+        if fp in state.files:
+            files_list.append(_serialize_file(fp, state.files[fp]))
+    clusters_list, clusters_obj = _serialize_clusters()
+    if main_loop and main_loop.is_running():
+        asyncio.run_coroutine_threadsafe(broadcast({
+            "type": "files_update",
+            "files": files_list,
+            "removed": [str(fp) for fp in removed],
+            "clusters": clusters_list,
+            "clusters_map": clusters_obj,
+            "total_files": len(state.files),
+        }), main_loop)
+
+
 def get_graph_state() -> dict:
     """Build JSON-safe graph state for frontend."""
     files_list = []
     for fp, f in list(state.files.items()):
         try:
-            cid = f.get("cluster_id")
-            if cid is not None:
-                cid = int(cid)
-            cluster = state.clusters.get(cid, {})
-            pos = f.get("position_3d", [0, 0, 0])
-            if hasattr(pos, 'tolist'):
-                pos = pos.tolist()
-            elif not isinstance(pos, list):
-                pos = [float(x) for x in pos]
-            else:
-                pos = [float(x) for x in pos]
-
-            text = f.get("text", "")
-            keywords = _extract_keywords(text) if text else []
-
-            files_list.append({
-                "id": str(fp),
-                "path": str(fp),
-                "name": str(f.get("name", "")),
-                "snippet": str(f.get("snippet", "")),
-                "word_count": int(f.get("word_count", 0)),
-                "words": int(f.get("word_count", 0)),
-                "cluster": cid,
-                "cluster_id": cid,
-                "cluster_name": str(cluster.get("name", "Unknown")),
-                "color": str(cluster.get("color", "#888888")),
-                "keywords": keywords,
-                "x": float(pos[0]) if len(pos) > 0 else 0.0,
-                "y": float(pos[1]) if len(pos) > 1 else 0.0,
-                "position": pos,
-            })
+            files_list.append(_serialize_file(fp, f))
         except Exception as e:
             print(f"[GRAPH] Error serializing {fp}: {e}")
 
-    # clusters as both list and object (Graph2D uses object, Dashboard uses list)
+    clusters_list, clusters_obj = _serialize_clusters()
+
+    return {
+        "type": "graph_update",
+        "nodes": files_list,
+        "files": files_list,
+        "clusters": clusters_list,
+        "clusters_map": clusters_obj,
+        "total_files": len(files_list),
+    }
+
+
+def _serialize_clusters():
+    """Clusters as both list and object (Graph2D uses object, Dashboard uses list)."""
     clusters_list = []
     clusters_obj = {}
-    for c in state.clusters.values():
+    for c in list(state.clusters.values()):
         try:
             cdata = {
                 "id": int(c["id"]),
                 "name": str(c["name"]),
                 "color": str(c["color"]),
                 "file_count": int(c["file_count"]),
+                "sub_clusters": [
+                    {"name": str(name), "file_count": int(count)}
+                    for name, count in list(c["sub_clusters"].items())
+                ] if c.get("sub_clusters") else None,
             }
             clusters_list.append(cdata)
             clusters_obj[int(c["id"])] = cdata
         except Exception as e:
             print(f"[GRAPH] Error serializing cluster: {e}")
-
-    return {
-        "type": "graph_update",
-        "nodes": files_list,
-        "files": files_list,
-        "clusters": clusters_list,
-        "clusters_map": clusters_obj,
-        "total_files": len(files_list),
-    }
+    return clusters_list, clusters_obj
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -723,32 +1531,31 @@ def _process_existing_files():
 
     log_and_broadcast("startup", f"Found {len(all_files)} files, processing...", "📂")
 
+    reused = 0
     with pipeline_lock:
         state.files = {}
-        for f in all_files:
-            file_path = str(f)
-            file_name = f.name
-            try:
-                text = extract_text(file_path)
-                if not text.strip():
-                    continue
-
-                embedding = embed_text(text)
-
-                state.files[file_path] = {
-                    "name": file_name,
-                    "path": file_path,
-                    "text": text,
-                    "embedding": embedding,
-                    "snippet": get_snippet(text),
-                    "cluster_id": None,
-                    "sub_cluster": None,
-                    "position_3d": [0, 0, 0],
-                    "word_count": len(text.split()),
-                }
-            except Exception as e:
-                print(f"[STARTUP] Error processing {file_name}: {e}")
+        state.embeddings.clear()
+        vector_index.reset()
+        clusterer.term_index.clear()
+        near_dups.clear()
+        state.clusters = {}
+        state.centroids = {}
+        state.sub_centroids = {}
+        layout.reset()
+
+    for file_path, key, text, embedding, cached, truncated in ingest.load_documents([str(f) for f in all_files], doc_cache, chunk_cache, near_dups):
+        if not text or not text.strip():
+            continue
+        if cached:
+            reused += 1
+        with pipeline_lock:
+            state.files[file_path] = _file_record(file_path, key, text, truncated)
+            _store_embedding(file_path, embedding)
+
+    if reused:
+        log_and_broadcast("cache", f"Reused {reused} cached embeddings", "⚡")
 
+    with pipeline_lock:
         if state.files:
             log_and_broadcast("cluster", f"Clustering {len(state.files)} files...", "📊")
             _recluster_all()
@@ -758,6 +1565,23 @@ def _process_existing_files():
     log_and_broadcast("startup", f"Ready — {len(state.files)} files organized.", "🚀")
 
 
+def _warm_up():
+    """Load the embedding model and clustering libraries off the request path."""
+    t0 = time.time()
+    try:
+        embedder.warm_up()
+        state.ready["embedder"] = True
+        log_and_broadcast("startup", f"Embedding model ready ({time.time() - t0:.1f}s)", "🧠")
+    except Exception as e:
+        print(f"[STARTUP] Embedder warm-up failed: {e}")
+
+    try:
+        clusterer.warm_up()
+        state.ready["clusterer"] = True
+    except Exception as e:
+        print(f"[STARTUP] Clusterer warm-up failed: {e}")
+
+
 @app.on_event("startup")
 async def startup():
     global main_loop
@@ -765,7 +1589,12 @@ async def startup():
 
     log_and_broadcast("startup", "SEFS initializing...", "⚡")
     state.files = {}
+    state.embeddings.clear()
+    vector_index.reset()
+    clusterer.term_index.clear()
+    near_dups.clear()
 
+    threading.Thread(target=_warm_up, daemon=True).start()
     threading.Thread(target=_process_existing_files, daemon=True).start()
     threading.Thread(
         target=start_watcher,
@@ -777,6 +1606,11 @@ async def startup():
     log_and_broadcast("startup", f"Watching: {ROOT_FOLDER}", "👁️")
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    ingest.shutdown()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=False, log_level="warning")
@@ -52,6 +52,14 @@ def sync_folders(root: str, cluster_map: dict):
     # 2. Clean up ONLY truly empty SEFS_ folders (don't thrash on cluster changes)
     for item in root_path.iterdir():
         if item.is_dir() and item.name.startswith(SEFS_PREFIX):
+            # Sub-cluster folders left empty when their files moved out
+            try:
+                for sub in item.iterdir():
+                    if sub.is_dir() and not any(sub.iterdir()):
+                        sub.rmdir()
+                        print(f"[ORGANISER] Removed empty: {item.name}/{sub.name}")
+            except Exception:
+                pass
             # Check if folder is empty
             try:
                 contents = list(item.iterdir())
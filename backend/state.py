@@ -1,14 +1,38 @@
 # Global in-memory state for SEFS
 # In production you'd use a database, but for hackathon this is perfect
 
+import os
 import time
 from collections import deque
 
+from embedding_store import EmbeddingStore, EMBEDDINGS_MMAP
+from doc_cache import CACHE_DIR
+
 files = {}
-# Format: { file_path: { "name", "text", "embedding", "cluster_id", "position_3d", "snippet" } }
+# Format: { file_path: { "name", "content_hash", "keywords", "cluster_id", "sub_cluster", "position_3d", "snippet", ... } }
+# Full text is not kept here — see TextStore in doc_cache.py
+
+embeddings = EmbeddingStore(path=os.path.join(CACHE_DIR, "embeddings.mmap") if EMBEDDINGS_MMAP else None)
+# One L2-normalized float32 row per entry in `files` (see embedding_store.py)
 
 clusters = {}
-# Format: { cluster_id: { "name", "color", "file_count" } }
+# Format: { cluster_id: { "name", "color", "file_count", "category", "sub_clusters" } }
+# "sub_clusters" is { sub name: file count } for clusters split into sub-folders, else None
+
+centroids = {}
+# Format: { cluster_id: sum of member embeddings } — kept current between full
+# reclusters so new files can be assigned to the nearest cluster
+
+sub_centroids = {}
+# Format: { (cluster_id, sub name): sum of member embeddings } — same, one level down
+
+recluster_stats = {"at": 0.0, "files": 0, "changes": 0, "unsorted": 0, "max_share": 0.0, "files_moved": 0, "files_reassigned": 0,
+                   "files_unassigned": 0}
+# Snapshot of the last full recluster (incl. files it moved on disk / gave a
+# different cluster) + files added/removed/edited since
+
+# Readiness of the heavy components, warmed up in the background on startup
+ready = {"embedder": False, "clusterer": False}
 
 # Activity log — stores recent events for real-time display
 # Each entry: { "timestamp", "type", "message", "icon" }
@@ -0,0 +1,156 @@
+import os
+import re
+import threading
+from collections import Counter
+import numpy as np
+
+# Distinct terms kept per document (its most frequent); rarer ones don't affect cluster labels
+TERMS_PER_DOC = int(os.getenv("SEFS_TERMS_PER_DOC", "200"))
+_TOKEN = re.compile(r"(?u)\b\w\w+\b")  # TfidfVectorizer's default token_pattern
+_stop_words = None
+
+
+def _get_stop_words():
+    global _stop_words
+    if _stop_words is None:
+        from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+        _stop_words = ENGLISH_STOP_WORDS
+    return _stop_words
+
+
+def term_counts(text: str) -> Counter:
+    """
+    Unigram + bigram counts of a text, tokenized like
+    TfidfVectorizer(stop_words='english', ngram_range=(1, 2)).
+    """
+    stop = _get_stop_words()
+    tokens = [t for t in _TOKEN.findall(text.lower()) if t not in stop]
+    counts = Counter(tokens)
+    counts.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return counts
+
+
+class TermIndex:
+    """
+    Corpus-wide TF-IDF statistics, kept current as files come and go.
+
+    - Each document is tokenized once: its term counts are kept as a sparse
+      row (term ids + counts) by content hash, shared by identical files.
+    - Document frequencies are updated on add / remove, so IDF is always
+      the whole corpus's, not one cluster's.
+    - top_terms() labels any number of clusters with one sparse product:
+      tf-idf rows (l2-normalized, as TfidfVectorizer does) summed per cluster.
+
+    Only a document's TERMS_PER_DOC most frequent terms are kept, which
+    bounds memory and vocabulary growth on large corpora.
+    """
+
+    def __init__(self, terms_per_doc: int = TERMS_PER_DOC):
+        self.terms_per_doc = terms_per_doc
+        self._vocab = {}                       # term -> id
+        self._terms = []                       # id -> term
+        self._df = np.zeros(1024, dtype=np.int64)
+        self._rows = {}                        # content hash -> (term ids, counts)
+        self._refs = {}                        # content hash -> tracked files with that content
+        self._docs = {}                        # path -> content hash
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, path: str, key: str, text: str):
+        """Index (or re-index) a tracked file's text."""
+        row = self._rows.get(key)
+        if row is None:
+            row = self._row(text)
+        with self._lock:
+            self._drop(path)
+            self._rows.setdefault(key, row)
+            self._refs[key] = self._refs.get(key, 0) + 1
+            self._docs[path] = key
+            self._df[self._rows[key][0]] += 1
+
+    def remove(self, path: str):
+        with self._lock:
+            self._drop(path)
+
+    def rename(self, old_path: str, new_path: str):
+        with self._lock:
+            key = self._docs.pop(old_path, None)
+            if key is not None:
+                self._docs[new_path] = key
+
+    def clear(self):
+        with self._lock:
+            self._vocab, self._terms = {}, []
+            self._df = np.zeros(1024, dtype=np.int64)
+            self._rows, self._refs, self._docs = {}, {}, {}
+
+    def top_terms(self, clusters: dict, n: int = 3) -> dict:
+        """
+        { cluster id: its n highest-scoring terms } for clusters given as
+        { cluster id: [member content hashes] }. Members not in the index
+        are ignored; a cluster with none gets [].
+        """
+        from scipy import sparse
+
+        with self._lock:
+            ids, members = [], []
+            for cid, keys in clusters.items():
+                rows = [self._rows[k] for k in keys if k in self._rows]
+                ids.append(cid)
+                members.append(rows)
+            n_docs = len(self._docs)
+            n_terms = len(self._terms)
+            # Smoothed idf, as TfidfVectorizer: ln((1 + n) / (1 + df)) + 1
+            idf = np.log((1 + n_docs) / (1 + self._df[:n_terms])) + 1.0
+            terms = self._terms
+
+        lengths = [len(r[0]) for rows in members for r in rows]
+        if not lengths or n_terms == 0:
+            return {cid: [] for cid in ids}
+        col = np.concatenate([r[0] for rows in members for r in rows])
+        tf = np.concatenate([r[1] for rows in members for r in rows]).astype(np.float64)
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        X = sparse.csr_matrix((tf * idf[col], col, indptr), shape=(len(lengths), n_terms))
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+        X = sparse.diags(1.0 / np.maximum(norms, 1e-12)) @ X
+
+        # Cluster-membership matrix: one product sums every cluster's rows at once
+        owner = np.repeat(np.arange(len(ids)), [len(rows) for rows in members])
+        A = sparse.csr_matrix((np.ones(len(owner)), (owner, np.arange(len(owner)))), shape=(len(ids), len(owner)))
+        sums = (A @ X).tocsr()
+
+        result = {}
+        for i, cid in enumerate(ids):
+            start, end = sums.indptr[i], sums.indptr[i + 1]
+            data, cols = sums.data[start:end], sums.indices[start:end]
+            top = np.argsort(-data, kind="stable")[:n]
+            result[cid] = [terms[cols[j]] for j in top if data[j] > 0]
+        return result
+
+    # ── Internals ────────────────────────────────────────────────
+    def _row(self, text: str):
+        """(term ids, counts) of a document's most frequent terms, registering new terms."""
+        counts = term_counts(text).most_common(self.terms_per_doc)
+        with self._lock:
+            ids = np.empty(len(counts), dtype=np.int64)
+            for j, (term, _) in enumerate(counts):
+                tid = self._vocab.get(term)
+                if tid is None:
+                    tid = len(self._terms)
+                    self._vocab[term] = tid
+                    self._terms.append(term)
+                    if tid >= len(self._df):
+                        self._df = np.concatenate([self._df, np.zeros(len(self._df), dtype=np.int64)])
+                ids[j] = tid
+        return ids, np.array([c for _, c in counts], dtype=np.int32)
+
+    def _drop(self, path: str):
+        key = self._docs.pop(path, None)
+        if key is None:
+            return
+        self._df[self._rows[key][0]] -= 1
+        self._refs[key] -= 1
+        if self._refs[key] == 0:
+            del self._refs[key], self._rows[key]
@@ -0,0 +1,247 @@
+import os
+import threading
+import numpy as np
+
+# From this many files, queries go through an HNSW graph (needs hnswlib) instead of exact search
+ANN_MIN_FILES = int(os.getenv("SEFS_ANN_MIN_FILES", "50000"))
+_BLOCK_ROWS = 16384  # rows of the embedding matrix scored per matmul
+_GRAPH_BUDGET = 64 << 20  # bytes of (rows x files) similarity scores knn_graph holds at once
+
+
+def top_k(scores: np.ndarray, k: int):
+    """Indices + values of the k largest entries per row, best first (argpartition, not a full sort)."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.zeros((len(scores), 0), dtype=np.int64), np.zeros((len(scores), 0), dtype=scores.dtype)
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    vals = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-vals, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+
+class VectorIndex:
+    """
+    k-nearest-neighbour search (cosine) over an EmbeddingStore.
+
+    - Small corpora: exact search, a blocked matmul against the resident
+      matrix with argpartition top-k per block. Nothing extra to maintain.
+    - From ANN_MIN_FILES files, if hnswlib is installed: an HNSW graph
+      built once from a copy of the matrix on a background thread (queries
+      stay exact until it's ready), then kept current by add/remove/rename
+      as files come and go. Changes made during the build are logged and
+      replayed onto the graph before it's swapped in.
+
+    Results are [(path, similarity)], best first.
+    """
+
+    def __init__(self, store, ann_min_files: int = ANN_MIN_FILES):
+        self.store = store
+        self.ann_min_files = ann_min_files
+        self._ann = None          # hnswlib.Index, once built
+        self._ann_failed = False  # hnswlib missing or build failed — stay exact
+        self._ids = {}            # path -> HNSW label
+        self._paths = {}          # HNSW label -> path
+        self._next_id = 0
+        self._pending = None      # [(op, *paths)] logged while a build runs, else None
+        self._generation = 0      # bumped by reset() so an outdated build is discarded
+        self._lock = threading.RLock()
+
+    # ── Maintenance (called alongside the store's own updates) ───
+    def add(self, path: str):
+        """Index (or re-index) a path's current embedding."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("add", path))
+            if self._ann is None:
+                return
+            vec = self.store.get(path)
+            if vec is None:
+                return
+            self._drop(path)
+            if self._next_id >= self._ann.get_max_elements():
+                self._ann.resize_index(max(2 * self._ann.get_max_elements(), 1024))
+            label = self._next_id
+            self._next_id += 1
+            self._ann.add_items(np.asarray(vec, dtype=np.float32)[None], [label])
+            self._ids[path] = label
+            self._paths[label] = path
+
+    def remove(self, path: str):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("remove", path))
+            if self._ann is not None:
+                self._drop(path)
+
+    def rename(self, old_path: str, new_path: str):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("rename", old_path, new_path))
+            label = self._ids.pop(old_path, None)
+            if label is not None:
+                self._ids[new_path] = label
+                self._paths[label] = new_path
+
+    def reset(self):
+        with self._lock:
+            self._ann = None
+            self._ids, self._paths, self._next_id = {}, {}, 0
+            self._pending = None
+            self._generation += 1
+
+    def _drop(self, path: str):
+        label = self._ids.pop(path, None)
+        if label is not None:
+            self._paths.pop(label, None)
+            self._ann.mark_deleted(label)
+
+    # ── Queries ──────────────────────────────────────────────────
+    def search(self, vectors, k: int = 10, exclude=None) -> list:
+        """
+        Top-k neighbours for each query vector: a list (one per query) of
+        [(path, similarity)]. `exclude` is a set of paths to leave out.
+        """
+        Q = np.asarray(vectors, dtype=np.float32).reshape(-1, self.store.dim)
+        exclude = exclude or set()
+        if self._use_ann():
+            return self._search_ann(Q, k, exclude)
+        return self._search_exact(Q, k, exclude)
+
+    def neighbors(self, path: str, k: int = 10) -> list:
+        """Files most similar to an indexed file (itself excluded)."""
+        vec = self.store.get(path)
+        if vec is None:
+            return []
+        return self.search(np.array(vec, dtype=np.float32), k, exclude={path})[0]
+
+    def knn_graph(self, k: int = 10, rows=None):
+        """
+        (paths, neighbours, similarities) for every file: row i holds the row
+        indices (into paths) and similarities of its k nearest other files,
+        best first. With `rows` (matrix row numbers), only those files are
+        in the graph and neighbours are found among them. Missing neighbours
+        (HNSW can return fewer) are -1 with similarity -inf.
+
+        HNSW is used when the graph has ANN_MIN_FILES+ files; a smaller
+        subset is searched exactly among itself, since most of its members'
+        global neighbours would be non-members.
+        """
+        with self.store.reading():
+            paths, M = self.store.matrix()
+            if rows is None:
+                M = np.asarray(M, dtype=np.float32)
+            else:
+                M = np.asarray(M[np.asarray(rows)], dtype=np.float32)
+                paths = [paths[r] for r in rows]
+        row_of = {p: i for i, p in enumerate(paths)}
+        n = len(paths)
+        k = min(k, n - 1)
+        if k <= 0:
+            return paths, np.zeros((n, 0), dtype=np.int64), np.zeros((n, 0), dtype=np.float32)
+
+        idx = np.full((n, k), -1, dtype=np.int64)
+        sims = np.full((n, k), -np.inf, dtype=np.float32)
+        if n >= self.ann_min_files and self._use_ann():
+            # A subset's neighbours are mixed with other files' in the graph: ask for
+            # enough that ~k members survive if members were spread evenly (twice that)
+            total = len(self.store)
+            want = k + 1 if rows is None else min(total, 2 * (k + 1) * total // n)
+            results = self._search_ann(M, want, set())
+            for i, hits in enumerate(results):
+                hits = [(row_of[p], s) for p, s in hits if p in row_of and row_of[p] != i][:k]
+                for j, (r, s) in enumerate(hits):
+                    idx[i, j], sims[i, j] = r, s
+            return paths, idx, sims
+
+        block_rows = max(1, min(_BLOCK_ROWS, _GRAPH_BUDGET // (4 * n)))
+        for start in range(0, n, block_rows):
+            block = M[start:start + block_rows] @ M.T
+            block[np.arange(len(block)), np.arange(start, start + len(block))] = -np.inf
+            idx[start:start + len(block)], sims[start:start + len(block)] = top_k(block, k)
+        return paths, idx, sims
+
+    def _search_exact(self, Q, k, exclude):
+        with self.store.reading():
+            paths, M = self.store.matrix()
+            n = len(paths)
+            skip = [i for i, p in enumerate(paths) if p in exclude] if exclude else []
+            best_idx = np.zeros((len(Q), 0), dtype=np.int64)
+            best_sim = np.zeros((len(Q), 0), dtype=np.float32)
+            for start in range(0, n, _BLOCK_ROWS):
+                block = np.asarray(M[start:start + _BLOCK_ROWS], dtype=np.float32)
+                scores = Q @ block.T
+                for i in skip:
+                    if start <= i < start + len(block):
+                        scores[:, i - start] = -np.inf
+                idx, sim = top_k(scores, k)
+                # Merge this block's winners with the running top-k
+                cand_idx = np.concatenate([best_idx, idx + start], axis=1)
+                cand_sim = np.concatenate([best_sim, sim], axis=1)
+                keep, best_sim = top_k(cand_sim, k)
+                best_idx = np.take_along_axis(cand_idx, keep, axis=1)
+        return [[(paths[i], float(s)) for i, s in zip(row_i, row_s) if np.isfinite(s)]
+                for row_i, row_s in zip(best_idx, best_sim)]
+
+    def _search_ann(self, Q, k, exclude):
+        with self._lock:
+            live = len(self._ids)
+            if live == 0:
+                return [[] for _ in range(len(Q))]
+            want = min(k + len(exclude), live)
+            self._ann.set_ef(max(64, 2 * want))
+            labels, distances = self._ann.knn_query(Q, k=want)
+            results = []
+            for row_l, row_d in zip(labels, distances):
+                hits = [(self._paths[l], float(1.0 - d)) for l, d in zip(row_l, row_d)
+                        if l in self._paths and self._paths[l] not in exclude]
+                results.append(hits[:k])
+            return results
+
+    def _use_ann(self) -> bool:
+        """True once the HNSW graph is ready; the first call past ANN_MIN_FILES starts building it."""
+        if self._ann is not None:
+            return True
+        if self._ann_failed or len(self.store) < self.ann_min_files:
+            return False
+        with self._lock:
+            if self._ann is None and self._pending is None and not self._ann_failed:
+                self._pending = []
+                threading.Thread(target=self._build_ann, args=(self._generation,), daemon=True).start()
+        return self._ann is not None
+
+    def _build_ann(self, generation: int):
+        """Build the graph off the request path, then swap it in (see _use_ann)."""
+        try:
+            import hnswlib
+        except ImportError:
+            print("[INDEX] hnswlib not installed — using exact search")
+            with self._lock:
+                self._ann_failed = True
+                self._pending = None
+            return
+        try:
+            with self.store.reading():
+                paths, M = self.store.matrix()
+                M = np.array(M, dtype=np.float32)  # a copy: the store may change under the build
+            index = hnswlib.Index(space="cosine", dim=self.store.dim)
+            index.init_index(max_elements=max(2 * len(paths), 1024), ef_construction=200, M=16)
+            index.add_items(M, np.arange(len(paths)))
+        except Exception as e:
+            print(f"[INDEX] HNSW build failed — using exact search: {e}")
+            with self._lock:
+                if generation == self._generation:
+                    self._ann_failed = True
+                    self._pending = None
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                return  # reset() while building
+            pending, self._pending = self._pending, None
+            self._ann = index
+            self._ids = {p: i for i, p in enumerate(paths)}
+            self._paths = dict(enumerate(paths))
+            self._next_id = len(paths)
+            for op, *args in pending:
+                getattr(self, op)(*args)
+        print(f"[INDEX] Built HNSW index over {len(paths)} files ({len(pending)} changes replayed)")
@@ -72,6 +72,8 @@ export default function Dashboard() {
   // Helper for stats
   const totalWords = graphData.nodes
     .reduce((sum, n) => sum + (n.word_count || 0), 0);
+  // Long files are only read up to the extraction budget, so their counts are lower bounds
+  const wordsSampled = graphData.nodes.some((n) => n.sampled);
 
   const formatNumber = (num) => {
     if (num >= 1000000) return (num / 1000000).toFixed(1) + 'M';
@@ -210,7 +212,7 @@ export default function Dashboard() {
 
                 <div className="border-2 border-primary p-6 hover:bg-slate-50 transition-colors">
                     <div className="text-xs font-bold uppercase tracking-widest opacity-60 mb-2">Total Words</div>
-                    <div className="text-5xl font-black tracking-tighter mb-4">{formatNumber(totalWords)}</div>
+                    <div className="text-5xl font-black tracking-tighter mb-4">{wordsSampled ? '≥ ' : ''}{formatNumber(totalWords)}</div>
                     <div className="text-[10px] font-mono opacity-50 mt-4 text-right">
                         AVG: {graphData.nodes.length > 0 ? (totalWords / graphData.nodes.length).toFixed(0) : 0} / FILE
                     </div>
@@ -58,6 +58,7 @@ export default function Graph2D({ graphState }) {
       color: getColor(f.cluster ?? f.cluster_id ?? 0),
       type: 'file',
       words: f.words ?? f.word_count ?? 0,
+      sampled: f.sampled ?? false,
       keywords: f.keywords ?? [],
       snippet: f.snippet ?? '',
       clusterName: f.cluster_name ?? '',
@@ -319,7 +320,7 @@ export default function Graph2D({ graphState }) {
 
             {/* Metadata row */}
             <div style={{ fontSize: 11, color: '#9ca3af', marginBottom: 8, display: 'flex', gap: 8, flexWrap: 'wrap' }}>
-              {tooltipNode.words > 0 && <span>📝 {tooltipNode.words.toLocaleString()} words</span>}
+              {tooltipNode.words > 0 && <span title={tooltipNode.sampled ? 'Counted on the extracted sample of a long file' : undefined}>📝 {tooltipNode.sampled ? '≥ ' : ''}{tooltipNode.words.toLocaleString()} words</span>}
               {tooltipNode.clusterName && <span>📁 {tooltipNode.clusterName}</span>}
             </div>
 
@@ -54,6 +54,20 @@ export function useWebSocket(url) {
               clusters_map: data.clusters_map || {},
               total_files: data.total_files || 0,
             });
+          } else if (data.type === 'files_update') {
+            // Incremental placement: replace only the nodes that changed
+            setGraphData(prev => {
+              const updated = data.files || [];
+              const changed = new Set([...(data.removed || []), ...updated.map(f => f.id)]);
+              const files = [...prev.files.filter(f => !changed.has(f.id)), ...updated];
+              return {
+                nodes: files,
+                files,
+                clusters: data.clusters || prev.clusters,
+                clusters_map: data.clusters_map || prev.clusters_map,
+                total_files: data.total_files ?? files.length,
+              };
+            });
           } else if (data.type === 'activity_log') {
             setLogs(data.logs || []);
           } else if (data.type === 'activity_log_entry') {